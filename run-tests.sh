@@ -66,7 +66,7 @@ COVERAGE="$(which ${default_coverage})"
   }
 
 [ -d "tests/tmp" ] && rm -rf tests/tmp
-SOURCES="$(echo ${PACKAGE_PATH}/${MODULE}/{__init__,contexts/{inthrowabletempdir,iocapture,backupeditandrestore}}.py | tr \  ,)"
+SOURCES="$(echo ${PACKAGE_PATH}/${MODULE}/{__init__,commands,transports,keyindex,keypool,load,contexts/{inthrowabletempdir,iocapture,backupeditandrestore,logcapture}}.py | tr \  ,)"
 cat > "${COVERAGERC}" <<EOF
 [run]
 branch = True
@@ -55,6 +55,7 @@ with opent('./README.rst', 'r') as README:
             },
         'packages': [
             'ssh_harness',
+            'ssh_harness.benchmarks',
             'ssh_harness.contexts',
             ],
         'license': 'GNU GPLv2.0',
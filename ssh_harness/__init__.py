@@ -28,10 +28,18 @@ import sys
 import traceback
 import time
 import pwd
+import shutil
 import warnings
 from locale import getpreferredencoding
 
-from .contexts import BackupEditAndRestore
+from .commands import (
+    DEVNULL, PIPE, CommandStream, CommandTimeoutError, run_batch,
+    _frame_commands, _shell_join, _split_framed, )
+from .contexts import BackupEditAndRestore, SnapshotAndRestore
+from .keyindex import HELPER_PATH, KeyIndex, KeyIndexServer
+from .keypool import KeyPairPool
+from .load import run_load
+from .transports import HAVE_PARAMIKO, SessionProbe, TransportPool
 
 __ALL__ = [
     'PubKeyAuthSshClientTestCase',
@@ -239,6 +247,9 @@ class BaseSshClientTestCase(TestCase):
       is ``/usr/bin/ssh-keygen``
     - ``SSH_KEYSCAN_BIN``: set the path to ``ssh-keyscan``. The default path
       is ``/usr/bin/ssh-keyscan``.
+    - ``SSH_BIN``: set the path to the ``ssh`` client used by the helpers
+      that run commands on the test server (e.g.
+      :py:meth:`runRemoteCommands`). The default path is ``/usr/bin/ssh``.
 
     ===Authorized keys options===
 
@@ -262,6 +273,144 @@ class BaseSshClientTestCase(TestCase):
     disabled in SSHD configuration. Adding one or more key/value pairs to the
     dictionnary implicitly enables their use.
 
+    ===User files===
+
+    The files edited in the user's ``~/.ssh`` directory (``config``,
+    ``known_hosts`` and ``environment``) are each backed-up before being
+    edited and restored once the test-case is done. Setting the
+    ``SNAPSHOT_SSH_DIR`` class attribute to ``True`` instead snapshots the
+    whole directory once (with reflinks where the file-system supports them,
+    copies otherwise) and restores it with a single directory swap, sparing
+    the per-file back-up copies. A snapshot left behind by an interrupted run
+    is restored by the next one.
+
+    ===Certificates===
+
+    Setting the ``USE_CERTIFICATES`` class attribute to ``True`` makes the
+    test-case generate a certificate authority (CA) key, with which the host
+    keys and the user key are signed. The daemon presents its host
+    certificates (``HostCertificate``) and trusts the user certificates signed
+    by the CA (``TrustedUserCAKeys``), while a single ``@cert-authority`` line
+    is added to the user's ``known_hosts`` file (instead of the scanned host
+    keys). Additional user keys can then be granted access with
+    :py:meth:`signUserKey`, without editing any file nor restarting the
+    daemon.
+
+    ===Key index===
+
+    Setting the ``USE_KEY_INDEX`` class attribute to ``True`` makes the
+    daemon also look authorized keys up in an in-memory index owned by the
+    test-case (through its ``AuthorizedKeysCommand`` option). Keys can then
+    be added and removed while the daemon runs, with
+    :py:meth:`authorizeKey` and :py:meth:`revokeKey`, which is much cheaper
+    than rewriting the ``authorized_keys`` file (that :program:`sshd` scans
+    linearly).
+
+    The daemon requires the ``AuthorizedKeysCommand`` program to be owned by
+    root: it is the Python interpreter set by the
+    ``AUTHORIZED_KEYS_COMMAND_PYTHON`` class attribute (``sys.executable``
+    by default, change it, e.g. to ``/usr/bin/python3``, if you run your
+    tests from a virtualenv).
+
+    ===Key pair pool===
+
+    Tests that need fresh key pairs of their own (e.g. to test key rotation
+    or revocation) can draw them from a pool kept filled by a background
+    thread, with :py:meth:`drawKeyPair`, instead of running
+    :man:`ssh-keygen` themselves. The ``KEY_PAIR_POOL`` class attribute maps
+    the types of the keys to keep ready to their number, e.g.
+    ``{'ecdsa': 8}``. Drawn keys are deleted, along with the rest of the
+    pool, once the test-case is done.
+
+    ===Many identities===
+
+    Load tests can give the test server many distinct keys to deal with,
+    using :py:meth:`provisionIdentities`: it generates any number of key
+    pairs (concurrently) and authorizes them all at once, possibly with
+    options of their own. With ``USE_KEY_INDEX`` the keys go to the key
+    index, which keeps looking them up cheap even with thousands of them.
+
+    ===SSH agent===
+
+    Setting the ``USE_SSH_AGENT`` class attribute to ``True`` makes the
+    test-case start a dedicated :man:`ssh-agent` (listening to the
+    ``agent.sock`` socket in ``SSH_BASEDIR``), loaded with the generated user
+    key(s). The commands run by the test-case see it through the
+    ``SSH_AUTH_SOCK`` environment variable, thus the ssh clients they start
+    get the key from the agent instead of each loading and parsing it. The
+    agent is killed once the test-case is done. ``SSH_AGENT_BIN`` and
+    ``SSH_ADD_BIN`` set the paths to :man:`ssh-agent` and :man:`ssh-add`.
+
+    ===Remote commands===
+
+    :py:meth:`runRemoteCommand` and :py:meth:`runRemoteCommands` run commands
+    on the test server. How they connect is set by the ``REMOTE_BACKEND``
+    class attribute:
+
+    - ``'ssh'`` (the default): each call runs the ssh client (see
+      ``SSH_BIN``);
+    - ``'paramiko'``: commands are run over channels of a pool of (at most
+      ``REMOTE_POOL_SIZE``) transports kept open by the test-case, which
+      spares a process and a handshake per command. This requires the
+      :py:mod:`paramiko` module, test-cases are skipped when it is missing.
+
+    ===Load===
+
+    :py:meth:`runLoad` opens connections to the test server at a given rate
+    or concurrency, each running a command, and reports the latencies of the
+    connections (see :py:mod:`ssh_harness.load`). The connections are made
+    by the ``REMOTE_BACKEND``: the ``'ssh'`` one only measures whole
+    connections, the ``'paramiko'`` one also times their connection (up to
+    the key exchange), authentication and command phases.
+
+    ===Load profile===
+
+    Under a heavy load the test daemon would drop connections at its
+    default limits (``MaxStartups 10:30:100``), making the harness look like
+    the bottleneck. Setting the ``LOAD_PROFILE`` class attribute to the
+    number of connections you expect at once scales the daemon limits on
+    unauthenticated connections to it. The limits can also be set one by
+    one, with the ``MAX_STARTUPS``, ``LOGIN_GRACE_TIME``,
+    ``CLIENT_ALIVE_INTERVAL`` and ``CLIENT_ALIVE_COUNT_MAX`` class
+    attributes (which take precedence over the profile). Those left to
+    `None` keep the OpenSSH defaults.
+
+    ``MAX_SESSIONS`` is not part of the profile: it limits the sessions
+    multiplexed over a *single* connection (e.g. by the ``'paramiko'``
+    backend, or ssh connection sharing), not the number of connections.
+
+    ===Daemon profiles===
+
+    The ``SSHD_PROFILE`` class attribute selects a set of daemon settings by
+    name. The only one for now is ``'fast'``: it pins cheap algorithms (the
+    curve25519 key exchange, an ed25519 host key, the chacha20-poly1305 and
+    AES-GCM ciphers), which the ssh clients run by the test-case are also
+    told to use, and turns off what tests do not use (X11 forwarding, TCP
+    keep-alive messages, verbose logging). See
+    :py:mod:`ssh_harness.benchmarks.handshake` for its effect on the time
+    it takes to connect.
+
+    ===SFTP===
+
+    The test daemon has no ``sftp`` subsystem, unless the ``SFTP_SUBSYSTEM``
+    class attribute is set to the command that implements it, e.g.
+    ``'internal-sftp'`` or ``'/usr/lib/openssh/sftp-server'``.
+
+    ===Commands===
+
+    ``COMMAND_TIMEOUT`` sets the number of seconds the commands run with
+    :py:meth:`runCommand` (and its variants) are given to terminate. It
+    defaults to `None` (no timeout), and can be overridden on a per-call basis
+    with the `timeout` argument of those methods. A command that times out is
+    killed along with its process group, and
+    :py:class:`~ssh_harness.commands.CommandTimeoutError` is raised, carrying
+    the output collected until then.
+
+    ``CHILD_ENVIRONMENT`` is a dictionary of environment variables to set (or
+    to unset, when their value is `None`) for those commands. The resulting
+    environment is built once, when first needed, and re-used; otherwise
+    commands just inherit the environment of the test runner.
+
 
     ===Some notes about SSHD configuration===
 
@@ -320,10 +469,34 @@ class BaseSshClientTestCase(TestCase):
     SSHD_BIN = '/usr/sbin/sshd'
     SSH_KEYSCAN_BIN = '/usr/bin/ssh-keyscan'
     SSH_KEYGEN_BIN = '/usr/bin/ssh-keygen'
+    SSH_BIN = '/usr/bin/ssh'
+    SCP_BIN = '/usr/bin/scp'
+    SFTP_BIN = '/usr/bin/sftp'
+    SSH_AGENT_BIN = '/usr/bin/ssh-agent'
+    SSH_ADD_BIN = '/usr/bin/ssh-add'
+    USE_SSH_AGENT = False
+    USE_CERTIFICATES = False
+    USE_KEY_INDEX = False
+    KEY_PAIR_POOL = None
+    AUTHORIZED_KEYS_COMMAND_PYTHON = sys.executable
+    CERTIFICATE_VALIDITY = '-5m:+1d'
+    REMOTE_BACKEND = 'ssh'
+    REMOTE_POOL_SIZE = 4
     SSH_CONFIG_HOST_NAME = 'test-harness'
     SSH_ENVIRONMENT = {}
     SSH_ENVIRONMENT_FILE = False
     UPDATE_SSH_CONFIG = True
+    SNAPSHOT_SSH_DIR = False
+    COMMAND_TIMEOUT = None
+    CHILD_ENVIRONMENT = {}
+    LOAD_PROFILE = None
+    SSHD_PROFILE = None
+    SFTP_SUBSYSTEM = None
+    MAX_STARTUPS = None
+    MAX_SESSIONS = None
+    LOGIN_GRACE_TIME = 120
+    CLIENT_ALIVE_INTERVAL = None
+    CLIENT_ALIVE_COUNT_MAX = None
 
     AUTHORIZED_KEY_OPTIONS = None
 
@@ -337,6 +510,7 @@ class BaseSshClientTestCase(TestCase):
         'HOST_DSA_KEY': 'host_ssh_dsa_key',
         'HOST_RSA_KEY': 'host_ssh_rsa_key',
         'USER_RSA_KEY': 'id_rsa',
+        'CA_ECDSA_KEY': 'ca_ecdsa_key',
         'AUTHORIZED_KEYS': 'authorized_keys',
         'SSHD_CONFIG': 'sshd_config',
         'SSHD_PIDFILE': 'sshd.pid',
@@ -364,6 +538,7 @@ class BaseSshClientTestCase(TestCase):
         'dsa': '1024',
         'rsa': '768',
         'ecdsa': '256',
+        'ed25519': '256',
         }
     """The sizes of the key to ask with respect to their type (we purposely
     request the weakest key sizes possible to not slow the test cases too
@@ -382,6 +557,14 @@ class BaseSshClientTestCase(TestCase):
     _SSH_CONFIG_PATH = expanduser_nohome('~/.ssh/config')
     _SSHD = None
     """Handle on the SSH daemon process."""
+    _child_environment = None
+    _transport_pool = None
+    _SSH_AGENT = None
+    _key_index = None
+    _key_index_server = None
+    _key_pair_pool = None
+    _identities = None
+    _SSH_AGENT_SOCKET = None
 
     _SSHD_CONFIG = '''# ssh_harness generated configuration file
 Port {port}
@@ -390,6 +573,7 @@ Protocol 2
 HostKey {host_rsa_key_path}
 HostKey {host_dsa_key_path}
 HostKey {host_ecdsa_key_path}
+{profile_config}\
 #Privilege Separation is turned on for security (useful when run as non-root ?)
 UsePrivilegeSeparation yes
 
@@ -397,16 +581,19 @@ KeyRegenerationInterval 3600
 ServerKeyBits 1024
 
 SyslogFacility AUTH
-LogLevel VERBOSE
+LogLevel {log_level}
 
 PidFile {sshd_pidfile_path}
-LoginGraceTime 120
+LoginGraceTime {login_grace_time}
+{load_config}\
 PermitRootLogin yes
 StrictModes yes
 
 RSAAuthentication yes
 PubkeyAuthentication {pubkey_auth}
 AuthorizedKeysFile	{authorized_keys_path}
+{certificates_config}\
+{authorized_keys_command_config}\
 PermitUserEnvironment {permit_environment}
 
 IgnoreRhosts yes
@@ -419,20 +606,47 @@ PasswordAuthentication {password_auth}
 
 GSSAPIAuthentication no
 
-X11Forwarding yes
+X11Forwarding {x11_forwarding}
 X11DisplayOffset 10
 PrintMotd no
 PrintLastLog no
-TCPKeepAlive yes
+TCPKeepAlive {tcp_keep_alive}
 Banner none
 AcceptEnv LANG LC_*
 
-# Subsystem sftp /usr/lib/openssh/sftp-server
+{sftp_config}\
 # *DO NOT* use: may prevent SSHD from opening a session.
 UsePAM no
 '''
     _context_name = 'ssh_harness'
 
+    _SSHD_PROFILES = {
+        'fast': {
+            'host_key': 'ed25519',
+            'algorithms': [
+                ('KexAlgorithms',
+                 'curve25519-sha256,curve25519-sha256@libssh.org', ),
+                ('HostKeyAlgorithms', 'ssh-ed25519', ),
+                ('Ciphers',
+                 'chacha20-poly1305@openssh.com,aes128-gcm@openssh.com,'
+                 'aes256-gcm@openssh.com', ),
+                # Only used by ciphers that are not AEAD ones.
+                ('MACs', 'hmac-sha2-256-etm@openssh.com', ),
+                ],
+            'settings': {
+                'log_level': 'ERROR',
+                'x11_forwarding': 'no',
+                'tcp_keep_alive': 'no',
+                },
+            },
+        }
+    """Daemon settings selected with ``SSHD_PROFILE``.
+
+    - ``host_key``: the type of an additional host key;
+    - ``algorithms``: algorithms that both the daemon and the clients use;
+    - ``settings``: values of the placeholders of ``_SSHD_CONFIG``.
+    """
+
     @classmethod
     def _skip(cls):
         logger.debug('BaseSshClientTestCase._skip() called:')
@@ -453,7 +667,9 @@ UsePAM no
 
     @classmethod
     def _guess_key_type(cls, name):
-        if 'ECDSA' in name:
+        if 'ED25519' in name:
+            return 'ed25519'
+        elif 'ECDSA' in name:
             return 'ecdsa'
         elif 'DSA' in name:
             return 'dsa'
@@ -571,29 +787,318 @@ UsePAM no
     @classmethod
     def _generate_keys(cls):
         # Generate the required keys.
-        for f in [x for x in cls._FILES.keys() if(x.startswith('HOST_')
-                                                  or x.startswith('USER_'))]:
+        key_files = []
+        cmds = []
+        prefixes = ('HOST_', 'USER_', )
+        if cls.USE_CERTIFICATES is True:
+            prefixes += ('CA_', )
+        for f in [x for x in cls._files().keys() if x.startswith(prefixes)]:
             key_type = cls._guess_key_type(f)
             key_file = getattr(cls, '{}_PATH'.format(f))
 
             if os.path.isfile(key_file):
                 os.unlink(key_file)
-            returncode, out, err = cls.runCommand([
-                cls.SSH_KEYGEN_BIN,
-                '-t', key_type,
-                '-b', cls._BITS[key_type],
-                '-N', '', '-f', key_file,
-                '-C',
-                'Weak key generated for test purposes only '
-                '*DO NOT DISSEMINATE*'
-                ])
+            key_files.append(key_file)
+            cmds.append(cls._keygen_command(key_type, key_file))
 
-            if 0 != returncode:
-                raise RuntimeError('ssh-keygen failed with exit-status {} '
-                                   'output:\n==STDOUT==\n{}\n==STDERR==\n{}'
-                                   .format(returncode, out, err))
+        results = cls.runCommands(cmds, fail_fast=True)
+        for key_file, result in zip(key_files, results):
+            if result is None:
+                continue  # Cancelled, another key generation failed.
+            cls._check_keygen(key_file, result[0])
+
+    @classmethod
+    def _keygen_command(cls, key_type, path):
+        return [
+            cls.SSH_KEYGEN_BIN,
+            '-t', key_type,
+            '-b', cls._BITS[key_type],
+            '-N', '', '-f', path,
+            '-C',
+            'Weak key generated for test purposes only '
+            '*DO NOT DISSEMINATE*'
+            ]
+
+    @classmethod
+    def _check_keygen(cls, path, result, chmod=True):
+        """Raises if the :program:`ssh-keygen` run which `result` is
+        failed, otherwise restricts the access to the private key `path`
+        (unless `chmod` is `False`, e.g. for certificates)."""
+        returncode, out, err = result
+        if 0 != returncode:
+            raise RuntimeError('ssh-keygen failed with exit-status {} '
+                               'output:\n==STDOUT==\n{}\n==STDERR==\n{}'
+                               .format(returncode, out, err))
+        elif chmod is True:
+            os.chmod(path, cls._KEY_FILES_MODE)
+
+    @classmethod
+    def _generate_key_pair(cls, key_type, path):
+        cls._check_keygen(path, cls.runCommand(
+            cls._keygen_command(key_type, path)))
+
+    @classmethod
+    def _start_key_pair_pool(cls):
+        if not cls.KEY_PAIR_POOL:
+            return
+        cls._key_pair_pool = KeyPairPool(
+            os.path.join(cls.SSH_BASEDIR, 'keypool'), cls._generate_key_pair,
+            cls.KEY_PAIR_POOL)
+        cls._key_pair_pool.start()
+
+    @classmethod
+    def _stop_key_pair_pool(cls):
+        if cls._key_pair_pool is not None:
+            cls._key_pair_pool.close()
+        cls._key_pair_pool = None
+
+    @classmethod
+    def drawKeyPair(cls, key_type='ecdsa', timeout=None):
+        """Returns a fresh key pair from the pool (see ``KEY_PAIR_POOL``).
+
+        :param str key_type: the type of key wanted.
+        :param float timeout: how long to wait for a key pair, when none is
+            ready (defaults to ``COMMAND_TIMEOUT``).
+
+        :returns: the path to the private key, the public key is next to it,
+            with a ``.pub`` suffix.
+        """
+        if cls._key_pair_pool is None:
+            raise RuntimeError(_('KEY_PAIR_POOL is not set'))
+        return cls._key_pair_pool.draw(key_type, cls._timeout(timeout))
+
+    @classmethod
+    def provisionIdentities(cls, count, key_type='ecdsa', options=None,
+                            max_workers=None):
+        """Generates `count` key pairs, and authorizes them on the test
+        server (for the current user).
+
+        :param str key_type: the type of the keys to generate.
+        :param options: the ``authorized_keys`` options of the keys. Either
+            a string, shared by all the identities, or a callable given the
+            number of an identity that returns its options (or `None`).
+        :param int max_workers: how many :man:`ssh-keygen` to run at once
+            (defaults to the number of CPUs).
+
+        :returns: the list of the paths to the private keys, indexed by
+            identity number (the public keys are next to them, with a
+            ``.pub`` suffix).
+
+        Identities are numbered from 0 on, each call numbering its own from
+        where the previous one stopped. They are deleted once the test-case
+        is done.
+        """
+        if cls._identities is None:
+            cls._identities = []
+        directory = os.path.join(cls.SSH_BASEDIR, 'identities')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        first = len(cls._identities)
+        paths = [os.path.join(directory, 'id_{}'.format(x))
+                 for x in range(first, first + count)]
+
+        results = cls.runCommands(
+            [cls._keygen_command(key_type, x) for x in paths],
+            max_workers=max_workers, fail_fast=True)
+        for path, result in zip(paths, results):
+            if result is not None:
+                cls._check_keygen(path, result[0])
+
+        lines = []
+        for number, path in enumerate(paths, first):
+            key_options = options(number) if callable(options) else options
+            with open('{}.pub'.format(path), 'r') as f:
+                key = f.read().strip()
+            if cls._key_index is not None:
+                cls.authorizeKey(key, options=key_options)
+            elif key_options is None:
+                lines.append('{}\n'.format(key))
             else:
-                os.chmod(key_file, cls._KEY_FILES_MODE)
+                lines.append('{} {}\n'.format(key_options, key))
+        if lines:
+            with open(cls.AUTHORIZED_KEYS_PATH, 'at') as authzd_file:
+                authzd_file.write(''.join(lines))
+
+        cls._identities.extend(paths)
+        return paths
+
+    @classmethod
+    def _delete_identities(cls):
+        if cls._identities is not None:
+            shutil.rmtree(os.path.join(cls.SSH_BASEDIR, 'identities'), True)
+        cls._identities = None
+
+    @classmethod
+    def _sign_key_command(cls, path, identity, principals, host=False,
+                          validity=None, options=None):
+        cmd = [cls.SSH_KEYGEN_BIN,
+               '-s', cls.CA_ECDSA_KEY_PATH,
+               '-I', identity,
+               '-n', ','.join(principals),
+               '-V', validity or cls.CERTIFICATE_VALIDITY, ]
+        if host is True:
+            cmd.append('-h')
+        for option in options or []:
+            cmd.extend(['-O', option])
+        cmd.append(path)
+        return cmd
+
+    @classmethod
+    def _host_principals(cls):
+        principals = [cls.BIND_ADDRESS]
+        for name in ('localhost', '127.0.0.1', '::1', ):
+            if name not in principals:
+                principals.append(name)
+        return principals
+
+    @classmethod
+    def _generate_certificates(cls):
+        """Signs the generated host and user keys with the CA key."""
+        if cls.USE_CERTIFICATES is not True:
+            return
+        cmds = []
+        for f in [x for x in cls._files().keys() if x.startswith('HOST_')]:
+            cmds.append(cls._sign_key_command(
+                '{}.pub'.format(getattr(cls, '{}_PATH'.format(f))),
+                'ssh-harness host key {}'.format(f),
+                cls._host_principals(), host=True))
+        for f in [x for x in cls._files().keys() if x.startswith('USER_')]:
+            cmds.append(cls._sign_key_command(
+                '{}.pub'.format(getattr(cls, '{}_PATH'.format(f))),
+                'ssh-harness user key {}'.format(f),
+                [pwd.getpwuid(os.getuid()).pw_name]))
+
+        for result in cls.runCommands(cmds, fail_fast=True):
+            if result is None:
+                continue  # Cancelled, another signature failed.
+            cls._check_keygen(None, result[0], chmod=False)
+
+    @classmethod
+    def signUserKey(cls, path, principals=None, identity=None,
+                    validity=None, options=None):
+        """Signs the public key `path` with the CA of the test-case (requires
+        ``USE_CERTIFICATES``), granting it access to the test server.
+
+        :param list principals: the user names the certificate is valid for
+            (defaults to the current user).
+        :param str identity: the identity of the certificate (which is
+            logged by the daemon).
+        :param str validity: the validity interval of the certificate, see
+            the ``-V`` option of :man:`ssh-keygen` (defaults to
+            ``CERTIFICATE_VALIDITY``).
+        :param list options: certificate options, see the ``-O`` option of
+            :man:`ssh-keygen` (e.g. ``['no-pty']``).
+
+        :returns: the path to the certificate.
+        """
+        if cls.USE_CERTIFICATES is not True:
+            raise RuntimeError(_('USE_CERTIFICATES is not enabled'))
+        if principals is None:
+            principals = [pwd.getpwuid(os.getuid()).pw_name]
+        cls._check_keygen(None, cls.runCommand(cls._sign_key_command(
+            path, identity or os.path.basename(path), principals,
+            validity=validity, options=options)), chmod=False)
+        if path.endswith('.pub'):
+            path = path[:-len('.pub')]
+        return '{}-cert.pub'.format(path)
+
+    @classmethod
+    def _start_key_index(cls):
+        """Starts serving the key index, and adds the user key to it."""
+        if cls.USE_KEY_INDEX is not True:
+            return
+        cls._key_index = KeyIndex()
+        cls._key_index_server = KeyIndexServer(
+            cls._key_index, os.path.join(cls.SSH_BASEDIR, 'keyindex.sock'))
+        cls._key_index_server.start()
+        cls.authorizeKey('{}.pub'.format(cls.USER_RSA_KEY_PATH),
+                         options=cls.AUTHORIZED_KEY_OPTIONS)
+
+    @classmethod
+    def _stop_key_index(cls):
+        if cls._key_index_server is not None:
+            cls._key_index_server.stop()
+        cls._key_index_server = None
+        cls._key_index = None
+
+    @classmethod
+    def _read_key(cls, key):
+        if os.path.isfile(key):
+            with open(key, 'r') as f:
+                return f.read().strip()
+        return key
+
+    @classmethod
+    def authorizeKey(cls, key, options=None, user=None):
+        """Grants the public `key` access to the test server, without
+        restarting it (requires ``USE_KEY_INDEX``).
+
+        :param str key: the path to a public key file, or the key itself.
+        :param str options: the ``authorized_keys`` options of the key.
+        :param str user: the user the key is authorized for (defaults to the
+            current user).
+
+        :returns: the SHA256 fingerprint of the key.
+        """
+        if cls._key_index is None:
+            raise RuntimeError(_('USE_KEY_INDEX is not enabled'))
+        if user is None:
+            user = pwd.getpwuid(os.getuid()).pw_name
+        return cls._key_index.add(user, cls._read_key(key), options=options)
+
+    @classmethod
+    def revokeKey(cls, key, user=None):
+        """Revokes a key authorized with :py:meth:`authorizeKey`.
+
+        :param str key: the path to a public key file, the key itself, or its
+            fingerprint.
+
+        :returns: whether the key was authorized.
+        """
+        if cls._key_index is None:
+            raise RuntimeError(_('USE_KEY_INDEX is not enabled'))
+        if user is None:
+            user = pwd.getpwuid(os.getuid()).pw_name
+        return cls._key_index.remove(user, cls._read_key(key))
+
+    @classmethod
+    def _snapshot_ssh_dir(cls):
+        """Snapshots the user's :file:`~/.ssh` directory, if requested.
+
+        A snapshot left behind by a previous run that did not get to restore
+        it (e.g. it was killed) is restored first.
+
+        Side effects
+        ------------
+
+        May create a :file:`~/.ssh.snapshot` directory.
+        """
+        if cls.SNAPSHOT_SSH_DIR is False:
+            return
+        # Not hard-links: other programs may modify the user's files in place
+        # while the tests run, which would alter the snapshot too.
+        snapshot = SnapshotAndRestore(cls._context_name,
+                                      os.path.dirname(cls._SSH_CONFIG_PATH),
+                                      'auto')
+        if snapshot.recover():
+            logger.warning(_("Restored `{}' from a snapshot left behind by a "
+                             "previous run.").format(snapshot.path))
+        with snapshot:
+            pass
+
+    @classmethod
+    def _edit_user_file(cls, path, mode):
+        """Returns a context manager to edit one of the user's files.
+
+        Files in the :file:`~/.ssh` directory are not backed-up individually
+        when the whole directory has been snapshot.
+        """
+        backup = True
+        if cls.SNAPSHOT_SSH_DIR is True:
+            backup = (os.path.dirname(os.path.abspath(path))
+                      != os.path.dirname(cls._SSH_CONFIG_PATH))
+        return BackupEditAndRestore(cls._context_name, path, mode,
+                                    backup=backup)
 
     @classmethod
     def _generate_environment_file(cls):
@@ -606,9 +1111,7 @@ UsePAM no
         """
         if cls.SSH_ENVIRONMENT_FILE is False:
             return
-        with BackupEditAndRestore(cls._context_name,
-                                  cls._SSH_ENVIRONMENT_PATH,
-                                  'w+t') as f:
+        with cls._edit_user_file(cls._SSH_ENVIRONMENT_PATH, 'w+t') as f:
             for k, v in cls.SSH_ENVIRONMENT.items():
                 print("{}={}".format(k, v), file=f)
 
@@ -664,13 +1167,114 @@ UsePAM no
             logger.debug(content)
             f.write(content)
 
+    @classmethod
+    def _sshd_profile(cls):
+        if cls.SSHD_PROFILE is None:
+            return {}
+        if cls.SSHD_PROFILE not in cls._SSHD_PROFILES:
+            raise ValueError(_('Unknown SSHD_PROFILE: {}')
+                             .format(cls.SSHD_PROFILE))
+        return cls._SSHD_PROFILES[cls.SSHD_PROFILE]
+
+    @classmethod
+    def _files(cls):
+        """Returns the files of the test-case (``_FILES``, plus the
+        additional host key of ``SSHD_PROFILE``), by name."""
+        files = dict(cls._FILES)
+        host_key = cls._sshd_profile().get('host_key')
+        if host_key is not None:
+            files.setdefault('HOST_{}_KEY'.format(host_key.upper()),
+                             'host_ssh_{}_key'.format(host_key))
+        return files
+
+    @classmethod
+    def _profile_algorithms(cls):
+        """Returns the ``(option, algorithms)`` pairs of ``SSHD_PROFILE``,
+        which also allow host certificates when ``USE_CERTIFICATES``."""
+        algorithms = []
+        for name, value in cls._sshd_profile().get('algorithms', []):
+            if 'HostKeyAlgorithms' == name and cls.USE_CERTIFICATES is True:
+                value = ','.join(
+                    ['{}-cert-v01@openssh.com'.format(x)
+                     for x in value.split(',')] + [value])
+            algorithms.append((name, value, ))
+        return algorithms
+
+    @classmethod
+    def _profile_config(cls):
+        """Returns the daemon settings of ``SSHD_PROFILE``."""
+        profile = cls._sshd_profile()
+        args = {
+            'log_level': 'VERBOSE',
+            'x11_forwarding': 'yes',
+            'tcp_keep_alive': 'yes',
+            'profile_config': '',
+            }
+        args.update(profile.get('settings', {}))
+        lines = []
+        if 'host_key' in profile:
+            name = 'HOST_{}_KEY'.format(profile['host_key'].upper())
+            lines.append('HostKey {}\n'.format(getattr(
+                cls, '{}_PATH'.format(name),
+                os.path.join(cls.SSH_BASEDIR, cls._files()[name]))))
+        lines.extend('{} {}\n'.format(*x) for x in cls._profile_algorithms())
+        args['profile_config'] = ''.join(lines)
+        return args
+
+    @classmethod
+    def _profile_client_options(cls):
+        """Returns the ssh client options that match ``SSHD_PROFILE``."""
+        options = []
+        for name, value in cls._profile_algorithms():
+            options.extend(['-o', '{}={}'.format(name, value)])
+        return options
+
+    @classmethod
+    def _keyscan_types(cls):
+        key_types = ['dsa', 'rsa', 'ecdsa']
+        host_key = cls._sshd_profile().get('host_key')
+        if host_key is not None and host_key not in key_types:
+            key_types.append(host_key)
+        return ','.join(key_types)
+
+    @classmethod
+    def _load_config(cls):
+        """Returns the daemon settings that limit how many connections it
+        handles at once (see ``LOAD_PROFILE``), and how many sessions each
+        of them can carry (``MAX_SESSIONS``)."""
+        settings = {}
+        if cls.LOAD_PROFILE is not None:
+            connections = max(10, cls.LOAD_PROFILE)
+            settings.update({
+                # Start dropping unauthenticated connections past twice the
+                # expected load, refuse them all past four times.
+                'MaxStartups': '{}:30:{}'.format(2 * connections,
+                                                 4 * connections),
+                # Reap the connections of the clients that went away.
+                'ClientAliveInterval': 15,
+                'ClientAliveCountMax': 4,
+                })
+        for name, value in (('MaxStartups', cls.MAX_STARTUPS, ),
+                            ('MaxSessions', cls.MAX_SESSIONS, ),
+                            ('ClientAliveInterval',
+                             cls.CLIENT_ALIVE_INTERVAL, ),
+                            ('ClientAliveCountMax',
+                             cls.CLIENT_ALIVE_COUNT_MAX, ), ):
+            if value is not None:
+                settings[name] = value
+        return {
+            'login_grace_time': cls.LOGIN_GRACE_TIME,
+            'load_config': ''.join('{} {}\n'.format(x, settings[x])
+                                   for x in sorted(settings)),
+            }
+
     @classmethod
     def _gather_config(cls):
         args = {}
 
         # Fill up the dictionnary with all the file paths required by the
         # daemon configuration file.
-        for k, v in cls._FILES.items():
+        for k, v in cls._files().items():
             attrname = '{}_PATH'.format(k)
             argname = '{}_path'.format(k.lower())
             if not hasattr(cls, attrname):
@@ -694,6 +1298,34 @@ UsePAM no
 
         args.update({
             'permit_environment': 'yes' if cls.SSH_ENVIRONMENT else 'no', })
+
+        certificates_config = ''
+        if cls.USE_CERTIFICATES is True:
+            certificates_config = ''.join(
+                'HostCertificate {}-cert.pub\n'.format(args[x])
+                for x in sorted(args.keys())
+                if x.startswith('host_') and x.endswith('_key_path'))
+            certificates_config += 'TrustedUserCAKeys {}.pub\n'.format(
+                cls.CA_ECDSA_KEY_PATH)
+        args.update({'certificates_config': certificates_config, })
+        args.update(cls._load_config())
+        args.update(cls._profile_config())
+        args.update({
+            'sftp_config': '' if cls.SFTP_SUBSYSTEM is None
+            else 'Subsystem sftp {}\n'.format(cls.SFTP_SUBSYSTEM),
+            })
+
+        authorized_keys_command_config = ''
+        if cls.USE_KEY_INDEX is True:
+            authorized_keys_command_config = (
+                'AuthorizedKeysCommand {} -E -S {} {} %u %f\n'
+                'AuthorizedKeysCommandUser {}\n'.format(
+                    cls.AUTHORIZED_KEYS_COMMAND_PYTHON, HELPER_PATH,
+                    os.path.join(cls.SSH_BASEDIR, 'keyindex.sock'),
+                    pwd.getpwuid(os.getuid()).pw_name))
+        args.update({
+            'authorized_keys_command_config': authorized_keys_command_config,
+            })
         return args
 
     @classmethod
@@ -719,6 +1351,53 @@ UsePAM no
             cls._errors[cls.SSHD_BIN] = 'Not starting or crashing at startup.'
             cls._skip()
 
+    @classmethod
+    def _start_ssh_agent(cls):
+        """Starts the ssh-agent of the test-case, and loads the user keys
+        in it."""
+        if cls.USE_SSH_AGENT is not True:
+            return
+        sock = os.path.join(cls.SSH_BASEDIR, 'agent.sock')
+        if os.path.exists(sock):
+            os.unlink(sock)  # Left-over from a previous run.
+        logger.debug('Starting SSH agent on {}'.format(sock))
+        with open(os.devnull, 'r+') as devnull:
+            cls._SSH_AGENT = subprocess.Popen(
+                [cls.SSH_AGENT_BIN, '-D', '-a', sock],
+                stdin=devnull, stdout=devnull)
+        for round in range(0, 50):
+            if os.path.exists(sock) or cls._SSH_AGENT.poll() is not None:
+                break
+            time.sleep(0.1)
+        if not os.path.exists(sock):
+            cls._kill_ssh_agent()
+            raise RuntimeError(_('ssh-agent did not start'))
+        cls._SSH_AGENT_SOCKET = sock
+        cls._child_environment = None  # Rebuilt to include SSH_AUTH_SOCK.
+
+        keys = [getattr(cls, '{}_PATH'.format(x))
+                for x in cls._files().keys() if x.startswith('USER_')]
+        returncode, out, err = cls.runCommand([cls.SSH_ADD_BIN] + keys)
+        if 0 != returncode:
+            cls._kill_ssh_agent()
+            raise RuntimeError('ssh-add failed with exit-status {} '
+                               'output:\n==STDOUT==\n{}\n==STDERR==\n{}'
+                               .format(returncode, out, err))
+
+    @classmethod
+    def _kill_ssh_agent(cls):
+        if cls._SSH_AGENT is None:
+            return
+        logger.debug('Killing SSH agent.')
+        cls._SSH_AGENT.terminate()
+        cls._SSH_AGENT.wait()
+        cls._SSH_AGENT = None
+        if cls._SSH_AGENT_SOCKET is not None:
+            if os.path.exists(cls._SSH_AGENT_SOCKET):
+                os.unlink(cls._SSH_AGENT_SOCKET)
+            cls._SSH_AGENT_SOCKET = None
+        cls._child_environment = None
+
     @classmethod
     def _kill_sshd(cls):
         logger.debug('Killing SSH Daemon.')
@@ -730,15 +1409,15 @@ UsePAM no
         if cls.UPDATE_SSH_CONFIG is False:
             return
 
-        with BackupEditAndRestore(cls._context_name,
-                                  cls._SSH_CONFIG_PATH,
-                                  'a') as user_config:
+        with cls._edit_user_file(cls._SSH_CONFIG_PATH, 'a') as user_config:
             user_config.write('''
 Host {ssh_config_host_name}
         HostName {address}
         Port {port}
         IdentityFile {identity}
 '''.format(**args))
+            for name, value in cls._sshd_profile().get('algorithms', []):
+                user_config.write('        {} {}\n'.format(name, value))
         with open(cls._SSH_CONFIG_PATH, 'r') as user_config:
             logger.debug(_("User's SSH Client config follows ({}):\n{}")
                          .format(cls._SSH_CONFIG_PATH,
@@ -755,16 +1434,30 @@ Host {ssh_config_host_name}
             :py:attr:`BaseSshClientTestCase._KNOWN_HOSTS_PATH` attribute.
             It defaults to `~/.ssh/known_hosts`
         """
+        if cls.USE_CERTIFICATES is True:
+            with open('{}.pub'.format(cls.CA_ECDSA_KEY_PATH), 'r') as f:
+                ca_key = f.read().strip()
+            with cls._edit_user_file(cls._KNOWN_HOSTS_PATH,
+                                     'a') as known_hosts:
+                host = cls.BIND_ADDRESS
+                if 22 != cls.PORT:
+                    host = '[{}]:{}'.format(host, cls.PORT)
+                known_hosts.write('@cert-authority {} {}\n'.format(host,
+                                                                   ca_key))
+            return
+
         failures = []
-        with BackupEditAndRestore(cls._context_name,
-                                  cls._KNOWN_HOSTS_PATH,
-                                  'a') as known_hosts:
+        with cls._edit_user_file(cls._KNOWN_HOSTS_PATH,
+                                 'a') as known_hosts:
             # we need to split IPv4 and IPv6 host key discovery because
             # :manpage:`ssh-keyscan(1)` fails if either fail.
-            for ip_version in ['-4', '-6', ]:
-                returncode, out, err = cls.runCommand([
-                    cls.SSH_KEYSCAN_BIN, '-H', ip_version, '-p', str(cls.PORT),
-                    '-t', 'dsa,rsa,ecdsa', cls.BIND_ADDRESS, ])
+            ip_versions = ['-4', '-6', ]
+            results = cls.runCommands([
+                [cls.SSH_KEYSCAN_BIN, '-H', ip_version, '-p', str(cls.PORT),
+                 '-t', cls._keyscan_types(), cls.BIND_ADDRESS, ]
+                for ip_version in ip_versions])
+            for ip_version, result in zip(ip_versions, results):
+                returncode, out, err = result[0]
 
                 # We check the length of `out` because in case of connection
                 # failure, ssh-keyscan still exit with 0, but spits nothing.
@@ -880,6 +1573,14 @@ Host {ssh_config_host_name}
         pc_met = cls._check_auxiliary_program(cls.SSH_KEYGEN_BIN) and pc_met
         cls._HAVE_SUDO = cls._check_auxiliary_program(cls.SUDO_BIN,
                                                       error=False)
+        if cls.USE_SSH_AGENT is True:
+            pc_met = cls._check_auxiliary_program(cls.SSH_AGENT_BIN) \
+                and pc_met
+            pc_met = cls._check_auxiliary_program(cls.SSH_ADD_BIN) and pc_met
+        if 'paramiko' == cls.REMOTE_BACKEND and not HAVE_PARAMIKO:
+            logger.error(_("REMOTE_BACKEND is `paramiko' but the paramiko "
+                           "module is not installed"))
+            pc_met = False
         if not pc_met:
             cls._skip()
 
@@ -915,45 +1616,323 @@ Host {ssh_config_host_name}
                             os.getuid(), os.geteuid()))
         cls._OLD_LANG = os.environ.get('LANG', None)
         os.environ['LANG'] = 'C'
+        cls._child_environment = None
 
         if 'SSH_HARNESS_DEBUG' in os.environ:
             logger.setLevel(logging.DEBUG)
         cls._logger = logger
 
         args = cls._gather_config()
-        cls._preconditions()  # May raise skip
-        cls._generate_sshd_config(args)
-        cls._protect_private_keys()
-        cls._generate_keys()
-        cls._generate_authzd_keys_file()
-        cls._generate_environment_file()
-        cls._start_sshd()
-        if cls.UPDATE_SSH_CONFIG is True:
-            cls._update_ssh_config(args)
-
-        # We use ssh-keyscan and thus need SSHD to be up and running.
-        cls._update_user_known_hosts()
+        try:
+            cls._preconditions()  # May raise skip
+            cls._snapshot_ssh_dir()
+            cls._generate_sshd_config(args)
+            cls._protect_private_keys()
+            cls._generate_keys()
+            cls._start_key_pair_pool()
+            cls._generate_certificates()
+            cls._start_ssh_agent()
+            cls._generate_authzd_keys_file()
+            cls._generate_environment_file()
+            cls._start_key_index()
+            cls._start_sshd()
+            if cls.UPDATE_SSH_CONFIG is True:
+                cls._update_ssh_config(args)
+
+            # We use ssh-keyscan and thus need SSHD to be up and running.
+            cls._update_user_known_hosts()
+        except SkipTest:
+            raise  # _skip() already cleaned-up.
+        except BaseException:
+            # tearDownClass() is not called when setUpClass() fails: stop what
+            # has been started and restore the user's files ourselves.
+            cls._cleanup_failed_setup()
+            raise
 
         if cls._errors:
             cls._skip()
 
     @classmethod
-    def runCommand(cls, cmd, input=None):
+    def _cleanup_failed_setup(cls):
+        """Runs :py:meth:`tearDownClass` after a failure of
+        :py:meth:`setUpClass`, logging (rather than raising) any error so
+        that the original one is the one reported."""
+        try:
+            cls.tearDownClass()
+        except Exception:
+            logger.exception(_("Could not clean-up after a failed set-up of "
+                               "{}").format(cls.__name__))
+
+    @classmethod
+    def _timeout(cls, timeout):
+        return cls.COMMAND_TIMEOUT if timeout is None else timeout
+
+    @classmethod
+    def _child_env(cls):
+        """Returns the environment of the commands run by the test-case
+        (`None` to inherit the current one)."""
+        overrides = dict(cls.CHILD_ENVIRONMENT)
+        if cls._SSH_AGENT_SOCKET is not None:
+            overrides['SSH_AUTH_SOCK'] = cls._SSH_AGENT_SOCKET
+        if not overrides:
+            return None
+        env = cls.__dict__.get('_child_environment')
+        if env is None:
+            env = dict(os.environ)
+            for name, value in overrides.items():
+                if value is None:
+                    env.pop(name, None)
+                else:
+                    env[name] = value
+            cls._child_environment = env
+        return env
+
+    @classmethod
+    def runCommand(cls, cmd, input=None, timeout=None, stdout=PIPE,
+                   stderr=PIPE):
+        """Runs `cmd` and returns its
+        :py:class:`~ssh_harness.commands.CommandResult`.
+
+        :param stdout: :py:data:`~ssh_harness.commands.PIPE` to capture the
+            command standard output, :py:data:`~ssh_harness.commands.DEVNULL`
+            to discard it (the output is then reported as empty).
+        :param stderr: same as `stdout`, for the error output.
+        """
         if isinstance(input, str) and (3, 0, 0, ) <= sys.version_info:
             input = input.encode('utf-8')
         logger.debug(_("Executing command: `{}'").format(' '.join(cmd)))
-        proc = subprocess.Popen(cmd,
-                                env=os.environ,
-                                stdin=subprocess.PIPE,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
-        (out, err) = proc.communicate(input=input)
-        if (3, 0, 0) <= sys.version_info:
-            # In Python 3.x subprocess module return bytes not string.
-            err = err.decode(_ENCODING)
-            out = out.decode(_ENCODING)
+        # In Python 3.x subprocess module return bytes not string, the stream
+        # decodes them.
+        proc = CommandStream(cmd,
+                             input=input,
+                             encoding=_ENCODING,
+                             env=cls._child_env(),
+                             timeout=cls._timeout(timeout),
+                             stdin=DEVNULL,
+                             stdout=stdout,
+                             stderr=stderr)
+        try:
+            (out, err) = proc.communicate()
+        except CommandTimeoutError as e:
+            cls._debug(e.out, e.err, proc, cmd=cmd)
+            raise
         cls._debug(out, err, proc, cmd=cmd)
-        return proc.returncode, out, err
+        return proc.result(out, err)
+
+    @classmethod
+    def runCommands(cls, cmds, max_workers=None, fail_fast=False,
+                    timeout=None):
+        """Runs the commands `cmds` concurrently.
+
+        :param int max_workers: the maximum number of commands running at
+            once (defaults to the number of CPUs).
+        :param bool fail_fast: whether to cancel the commands not yet started
+            as soon as one fails (exits with a non-zero status).
+
+        :returns: a list of ``(result, elapsed)`` tuples, in the order of
+            `cmds`, where `result` is what :py:meth:`runCommand` returns and
+            `elapsed` the wall-clock duration of the command, in seconds.
+            Cancelled commands are reported as `None`.
+
+        A :py:class:`~ssh_harness.commands.CommandTimeoutError` raised by one
+        of the commands cancels those not yet started, and is re-raised.
+        """
+        stop = None
+        if fail_fast is True:
+            def stop(result):
+                return 0 != result[0]
+        return run_batch(cls.runCommand, [(cmd, None, timeout, )
+                                          for cmd in cmds],
+                         max_workers=max_workers, stop=stop)
+
+    @classmethod
+    def _ssh_client_command(cls, remote=None, options=None):
+        """Returns the command line that connects to the test server with
+        the ssh client, and runs the `remote` command there.
+
+        The client is configured on its command line (it does not depend on
+        ``UPDATE_SSH_CONFIG``) and never prompts.
+
+        :param list options: additional options for the ssh client.
+        """
+        cmd = [cls.SSH_BIN,
+               '-p', str(cls.PORT),
+               '-i', cls.USER_RSA_KEY_PATH,
+               ]
+        cmd.extend(cls._ssh_client_options())
+        cmd.extend(options or [])
+        cmd.append(cls.BIND_ADDRESS)
+        if remote is not None:
+            cmd.append(remote)
+        return cmd
+
+    @classmethod
+    def _ssh_client_options(cls):
+        return [
+            '-o', 'IdentitiesOnly=yes',
+            '-o', 'BatchMode=yes',
+            '-o', 'UserKnownHostsFile={}'.format(cls._KNOWN_HOSTS_PATH),
+            ] + cls._profile_client_options()
+
+    @classmethod
+    def _copy_client_command(cls, program, options=None):
+        """Returns the beginning of the command line of :man:`scp` or
+        :man:`sftp` (`program`), configured like the ssh client of
+        :py:meth:`_ssh_client_command`.
+
+        The file transfers over :man:`sftp` require ``SFTP_SUBSYSTEM`` (and
+        so do the ones over :man:`scp`, with recent OpenSSH versions).
+        """
+        cmd = [program,
+               '-P', str(cls.PORT),
+               '-i', cls.USER_RSA_KEY_PATH,
+               ]
+        cmd.extend(cls._ssh_client_options())
+        cmd.extend(options or [])
+        return cmd
+
+    @classmethod
+    def _host_public_keys(cls):
+        return ['{}.pub'.format(getattr(cls, '{}_PATH'.format(x)))
+                for x in cls._files().keys() if x.startswith('HOST_')]
+
+    @classmethod
+    def _remote_pool(cls):
+        """Returns the pool of transports of the ``'paramiko'`` remote
+        backend."""
+        if cls._transport_pool is None:
+            cls._transport_pool = TransportPool(
+                cls.BIND_ADDRESS, cls.PORT,
+                pwd.getpwuid(os.getuid()).pw_name,
+                cls.USER_RSA_KEY_PATH, cls._host_public_keys(),
+                size=cls.REMOTE_POOL_SIZE, encoding=_ENCODING)
+        return cls._transport_pool
+
+    @classmethod
+    def runRemoteCommand(cls, cmd, input=None, timeout=None):
+        """Runs the command `cmd` (a string interpreted by the remote shell,
+        or a list of arguments) on the test server.
+
+        :returns: a :py:class:`~ssh_harness.commands.CommandResult`.
+        """
+        timeout = cls._timeout(timeout)
+        if 'paramiko' == cls.REMOTE_BACKEND:
+            return cls._remote_pool().run(_shell_join(cmd), input=input,
+                                          timeout=timeout)
+        return cls.runCommand(cls._ssh_client_command(_shell_join(cmd)),
+                              input=input, timeout=timeout)
+
+    @classmethod
+    def runRemoteCommands(cls, cmds, timeout=None):
+        """Runs the commands `cmds` on the test server, one after the other
+        (over a single ssh session with the ``'ssh'`` remote backend).
+
+        Each command is either a string (interpreted by the remote shell) or
+        a list of arguments. The commands do not share any state (each is
+        run in its own sub-shell), and their standard input is
+        :file:`/dev/null`.
+
+        :returns: a list of :py:class:`~ssh_harness.commands.CommandResult`,
+            in the order of `cmds` (without timings, the commands being run
+            remotely). Commands that did not terminate, e.g. because the
+            connection was lost, are reported as `None`.
+        :raises RuntimeError: if the ssh client failed to connect.
+        """
+        cmds = list(cmds)
+        if not cmds:
+            return []
+        if 'paramiko' == cls.REMOTE_BACKEND:
+            # Channels are cheap enough, no need for framing.
+            deadline = None if timeout is None else time.time() + timeout
+            return [cls.runRemoteCommand(
+                cmd, input='',
+                timeout=None if deadline is None else deadline - time.time())
+                for cmd in cmds]
+        marker, script = _frame_commands(cmds)
+        returncode, out, err = cls.runCommand(
+            cls._ssh_client_command('sh'), input=script, timeout=timeout)
+        results = _split_framed(marker, len(cmds), out, err)
+        if 255 == returncode and results[0] is None:
+            raise RuntimeError(_('ssh failed with exit-status {}:\n{}')
+                               .format(returncode, err))
+        return results
+
+    @classmethod
+    def _load_probe(cls, cmd, timeout):
+        """Returns a callable that connects to the test server and runs the
+        command `cmd` there (see :py:func:`~ssh_harness.load.run_load`)."""
+        cmd = _shell_join(cmd)
+        if 'paramiko' == cls.REMOTE_BACKEND:
+            return SessionProbe(cls.BIND_ADDRESS, cls.PORT,
+                                pwd.getpwuid(os.getuid()).pw_name,
+                                cls.USER_RSA_KEY_PATH,
+                                cls._host_public_keys(), cmd,
+                                timeout=timeout, encoding=_ENCODING)
+        ssh = cls._ssh_client_command(cmd)
+
+        def probe():
+            returncode, out, err = cls.runCommand(ssh, timeout=timeout,
+                                                  stdout=DEVNULL)
+            if 0 != returncode:
+                raise RuntimeError(_('ssh failed with exit-status {}:\n{}')
+                                   .format(returncode, err))
+            return {}
+        return probe
+
+    @classmethod
+    def runLoad(cls, cmd='true', rate=None, concurrency=1, duration=None,
+                count=None, timeout=None):
+        """Connects to the test server repeatedly, running `cmd` (a string
+        or a list of arguments) over each connection.
+
+        :param float rate: the number of connections to open per second
+            (`None` to open them as fast as `concurrency` permits).
+        :param int concurrency: the maximum number of connections open at
+            once.
+        :param float duration: how long to run, in seconds.
+        :param int count: how many connections to open.
+        :param float timeout: the timeout of each connection.
+
+        :returns: a :py:class:`~ssh_harness.load.LoadReport`.
+        """
+        return run_load(cls._load_probe(cmd, cls._timeout(timeout)),
+                        rate=rate, concurrency=concurrency,
+                        duration=duration, count=count)
+
+    @classmethod
+    def runCommandStream(cls, cmd, input=None, binary=False, lines=False,
+                         timeout=None):
+        """Runs `cmd` and returns an iterator over its output.
+
+        Unlike :py:meth:`runCommand` the output is not kept in memory, it is
+        yielded as ``(name, data)`` tuples (where `name` is either
+        ``'stdout'`` or ``'stderr'``) as it arrives. See
+        :py:class:`ssh_harness.commands.CommandStream`.
+        """
+        logger.debug(_("Streaming command: `{}'").format(' '.join(cmd)))
+        return CommandStream(cmd, input=input, binary=binary, lines=lines,
+                             encoding=_ENCODING,
+                             env=cls._child_env(),
+                             timeout=cls._timeout(timeout),
+                             stdin=DEVNULL)
+
+    @classmethod
+    def runCommandAsync(cls, cmd, input=None, binary=False, on_output=None,
+                        timeout=None):
+        """Returns a coroutine that runs `cmd` (requires Python 3.5+).
+
+        The coroutine returns the same ``(returncode, out, err)`` tuple as
+        :py:meth:`runCommand`, and can be run concurrently with others from
+        an :py:mod:`asyncio` event loop. It also raises
+        :py:class:`~ssh_harness.commands.CommandTimeoutError` once `timeout`
+        (or ``COMMAND_TIMEOUT``) expires.
+        """
+        from .aio import run_command
+        logger.debug(_("Executing command: `{}'").format(' '.join(cmd)))
+        return run_command(cmd, input=input, binary=binary,
+                           encoding=_ENCODING, env=cls._child_env(),
+                           on_output=on_output,
+                           timeout=cls._timeout(timeout))
 
     @classmethod
     def runCommandWarnIfFails(cls, cmd, action, input=None):
@@ -972,11 +1951,19 @@ Host {ssh_config_host_name}
     def tearDownClass(cls):
         if cls._OLD_LANG is not None:
             os.environ['LANG'] = cls._OLD_LANG
+        cls._child_environment = None
+        if cls._transport_pool is not None:
+            cls._transport_pool.close()
+            cls._transport_pool = None
+        cls._kill_ssh_agent()
+        cls._stop_key_index()
+        cls._stop_key_pair_pool()
+        cls._delete_identities()
         # If the server was started.
         if cls._SSHD is not None:
             cls._kill_sshd()
 
-        for f in cls._FILES.keys():
+        for f in cls._files().keys():
             file = getattr(cls, '{}_PATH'.format(f), None)
             if file is None:
                 continue  # File was not created for some reason
@@ -987,8 +1974,9 @@ Host {ssh_config_host_name}
             if f.endswith('_KEY'):
                 # Don't forget to remove the public key along with the
                 # private one.
-                file = '{}.pub'.format(file)
-                cls._delete_file(file)
+                cls._delete_file('{}.pub'.format(file))
+                if cls.USE_CERTIFICATES is True:
+                    cls._delete_file('{}-cert.pub'.format(file))
 
         BackupEditAndRestore.clear_context(cls._context_name)
 
@@ -0,0 +1,167 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Asynchronous variants of the command helpers.
+
+This module requires Python 3.5 or later: it is only imported when one of
+its coroutines is requested.
+"""
+import asyncio
+import codecs
+import os
+import signal
+import time
+
+from .commands import (
+    CommandResult, CommandTimeoutError, _CHUNK_SIZE, _ENCODING,
+    _KILL_GRACE, _STDERR, _STDOUT, )
+
+
+__all__ = [
+    'run_command',
+    ]
+
+
+async def _pump(name, reader, parts, binary, encoding, on_output, timings):
+    """Reads `reader` until its end, into the list `parts` (which thus holds
+    the output read so far, should the command be interrupted)."""
+    decoder = None if binary else codecs.getincrementaldecoder(encoding)()
+    while True:
+        data = await reader.read(_CHUNK_SIZE)
+        if decoder is not None:
+            data = decoder.decode(data, not data)
+        if data:
+            if 'first_byte' not in timings:
+                timings['first_byte'] = time.time() - timings['start']
+            parts.append(data)
+            if on_output is not None:
+                on_output(name, data)
+        elif reader.at_eof():
+            break
+
+
+def _signal_group(proc, signum):
+    try:
+        os.killpg(proc.pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+async def _kill_group(proc):
+    """Terminates the process group of `proc`: with SIGTERM, then SIGKILL
+    if it lingers (as :py:class:`~ssh_harness.commands.CommandStream`
+    does)."""
+    _signal_group(proc, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(proc.wait(), _KILL_GRACE)
+    except asyncio.TimeoutError:
+        pass
+    # Also kills whatever the command may have left behind.
+    _signal_group(proc, signal.SIGKILL)
+    await proc.wait()
+
+
+async def _feed(writer, input):
+    try:
+        writer.write(input)
+        await writer.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # The command does not want more input.
+    writer.close()
+
+
+async def _interrupt(proc, task):
+    """Kills the command `proc`, then lets the `task` reading its output
+    collect what is left in the pipes (and close them)."""
+    if proc.returncode is None:
+        await _kill_group(proc)
+    try:
+        await asyncio.wait_for(task, _KILL_GRACE)
+    except Exception:
+        pass  # Timed out (the pipes are still open somewhere), or failed.
+
+
+async def run_command(cmd, input=None, binary=False, encoding=None,
+                      env=None, on_output=None, timeout=None):
+    """Runs `cmd` and returns its exit status and outputs.
+
+    :param on_output: an optional callable, called with the name of the
+        stream (``'stdout'`` or ``'stderr'``) and the data, each time the
+        command outputs something.
+    :param float timeout: the number of seconds the command is given to
+        terminate (`None` for no limit).
+
+    :returns: a :py:class:`~ssh_harness.commands.CommandResult`, like
+        :py:meth:`ssh_harness.BaseSshClientTestCase.runCommand` (without
+        the resource usage figures, the child being reaped by the event
+        loop).
+    :raises CommandTimeoutError: when `timeout` expires, carrying the output
+        collected until then.
+
+    The command is started in its own session. Its process group is killed
+    on timeout, and should the coroutine be cancelled or fail. Any number of
+    commands can be run concurrently that way from the same event loop.
+    """
+    encoding = encoding or _ENCODING
+    if isinstance(input, str):
+        input = input.encode(encoding)
+    timings = {'start': time.time()}
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        env=env,
+        # Like runCommand: never the standard input of the test runner.
+        stdin=asyncio.subprocess.PIPE if input is not None
+        else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True)
+    outputs = {_STDOUT: [], _STDERR: []}
+    tasks = [
+        _pump(_STDOUT, proc.stdout, outputs[_STDOUT], binary, encoding,
+              on_output, timings),
+        _pump(_STDERR, proc.stderr, outputs[_STDERR], binary, encoding,
+              on_output, timings),
+        ]
+    if input is not None:
+        tasks.append(_feed(proc.stdin, input))
+
+    async def communicate():
+        await asyncio.gather(*tasks)
+        return await proc.wait()
+
+    empty = b'' if binary else ''
+    task = asyncio.ensure_future(communicate())
+    try:
+        done, pending = await asyncio.wait([task], timeout=timeout)
+        if task in done:
+            returncode = task.result()
+    except BaseException:
+        await _interrupt(proc, task)
+        raise
+    if task not in done:
+        await _interrupt(proc, task)
+        raise CommandTimeoutError(cmd, timeout, proc.returncode,
+                                  out=empty.join(outputs[_STDOUT]),
+                                  err=empty.join(outputs[_STDERR]))
+    return CommandResult(returncode, empty.join(outputs[_STDOUT]),
+                         empty.join(outputs[_STDERR]),
+                         wall_time=time.time() - timings['start'],
+                         first_byte_time=timings.get('first_byte'))
+
+
+# vim: syntax=python:sws=4:sw=4:et:
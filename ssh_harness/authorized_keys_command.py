@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""``AuthorizedKeysCommand`` helper: queries a
+:py:class:`ssh_harness.keyindex.KeyIndexServer`.
+
+Usage::
+
+  authorized_keys_command.py SOCKET USER [FINGERPRINT]
+
+Prints the authorized keys of ``USER`` (only the one matching
+``FINGERPRINT`` if given). This script is run by :program:`sshd` for each
+authentication attempt: it must remain standalone (no import from
+:py:mod:`ssh_harness`) and fast to start.
+"""
+import socket
+import sys
+
+
+TIMEOUT = 5
+"""How long to wait for the key index, in seconds (sshd waits for the
+command to complete before going on with authentication)."""
+
+
+def main(argv):
+    if len(argv) < 3:
+        sys.stderr.write('usage: {} SOCKET USER [FINGERPRINT]\n'
+                         .format(argv[0]))
+        return 2
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(TIMEOUT)
+    try:
+        sock.connect(argv[1])
+        sock.sendall((' '.join(argv[2:4]) + '\n').encode('utf-8'))
+        out = getattr(sys.stdout, 'buffer', sys.stdout)
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            out.write(data)
+        out.flush()
+    except (OSError, socket.error) as e:
+        sys.stderr.write('{}: {}\n'.format(argv[0], e))
+        return 1
+    finally:
+        sock.close()
+    return 0
+
+
+if '__main__' == __name__:
+    sys.exit(main(sys.argv))
+
+
+# vim: syntax=python:sws=4:sw=4:et:
@@ -0,0 +1,27 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Micro-benchmarks of the harness machinery.
+
+Each module of this package can be run as a script, e.g.::
+
+  python -m ssh_harness.benchmarks.spawn --help
+"""
+
+
+# vim: syntax=python:sws=4:sw=4:et:
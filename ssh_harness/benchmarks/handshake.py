@@ -0,0 +1,112 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Measures how long it takes to connect to the test server, with the
+default daemon settings and with the ``'fast'`` profile (see
+``SSHD_PROFILE``).
+
+A test server is started for each in turn (this requires :program:`sshd`,
+and edits your :file:`~/.ssh` files the way test-cases do), then connected
+to COUNT times in a row, each connection running :command:`true`.
+
+Usage::
+
+  python -m ssh_harness.benchmarks.handshake [-n COUNT]
+      [-b {ssh,paramiko}] [--json PATH]
+"""
+from __future__ import print_function
+import argparse
+import json
+import sys
+from unittest import SkipTest
+
+from .. import PubKeyAuthSshClientTestCase
+
+
+class _DefaultHarness(PubKeyAuthSshClientTestCase):
+
+    _context_name = 'benchmark_handshake'
+
+
+class _FastHarness(_DefaultHarness):
+
+    SSHD_PROFILE = 'fast'
+
+
+PROFILES = (
+    ('default', _DefaultHarness, ),
+    ('fast', _FastHarness, ),
+    )
+
+
+def run(count=100, backend='ssh'):
+    """Connects `count` times to a test server run with each profile.
+
+    :returns: a list of ``(profile, report)`` tuples, where `report` is a
+        :py:class:`~ssh_harness.load.LoadReport`.
+    :raises SkipTest: if the test server cannot be started.
+    """
+    reports = []
+    for name, harness in PROFILES:
+        harness.REMOTE_BACKEND = backend
+        harness.setUpClass()
+        try:
+            reports.append((name, harness.runLoad('true', count=count), ))
+        finally:
+            harness.tearDownClass()
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Measures the time it takes to connect to the test '
+        'server, with and without the fast daemon profile.')
+    parser.add_argument('-n', '--count', type=int, default=100,
+                        help='number of connections per profile')
+    parser.add_argument('-b', '--backend', choices=['ssh', 'paramiko'],
+                        default='ssh',
+                        help='how to connect (default: ssh)')
+    parser.add_argument('--json', metavar='PATH',
+                        help='where to save the reports')
+    args = parser.parse_args(argv)
+
+    try:
+        reports = run(args.count, args.backend)
+    except SkipTest as e:
+        print('Cannot start the test server: {}'.format(e), file=sys.stderr)
+        return 1
+    reference = reports[0][1].histograms['total'].percentile(50)
+    for name, report in reports:
+        p50 = report.histograms['total'].percentile(50)
+        if p50 is None or reference is None:
+            print('== {}'.format(name))
+        else:
+            print('== {} (p50 x{:.2f})'.format(name, p50 / reference))
+        print(report.summary())
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(dict((x, y.to_dict()) for x, y in reports), f,
+                      indent=2, sort_keys=True)
+    return 0
+
+
+if '__main__' == __name__:
+    sys.exit(main())
+
+
+# vim: syntax=python:sws=4:sw=4:et:
@@ -0,0 +1,105 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Measures the rate at which commands can be spawned.
+
+It compares the way :py:meth:`ssh_harness.BaseSshClientTestCase.runCommand`
+used to start commands (:py:class:`subprocess.Popen` with a copy of the
+environment and three pipes) with
+:py:class:`ssh_harness.commands.CommandStream` capturing the output, or
+discarding it.
+
+Usage::
+
+  python -m ssh_harness.benchmarks.spawn [-n COUNT] [COMMAND [ARG ...]]
+"""
+from __future__ import print_function
+import argparse
+import os
+import subprocess
+import time
+
+from ..commands import CommandStream, DEVNULL, PIPE
+
+
+def _popen(cmd):
+    proc = subprocess.Popen(cmd,
+                            env=dict(os.environ),
+                            stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    proc.communicate()
+    return proc.returncode
+
+
+def _stream(cmd):
+    stream = CommandStream(cmd, stdin=DEVNULL, stdout=PIPE, stderr=PIPE)
+    stream.communicate()
+    return stream.returncode
+
+
+def _devnull(cmd):
+    stream = CommandStream(cmd, stdin=DEVNULL, stdout=DEVNULL,
+                           stderr=DEVNULL)
+    stream.communicate()
+    return stream.returncode
+
+
+VARIANTS = (
+    ('popen', _popen, ),
+    ('stream', _stream, ),
+    ('devnull', _devnull, ),
+    )
+
+
+def run(count=1000, cmd=('true', )):
+    """Spawns `cmd` `count` times with each variant.
+
+    :returns: a list of ``(variant, spawns_per_second)`` tuples.
+    """
+    cmd = list(cmd)
+    rates = []
+    for name, func in VARIANTS:
+        start = time.time()
+        for i in range(0, count):
+            func(cmd)
+        rates.append((name, count / (time.time() - start), ))
+    return rates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Measures the rate at which commands are spawned.')
+    parser.add_argument('-n', '--count', type=int, default=1000,
+                        help='number of times the command is run')
+    parser.add_argument('cmd', nargs='*', default=['true'],
+                        help='the command to run (default: true)')
+    args = parser.parse_args(argv)
+
+    rates = run(args.count, args.cmd)
+    reference = rates[0][1]
+    for name, rate in rates:
+        print('{:<10} {:10.1f} spawns/s  (x{:.2f})'
+              .format(name, rate, rate / reference))
+
+
+if '__main__' == __name__:
+    main()
+
+
+# vim: syntax=python:sws=4:sw=4:et:
@@ -0,0 +1,275 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Measures the throughput of data transfers to the test server, through
+``ssh host 'cat > /dev/null'``, :man:`scp` and :man:`sftp`, for each of the
+given ciphers, with and without compression.
+
+It reports the transfer rates (in MB/s) and the CPU time the client used
+per byte transferred. The results can be saved as a baseline, later runs
+compared to which fail when they are slower, or use more CPU, than the
+tolerance allows.
+
+A test server is started for the duration of the benchmark (this requires
+:program:`sshd`, and edits your :file:`~/.ssh` files the way test-cases
+do).
+
+Usage::
+
+  python -m ssh_harness.benchmarks.throughput [-s MB [-s MB ...]]
+      [-m METHOD ...] [-c CIPHER ...] [-z {no,yes} ...] [-r REPEAT]
+      [--compressible] [--save-baseline PATH]
+      [--baseline PATH [--tolerance RATIO]] [--json PATH]
+"""
+from __future__ import division, print_function
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from unittest import SkipTest
+
+from .. import PubKeyAuthSshClientTestCase
+from ..commands import DEVNULL, _shell_join
+
+
+METHODS = ('cat', 'scp', 'sftp', )
+
+CIPHERS = (
+    'aes128-ctr',
+    'aes128-gcm@openssh.com',
+    'chacha20-poly1305@openssh.com',
+    )
+
+COMPRESSION = ('no', 'yes', )
+
+_MB = 1000 * 1000
+
+
+class _Harness(PubKeyAuthSshClientTestCase):
+
+    _context_name = 'benchmark_throughput'
+    SFTP_SUBSYSTEM = 'internal-sftp'
+
+
+def _write_payload(path, size, compressible=False):
+    """Writes `size` bytes to `path`: random ones, or lines of text when
+    `compressible`."""
+    line = b'0123456789abcdef' * 4 + b'\n'
+    with open(path, 'wb') as f:
+        written = 0
+        while written < size:
+            chunk = min(_MB, size - written)
+            if compressible:
+                f.write((line * (chunk // len(line) + 1))[:chunk])
+            else:
+                f.write(os.urandom(chunk))
+            written += chunk
+
+
+def _command(harness, method, payload, options):
+    """Returns the command that sends the file `payload` to the test server
+    using `method`, and the input to give it."""
+    if 'cat' == method:
+        ssh = harness._ssh_client_command('cat > /dev/null', options)
+        # exec: resource usage figures are the ones of the ssh client.
+        return ['sh', '-c', 'exec {} < {}'.format(
+            _shell_join(ssh), _shell_join([payload]))], None
+    if 'scp' == method:
+        return harness._copy_client_command(harness.SCP_BIN, options) + [
+            payload, '{}:/dev/null'.format(harness.BIND_ADDRESS)], None
+    if 'sftp' == method:
+        return harness._copy_client_command(
+            harness.SFTP_BIN, options + ['-b', '-']) + [
+            harness.BIND_ADDRESS], 'put {} /dev/null\n'.format(payload)
+    raise ValueError('Unknown transfer method: {}'.format(method))
+
+
+def _key(row):
+    return '{method}/{cipher}/compression={compression}/{size}'.format(**row)
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def measure(harness, payload, size, method, cipher, compression, repeat=3):
+    """Sends `payload` (a file of `size` bytes) `repeat` times.
+
+    :returns: a dictionary with the median transfer rate (``mb_per_s``) and
+        CPU time of the client per byte (``cpu_ns_per_byte``), or the
+        ``error`` of the first failed transfer.
+    """
+    row = {'method': method, 'cipher': cipher, 'compression': compression,
+           'size': size, }
+    options = ['-o', 'Ciphers={}'.format(cipher),
+               '-o', 'Compression={}'.format(compression), ]
+    cmd, input = _command(harness, method, payload, options)
+    rates, cpu = [], []
+    for i in range(0, repeat):
+        result = harness.runCommand(cmd, input=input, stdout=DEVNULL)
+        if 0 != result.returncode:
+            row['error'] = result.err.strip() or 'exit-status {}'.format(
+                result.returncode)
+            return row
+        rates.append(size / _MB / result.wall_time)
+        if result.user_time is not None:
+            cpu.append((result.user_time + result.system_time) / size * 1e9)
+    row['mb_per_s'] = _median(rates)
+    row['cpu_ns_per_byte'] = _median(cpu) if cpu else None
+    return row
+
+
+def run(sizes=(64 * _MB, ), methods=METHODS, ciphers=CIPHERS,
+        compressions=COMPRESSION, repeat=3, compressible=False,
+        harness=_Harness):
+    """Measures every combination of payload size, method, cipher and
+    compression setting.
+
+    :returns: a list of dictionaries (see :py:func:`measure`).
+    :raises SkipTest: if the test server cannot be started.
+    """
+    rows = []
+    harness.setUpClass()
+    directory = tempfile.mkdtemp(prefix='ssh-harness-throughput-')
+    try:
+        for size in sizes:
+            payload = os.path.join(directory, 'payload-{}'.format(size))
+            _write_payload(payload, size, compressible)
+            for method in methods:
+                for cipher in ciphers:
+                    for compression in compressions:
+                        rows.append(measure(harness, payload, size, method,
+                                            cipher, compression, repeat))
+            os.unlink(payload)
+    finally:
+        harness.tearDownClass()
+        shutil.rmtree(directory)
+    return rows
+
+
+def to_baseline(rows):
+    """Returns the figures of the successful measures `rows`, by
+    measure."""
+    return dict((_key(x), {'mb_per_s': x['mb_per_s'],
+                           'cpu_ns_per_byte': x['cpu_ns_per_byte'], })
+                for x in rows if 'error' not in x)
+
+
+def compare(rows, baseline, tolerance=0.1):
+    """Compares the measures `rows` with the `baseline`.
+
+    :param float tolerance: how much slower, or more CPU hungry, than the
+        baseline a measure can be (``0.1`` being 10 %).
+
+    :returns: a list of messages, one for each regression (measures missing
+        from the baseline are ignored).
+    """
+    regressions = []
+    for row in rows:
+        reference = baseline.get(_key(row))
+        if reference is None:
+            continue
+        if 'error' in row:
+            regressions.append('{}: failed ({})'.format(_key(row),
+                                                        row['error']))
+            continue
+        if row['mb_per_s'] < reference['mb_per_s'] * (1 - tolerance):
+            regressions.append('{}: {:.1f} MB/s, down from {:.1f} MB/s'
+                               .format(_key(row), row['mb_per_s'],
+                                       reference['mb_per_s']))
+        if row['cpu_ns_per_byte'] is not None \
+                and reference.get('cpu_ns_per_byte') is not None \
+                and reference['cpu_ns_per_byte'] * (1 + tolerance) \
+                < row['cpu_ns_per_byte']:
+            regressions.append('{}: {:.2f} ns of CPU per byte, up from {:.2f}'
+                               .format(_key(row), row['cpu_ns_per_byte'],
+                                       reference['cpu_ns_per_byte']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Measures the throughput of data transfers to the test '
+        'server.')
+    parser.add_argument('-s', '--size', type=float, action='append',
+                        help='payload size in MB (default: 64), repeatable')
+    parser.add_argument('-m', '--method', choices=METHODS, action='append',
+                        help='transfer method (default: all), repeatable')
+    parser.add_argument('-c', '--cipher', action='append',
+                        help='cipher (default: {}), repeatable'
+                        .format(', '.join(CIPHERS)))
+    parser.add_argument('-z', '--compression', choices=COMPRESSION,
+                        action='append',
+                        help='Compression setting (default: both), '
+                        'repeatable')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='transfers per measure (default: 3)')
+    parser.add_argument('--compressible', action='store_true',
+                        help='send text instead of random bytes')
+    parser.add_argument('--save-baseline', metavar='PATH',
+                        help='save the results as a baseline')
+    parser.add_argument('--baseline', metavar='PATH',
+                        help='fail on regressions from this baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed regression ratio (default: 0.1)')
+    parser.add_argument('--json', metavar='PATH',
+                        help='where to save the results')
+    args = parser.parse_args(argv)
+
+    sizes = [int(x * _MB) for x in args.size or [64]]
+    try:
+        rows = run(sizes, args.method or METHODS, args.cipher or CIPHERS,
+                   args.compression or COMPRESSION, args.repeat,
+                   args.compressible)
+    except SkipTest as e:
+        print('Cannot start the test server: {}'.format(e), file=sys.stderr)
+        return 1
+
+    for row in rows:
+        if 'error' in row:
+            print('{:<60} failed: {}'.format(_key(row), row['error']))
+        else:
+            print('{:<60} {:8.1f} MB/s {:8.2f} ns/byte'.format(
+                _key(row), row['mb_per_s'], row['cpu_ns_per_byte'] or 0))
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2, sort_keys=True)
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(to_baseline(rows), f, indent=2, sort_keys=True)
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(rows, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION {}'.format(regression), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if '__main__' == __name__:
+    sys.exit(main())
+
+
+# vim: syntax=python:sws=4:sw=4:et:
@@ -0,0 +1,733 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+from __future__ import unicode_literals
+import codecs
+import errno
+import io
+from locale import getpreferredencoding
+from multiprocessing import cpu_count
+import os
+import re
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+try:
+    import resource
+except ImportError:  # Not a POSIX platform.
+    resource = None
+try:
+    import selectors
+except ImportError:  # Python 2
+    selectors = None
+try:
+    from shlex import quote
+except ImportError:  # Python 2
+    from pipes import quote
+
+
+__all__ = [
+    'DEVNULL',
+    'PIPE',
+    'CommandResult',
+    'CommandStream',
+    'CommandTimeoutError',
+    'run_batch',
+    ]
+
+
+_ENCODING = getpreferredencoding(do_setlocale=False)
+
+_CHUNK_SIZE = 65536
+
+_STDOUT = 'stdout'
+_STDERR = 'stderr'
+
+_KILL_GRACE = 2.0
+"""Seconds left to a command to exit after SIGTERM, before it is killed."""
+
+PIPE = subprocess.PIPE
+"""Captures the stream it is given for."""
+
+DEVNULL = getattr(subprocess, 'DEVNULL', -3)
+"""Connects the stream it is given for to :file:`/dev/null`."""
+
+_HAVE_POSIX_SPAWN = hasattr(os, 'posix_spawnp')
+
+_UNKNOWN_RETURNCODE = 0
+"""Exit status reported for a command reaped by someone else, whose actual
+status is lost (:py:mod:`subprocess` does the same)."""
+
+
+if selectors is not None:
+    # Unlike select(), not limited to descriptors below FD_SETSIZE.
+    _Selector = selectors.DefaultSelector
+    _EVENT_READ = selectors.EVENT_READ
+    _EVENT_WRITE = selectors.EVENT_WRITE
+else:
+    _EVENT_READ = 1
+    _EVENT_WRITE = 2
+
+    class _SelectorKey(object):
+
+        def __init__(self, fd, events):
+            self.fileobj = self.fd = fd
+            self.events = events
+
+    class _Selector(object):
+        """The subset of :py:class:`selectors.DefaultSelector` used by
+        :py:class:`CommandStream`, on top of :py:func:`select.select`."""
+
+        def __init__(self):
+            self._keys = {}
+
+        def register(self, fd, events):
+            self._keys[fd] = _SelectorKey(fd, events)
+
+        def unregister(self, fd):
+            return self._keys.pop(fd)
+
+        def get_map(self):
+            return self._keys
+
+        def select(self, timeout=None):
+            readers = [fd for fd, key in self._keys.items()
+                       if key.events & _EVENT_READ]
+            writers = [fd for fd, key in self._keys.items()
+                       if key.events & _EVENT_WRITE]
+            try:
+                r, w, x = select.select(readers, writers, [], timeout)
+            except (OSError, select.error) as e:
+                if errno.EINTR == e.args[0]:
+                    return []
+                raise
+            ready = dict((fd, _EVENT_READ, ) for fd in r)
+            for fd in w:
+                ready[fd] = ready.get(fd, 0) | _EVENT_WRITE
+            return [(self._keys[fd], events, )
+                    for fd, events in ready.items()]
+
+        def close(self):
+            self._keys.clear()
+
+
+class CommandResult(tuple):
+    """The outcome of a command.
+
+    It unpacks as a ``(returncode, out, err)`` tuple, and also carries:
+
+    :ivar float wall_time: the number of seconds between the start of the
+        command and its termination.
+    :ivar float first_byte_time: the number of seconds between the start of
+        the command and its first output (on either stream), `None` if it
+        did not output anything.
+    :ivar float user_time: the user CPU time used by the command, in seconds.
+    :ivar float system_time: the system CPU time used by the command, in
+        seconds.
+    :ivar int max_rss: the maximum resident set size of the command, as
+        reported by :manpage:`getrusage(2)` (in kilobytes on Linux).
+
+    The resource usage figures come from :py:func:`os.wait4` when available,
+    otherwise from :py:func:`resource.getrusage` deltas (which then include
+    any other child process terminated meanwhile). They are `None` when
+    neither is available.
+    """
+
+    def __new__(cls, returncode, out, err, wall_time=None,
+                first_byte_time=None, user_time=None, system_time=None,
+                max_rss=None):
+        inst = super(CommandResult, cls).__new__(
+            cls, (returncode, out, err, ))
+        inst.wall_time = wall_time
+        inst.first_byte_time = first_byte_time
+        inst.user_time = user_time
+        inst.system_time = system_time
+        inst.max_rss = max_rss
+        return inst
+
+    @property
+    def returncode(self):
+        return self[0]
+
+    @property
+    def out(self):
+        return self[1]
+
+    @property
+    def err(self):
+        return self[2]
+
+    def __repr__(self):
+        return ('CommandResult(returncode={!r}, wall_time={!r}, '
+                'first_byte_time={!r}, user_time={!r}, system_time={!r}, '
+                'max_rss={!r})'.format(self[0], self.wall_time,
+                                       self.first_byte_time, self.user_time,
+                                       self.system_time, self.max_rss))
+
+
+def _status_to_returncode(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class _SpawnedProcess(object):
+    """The subset of :py:class:`subprocess.Popen` used by
+    :py:class:`CommandStream`, for a process started with
+    :py:func:`os.posix_spawnp`.
+
+    Unlike :py:class:`subprocess.Popen`, no pipe is created for the streams
+    which are not captured, and the child is started without running any
+    Python code between fork and exec (the C library may use vfork).
+    """
+
+    def __init__(self, cmd, env, stdin, stdout, stderr):
+        self.returncode = None
+        self.stdin = self.stdout = self.stderr = None
+        file_actions = []
+        parent_fds = []
+        child_fds = []
+        try:
+            for fd, how in ((0, stdin, ), (1, stdout, ), (2, stderr, ), ):
+                if PIPE == how:
+                    r, w = os.pipe()
+                    child, parent = (r, w, ) if 0 == fd else (w, r, )
+                    child_fds.append(child)
+                    parent_fds.append((fd, parent, ))
+                    # Pipes are created non-inheritable, dup2() makes the
+                    # copy inheritable.
+                    file_actions.append((os.POSIX_SPAWN_DUP2, child, fd, ))
+                elif DEVNULL == how:
+                    file_actions.append(
+                        (os.POSIX_SPAWN_OPEN, fd, os.devnull,
+                         os.O_RDONLY if 0 == fd else os.O_WRONLY, 0, ))
+            self.pid = os.posix_spawnp(
+                cmd[0], cmd, os.environ if env is None else env,
+                file_actions=file_actions, setsid=True)
+        except BaseException:
+            for fd in child_fds + [x for i, x in parent_fds]:
+                os.close(fd)
+            raise
+        for fd in child_fds:
+            os.close(fd)
+        for fd, parent in parent_fds:
+            if 0 == fd:
+                self.stdin = io.open(parent, 'wb', buffering=0)
+            elif 1 == fd:
+                self.stdout = io.open(parent, 'rb', buffering=0)
+            else:
+                self.stderr = io.open(parent, 'rb', buffering=0)
+
+    def poll(self):
+        if self.returncode is None:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if 0 != pid:
+                self.returncode = _status_to_returncode(status)
+        return self.returncode
+
+    def wait(self):
+        if self.returncode is None:
+            pid, status = os.waitpid(self.pid, 0)
+            self.returncode = _status_to_returncode(status)
+        return self.returncode
+
+    def kill(self):
+        if self.returncode is None:
+            os.kill(self.pid, signal.SIGKILL)
+
+
+class CommandTimeoutError(RuntimeError):
+    """Raised when a command does not terminate in time.
+
+    The command and its process group have been killed by the time this
+    exception is raised.
+
+    :ivar cmd: the command that timed out.
+    :ivar timeout: the timeout, in seconds.
+    :ivar returncode: the exit status of the killed command.
+    :ivar out: the output collected before the timeout expired (`None` when
+        the output was streamed, see :py:class:`CommandStream`).
+    :ivar err: the error output collected before the timeout expired.
+    """
+
+    def __init__(self, cmd, timeout, returncode, out=None, err=None):
+        super(CommandTimeoutError, self).__init__(
+            "Command `{}' timed out after {} seconds"
+            .format(' '.join(cmd), timeout))
+        self.cmd = cmd
+        self.timeout = timeout
+        self.returncode = returncode
+        self.out = out
+        self.err = err
+
+
+class CommandStream(object):
+    """Runs a command and yields its output as it arrives.
+
+    Iterating over an instance yields ``(name, data)`` tuples, where `name`
+    is either ``'stdout'`` or ``'stderr'``, until the command terminates.
+    Its exit status is then available from the :py:attr:`returncode`
+    attribute.
+
+    :param input: data written to the command standard input (which is
+        closed afterwards).
+    :param bool binary: whether to yield raw `bytes` rather than decoded
+        strings (output is never decoded with Python 2).
+    :param bool lines: whether to yield complete lines (with their line
+        terminator) instead of chunks of arbitrary size.
+    :param str encoding: the encoding of the command output (defaults to the
+        preferred encoding).
+    :param float timeout: the number of seconds the command is given to
+        terminate. Once elapsed, iterating raises
+        :py:class:`CommandTimeoutError`.
+    :param stdin: what to connect the command standard input to, when no
+        `input` is given: `None` (the standard input of the current process)
+        or :py:data:`DEVNULL`.
+    :param stdout: what to do with the command standard output:
+        :py:data:`PIPE` (capture it), :py:data:`DEVNULL` (discard it) or
+        `None` (leave it to the standard output of the current process).
+    :param stderr: what to do with the command error output (same values as
+        for `stdout`).
+    :param env: the environment of the command, defaults to the environment
+        of the current process (which is then inherited, not copied).
+
+    Commands are started with :py:func:`os.posix_spawnp` where available,
+    which is substantially cheaper than :py:class:`subprocess.Popen`,
+    especially when running commands at a high rate. Pipes are only created
+    for the captured streams.
+
+    The command is started in its own session (thus its own process group),
+    which is killed as a whole upon timeout or :py:meth:`close`: first with
+    SIGTERM, then with SIGKILL if the command lingers.
+
+    Output is decoded incrementally, thus a multi-byte character split over
+    two chunks is not mangled. Only the data not yet yielded is kept in
+    memory.
+
+    Once the command has terminated, :py:meth:`result` builds a
+    :py:class:`CommandResult` carrying its timings and resource usage.
+    """
+
+    def __init__(self, cmd, input=None, binary=False, lines=False,
+                 encoding=None, env=None, timeout=None, stdin=None,
+                 stdout=PIPE, stderr=PIPE):
+        self.cmd = cmd
+        self.returncode = None
+        self.timeout = timeout
+        self.wall_time = None
+        self.first_byte_time = None
+        self.rusage = None
+        """The resource usage of the command, once it terminated."""
+        self._lines = lines
+        self._binary = binary or (3, 0, 0, ) > sys.version_info
+        encoding = encoding or _ENCODING
+        if isinstance(input, type('')):
+            input = input.encode(encoding)
+        self._input = memoryview(input or b'')
+        self._input_offset = 0
+        self._rusage_before = None
+        if not hasattr(os, 'wait4') and resource is not None:
+            self._rusage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        if input is not None:
+            stdin = PIPE
+        self._proc = self._spawn(cmd, env, stdin, stdout, stderr)
+        self._start = time.time()
+        self._deadline = None
+        if timeout is not None:
+            self._deadline = self._start + timeout
+        self._names = {}
+        for name in (_STDOUT, _STDERR, ):
+            f = getattr(self._proc, name)
+            if f is not None:
+                self._names[f.fileno()] = name
+        self._decoders = {}
+        self._pending = {}
+        for name in (_STDOUT, _STDERR, ):
+            self._pending[name] = b'' if self._binary else ''
+            if not self._binary:
+                self._decoders[name] = \
+                    codecs.getincrementaldecoder(encoding)()
+
+    @classmethod
+    def _spawn(cls, cmd, env, stdin, stdout, stderr):
+        global _HAVE_POSIX_SPAWN
+        if _HAVE_POSIX_SPAWN:
+            try:
+                return _SpawnedProcess(cmd, env, stdin, stdout, stderr)
+            except NotImplementedError:
+                # The platform cannot start the child in a new session.
+                _HAVE_POSIX_SPAWN = False
+
+        kwargs = {}
+        if (3, 2, 0, ) <= sys.version_info:
+            kwargs['start_new_session'] = True
+        else:
+            kwargs['preexec_fn'] = os.setsid
+        devnull = None
+        if DEVNULL in (stdin, stdout, stderr, ) \
+                and not hasattr(subprocess, 'DEVNULL'):
+            devnull = os.open(os.devnull, os.O_RDWR)
+            stdin, stdout, stderr = [devnull if DEVNULL == x else x
+                                     for x in (stdin, stdout, stderr, )]
+        try:
+            return subprocess.Popen(cmd, env=env, stdin=stdin,
+                                    stdout=stdout, stderr=stderr, **kwargs)
+        finally:
+            if devnull is not None:
+                os.close(devnull)
+
+    @property
+    def pid(self):
+        return self._proc.pid
+
+    def __iter__(self):
+        proc = self._proc
+        selector = _Selector()
+        try:
+            for fd in self._names:
+                selector.register(fd, _EVENT_READ)
+            if proc.stdin is not None:
+                if len(self._input):
+                    selector.register(proc.stdin.fileno(), _EVENT_WRITE)
+                else:
+                    proc.stdin.close()
+
+            while selector.get_map():
+                remaining = None
+                if self._deadline is not None:
+                    remaining = self._deadline - time.time()
+                    if 0 >= remaining:
+                        self._kill_group()
+                        raise CommandTimeoutError(self.cmd, self.timeout,
+                                                  self.returncode)
+                for key, events in selector.select(remaining):
+                    fd = key.fd
+                    # Dispatch on what was registered: a hang-up is reported
+                    # as both readable and writable.
+                    if key.events & _EVENT_WRITE:
+                        written = self._write_input(fd)
+                        if (written is None
+                                or len(self._input) <= self._input_offset):
+                            selector.unregister(fd)
+                            proc.stdin.close()
+                        continue
+                    data = os.read(fd, _CHUNK_SIZE)
+                    name = self._names[fd]
+                    if not data:
+                        selector.unregister(fd)
+                    elif self.first_byte_time is None:
+                        self.first_byte_time = time.time() - self._start
+                    for chunk in self._feed(name, data, final=not data):
+                        yield name, chunk
+        finally:
+            selector.close()
+
+        for f in (proc.stdout, proc.stderr, ):
+            if f is not None:
+                f.close()
+        remaining = None
+        if self._deadline is not None:
+            remaining = max(0, self._deadline - time.time())
+        if not self._wait(remaining):
+            self._kill_group()
+            raise CommandTimeoutError(self.cmd, self.timeout, self.returncode)
+        self.returncode = self._reap()
+
+    def result(self, out, err):
+        """Returns a :py:class:`CommandResult` for the terminated command,
+        with the given output."""
+        user_time = system_time = max_rss = None
+        if self.rusage is not None:
+            user_time = self.rusage.ru_utime
+            system_time = self.rusage.ru_stime
+            max_rss = self.rusage.ru_maxrss
+        return CommandResult(self.returncode, out, err,
+                             wall_time=self.wall_time,
+                             first_byte_time=self.first_byte_time,
+                             user_time=user_time,
+                             system_time=system_time,
+                             max_rss=max_rss)
+
+    def _reap(self, block=True):
+        """Collects the exit status and resource usage of the command.
+
+        :returns: the exit status of the command, `None` if it is still
+            running and `block` is `False`.
+        """
+        proc = self._proc
+        if proc.returncode is not None:
+            return proc.returncode
+        if hasattr(os, 'wait4'):
+            try:
+                pid, status, rusage = os.wait4(proc.pid,
+                                               0 if block else os.WNOHANG)
+            except OSError as e:
+                if errno.ECHILD != e.errno:
+                    raise
+                # Reaped behind our back (e.g. SIGCHLD is ignored): the
+                # status is lost, and waiting again would fail the same way.
+                proc.returncode = _UNKNOWN_RETURNCODE
+                return proc.returncode
+            if 0 == pid:
+                return None
+            self.wall_time = time.time() - self._start
+            self.rusage = rusage
+            proc.returncode = _status_to_returncode(status)
+            return proc.returncode
+
+        returncode = proc.wait() if block else proc.poll()
+        if returncode is not None:
+            self.wall_time = time.time() - self._start
+            if self._rusage_before is not None:
+                before = self._rusage_before
+                after = resource.getrusage(resource.RUSAGE_CHILDREN)
+                self.rusage = after.__class__((
+                    after.ru_utime - before.ru_utime,
+                    after.ru_stime - before.ru_stime,
+                    after.ru_maxrss) + tuple(after[3:]))
+        return returncode
+
+    def communicate(self):
+        """Runs the command to completion and returns its ``(out, err)``
+        output.
+
+        On timeout, the :py:class:`CommandTimeoutError` raised carries the
+        output collected until then. Should anything else interrupt it (e.g.
+        :py:exc:`KeyboardInterrupt`, which does not reach the command in its
+        own session), the command is killed.
+        """
+        outputs = {_STDOUT: [], _STDERR: []}
+        try:
+            for name, data in self:
+                outputs[name].append(data)
+        except CommandTimeoutError as e:
+            e.out, e.err = self._join(outputs)
+            raise
+        except BaseException:
+            self.close()
+            raise
+        return self._join(outputs)
+
+    def _join(self, outputs):
+        empty = b'' if self._binary else ''
+        return (empty.join(outputs[_STDOUT]), empty.join(outputs[_STDERR]), )
+
+    def _wait(self, timeout=None):
+        """Waits for the command to exit, at most `timeout` seconds.
+
+        :returns: whether the command exited.
+        """
+        if timeout is None:
+            self._reap()
+            return True
+        deadline = time.time() + timeout
+        while self._reap(block=False) is None:
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _signal_group(self, signum):
+        try:
+            os.killpg(self._proc.pid, signum)
+        except OSError as e:
+            if errno.ESRCH != e.errno:
+                raise
+
+    def _kill_group(self):
+        """Terminates the process group of the command."""
+        self._signal_group(signal.SIGTERM)
+        self._wait(_KILL_GRACE)
+        # Also kills whatever the command may have left behind.
+        self._signal_group(signal.SIGKILL)
+        for f in (self._proc.stdin, self._proc.stdout, self._proc.stderr, ):
+            if f is not None:
+                f.close()
+        self.returncode = self._reap()
+
+    def _write_input(self, fd):
+        # Sliced from a memoryview: the remaining input is not copied.
+        offset = self._input_offset
+        try:
+            written = os.write(fd, self._input[offset:offset
+                                               + select.PIPE_BUF])
+        except OSError as e:
+            if errno.EPIPE == e.errno:
+                return None  # The command does not want more input.
+            raise
+        self._input_offset += written
+        return written
+
+    def _feed(self, name, data, final=False):
+        """Decodes `data` and splits it into lines if necessary."""
+        if not self._binary:
+            data = self._decoders[name].decode(data, final)
+        if not self._lines:
+            if data:
+                yield data
+            return
+        data = self._pending[name] + data
+        newline = b'\n' if self._binary else '\n'
+        start = 0
+        end = data.find(newline)
+        while -1 != end:
+            yield data[start:end + 1]
+            start = end + 1
+            end = data.find(newline, start)
+        self._pending[name] = data[start:]
+        if final and self._pending[name]:
+            yield self._pending[name]
+            self._pending[name] = data[:0]
+
+    def close(self):
+        """Kills the command if it is still running."""
+        if self._reap(block=False) is None:
+            self._kill_group()
+        for f in (self._proc.stdin, self._proc.stdout, self._proc.stderr, ):
+            if f is not None:
+                f.close()
+        self.returncode = self._reap()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def run_batch(func, calls, max_workers=None, stop=None):
+    """Calls `func` once for each tuple of arguments in `calls`,
+    concurrently from up to `max_workers` threads (defaults to the number of
+    CPUs).
+
+    :param stop: an optional callable, given each result as it comes. When it
+        returns `True` the calls not yet started are cancelled.
+
+    :returns: a list of ``(result, elapsed)`` tuples, in the order of
+        `calls`, where `elapsed` is the duration of the call in seconds.
+        Cancelled calls are reported as `None`.
+
+    If any of the calls raises an exception, the calls not yet started are
+    cancelled and the first exception raised is re-raised once all the
+    threads are done.
+    """
+    calls = list(calls)
+    results = [None] * len(calls)
+    errors = []
+    pending = iter(range(0, len(calls)))
+    lock = threading.Lock()
+    state = {'cancelled': False}
+
+    def worker():
+        while True:
+            with lock:
+                if state['cancelled']:
+                    return
+                index = next(pending, None)
+            if index is None:
+                return
+            start = time.time()
+            try:
+                result = func(*calls[index])
+            except Exception:
+                with lock:
+                    state['cancelled'] = True
+                    errors.append(sys.exc_info())
+                return
+            results[index] = (result, time.time() - start, )
+            if stop is not None and stop(result):
+                with lock:
+                    state['cancelled'] = True
+
+    count = min(max_workers or cpu_count(), len(calls))
+    threads = [threading.Thread(target=worker) for i in range(0, count)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        exc_type, exc, tb = errors[0]
+        raise exc
+    return results
+
+
+_FRAME = """printf '\\n{marker}:begin:{index}\\n'
+printf '\\n{marker}:begin:{index}\\n' >&2
+( {cmd}
+) </dev/null
+printf '\\n{marker}:end:{index}:%d\\n' $?
+printf '\\n{marker}:end:{index}\\n' >&2
+"""
+
+
+def _shell_join(cmd):
+    """Returns the command `cmd` as a string for a POSIX shell: `cmd` is
+    returned as is if it already is a string, otherwise its items are
+    quoted."""
+    if isinstance(cmd, (type(''), str, )):
+        return cmd
+    return ' '.join(quote(x) for x in cmd)
+
+
+def _frame_commands(cmds, marker=None):
+    """Builds a shell script that runs each of the `cmds` in turn, framing
+    their output between markers (see :py:func:`_split_framed`).
+
+    Each command is a string (interpreted by the shell), or a list of
+    arguments (which are quoted). Commands are run in a sub-shell, with
+    their standard input connected to :file:`/dev/null` so that they can not
+    swallow the rest of the script.
+
+    :returns: a ``(marker, script)`` tuple.
+    """
+    if marker is None:
+        marker = 'ssh-harness-{}'.format(uuid.uuid4().hex)
+    script = []
+    for index, cmd in enumerate(cmds):
+        script.append(_FRAME.format(marker=marker, index=index,
+                                    cmd=_shell_join(cmd)))
+    return marker, ''.join(script)
+
+
+def _split_framed(marker, count, out, err):
+    """Splits the output of a script built by :py:func:`_frame_commands`.
+
+    :returns: a list of `count` :py:class:`CommandResult`, `None` for each
+        command which did not terminate (e.g. the connection was lost).
+    """
+    marker = re.escape(marker)
+    out_re = re.compile(r'\n{m}:begin:(\d+)\n(.*?)\n{m}:end:\1:(\d+)\n'
+                        .format(m=marker), re.S)
+    err_re = re.compile(r'\n{m}:begin:(\d+)\n(.*?)\n{m}:end:\1\n'
+                        .format(m=marker), re.S)
+    errors = dict((int(i), data, ) for i, data in err_re.findall(err))
+    results = [None] * count
+    for index, data, status in out_re.findall(out):
+        index = int(index)
+        results[index] = CommandResult(int(status), data,
+                                       errors.get(index, err[:0]))
+    return results
+
+
+# vim: syntax=python:sws=4:sw=4:et:
@@ -1,3 +1,4 @@
-from .backupeditandrestore import BackupEditAndRestore
+from .backupeditandrestore import BackupEditAndRestore, SnapshotAndRestore
 from .iocapture import IOCapture
+from .logcapture import LogCapture
 from .inthrowabletempdir import InThrowableTempDir
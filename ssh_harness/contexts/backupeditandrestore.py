@@ -16,15 +16,34 @@
 #  You should have received a copy of the GNU General Public License
 #  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
 #
+import errno
 import os
 from gettext import lgettext as _
 import shutil
+try:
+    import fcntl
+except ImportError:  # Not a POSIX platform.
+    fcntl = None
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:
+    ctypes = None
 
 
 __all__ = [
     'BackupEditAndRestore',
+    'SnapshotAndRestore',
+    'clone_entries',
     ]
 
+_FICLONE = 0x40049409
+"""Linux :manpage:`ioctl(2)` request that clones (reflinks) a whole file."""
+
+_AT_FDCWD = -100
+_RENAME_EXCHANGE = 2
+"""Linux :manpage:`renameat2(2)` constants used to swap two directories."""
+
 
 def _move(src, dst):
     """Wrapper around :py:func:`os.rename` that handles some issues on
@@ -37,6 +56,169 @@ def _move(src, dst):
         os.rename(src, dst)
 
 
+def _exchange(a, b):
+    """Atomically swaps paths `a` and `b`, if the platform can.
+
+    Relies on the Linux :manpage:`renameat2(2)` system call. Returns `True`
+    if the paths were swapped, `False` if the platform lacks the mean to do
+    it (in which case nothing happened).
+    """
+    if ctypes is None:
+        return False
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        renameat2 = libc.renameat2
+    except (AttributeError, OSError, TypeError):
+        return False
+    # Python 2 paths already are bytes.
+    encode = getattr(os, 'fsencode', lambda x: x)
+    res = renameat2(_AT_FDCWD, encode(a), _AT_FDCWD, encode(b),
+                    _RENAME_EXCHANGE)
+    if 0 == res:
+        return True
+    err = ctypes.get_errno()
+    if err in (errno.ENOSYS, errno.EINVAL):
+        return False  # Old kernel or file-system without support for it.
+    raise OSError(err, os.strerror(err), a)
+
+
+def _reflink(src, dst):
+    """Clones file `src` as `dst`, the two sharing their data blocks until
+    either of them is modified (copy-on-write).
+
+    Raises :py:exc:`OSError` (or :py:exc:`IOError`) if the file-system does
+    not support it."""
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks are not supported', src)
+    with open(src, 'rb') as s:
+        with open(dst, 'wb') as d:
+            try:
+                fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+            except (IOError, OSError):
+                os.unlink(dst)
+                raise
+    shutil.copystat(src, dst)
+
+
+def _clone_file(src, dst, method='auto'):
+    """Clones the regular file `src` as `dst` using `method`.
+
+    :param str method: one of 'reflink', 'link', 'copy' or 'auto' (see
+        :py:func:`_clone_tree`).
+    :returns: the name of the method actually used.
+    """
+    if method in ('auto', 'reflink'):
+        try:
+            _reflink(src, dst)
+            return 'reflink'
+        except (IOError, OSError):
+            if 'reflink' == method:
+                raise
+    elif 'link' == method:
+        os.link(src, dst)
+        return 'link'
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def _clone_tree(src, dst, method='auto'):
+    """Recreates the directory tree `src` as `dst`.
+
+    :param str method: how to clone regular files:
+
+        - ``'reflink'``: copy-on-write clones, fails if the file-system
+          does not support it;
+        - ``'link'``: hard-links, only safe if files are later replaced
+          (renamed over) rather than modified in place;
+        - ``'copy'``: plain copies;
+        - ``'auto'``: reflinks when possible, copies otherwise.
+
+    :returns: the name of the method used for the last file cloned.
+
+    Symbolic links are recreated as such, other special files are ignored.
+    Directories modes and times are applied once they are populated (so that
+    read-only directories can be cloned).
+
+    Fails if `dst` already exists. Otherwise, should cloning fail, the
+    partial clone is removed.
+    """
+    os.mkdir(dst)
+    try:
+        used = clone_entries(src, dst, method)
+        shutil.copystat(src, dst)
+    except BaseException:
+        shutil.rmtree(dst, ignore_errors=True)
+        raise
+    return used
+
+
+def clone_entries(src, dst, method='auto'):
+    """Clones the content of the directory `src` into the existing directory
+    `dst`.
+
+    :param str method: how to clone regular files: ``'reflink'``,
+        ``'link'``, ``'copy'`` or ``'auto'`` (see :py:func:`_clone_tree`).
+    :returns: the name of the method used for the last file cloned.
+    """
+    used = method
+    for name in os.listdir(src):
+        s = os.path.join(src, name)
+        d = os.path.join(dst, name)
+        if os.path.islink(s):
+            os.symlink(os.readlink(s), d)
+        elif os.path.isdir(s):
+            used = _clone_tree(s, d, method)
+        elif os.path.isfile(s):
+            used = _clone_file(s, d, method)
+        if 'auto' == method and 'copy' == used:
+            # Reflinks failed once, they will fail for the remaining files.
+            method = 'copy'
+    return used
+
+
+def _same_file(a, b):
+    """Tells whether the files `a` and `b` can be considered identical
+    without reading them."""
+    sa, sb = os.lstat(a), os.lstat(b)
+    if (sa.st_dev, sa.st_ino) == (sb.st_dev, sb.st_ino):
+        return True  # Hard-links
+    return (sa.st_mode == sb.st_mode
+            and sa.st_size == sb.st_size
+            and sa.st_mtime == sb.st_mtime)
+
+
+def _rollback_tree(snapshot, path):
+    """Brings the tree `path` back to the state recorded in `snapshot`
+    touching only the entries that differ.
+
+    Entries of `snapshot` are moved into `path`, thus `snapshot` is
+    consumed by the operation."""
+    snapshot_names = set(os.listdir(snapshot))
+    for name in os.listdir(path):
+        if name in snapshot_names:
+            continue
+        p = os.path.join(path, name)
+        if os.path.isdir(p) and not os.path.islink(p):
+            shutil.rmtree(p)
+        else:
+            os.unlink(p)
+
+    for name in snapshot_names:
+        s = os.path.join(snapshot, name)
+        p = os.path.join(path, name)
+        if not os.path.lexists(p):
+            os.rename(s, p)
+        elif (os.path.isdir(s) and not os.path.islink(s)
+              and os.path.isdir(p) and not os.path.islink(p)):
+            _rollback_tree(s, p)
+        elif not _same_file(s, p):
+            if os.path.isdir(p) and not os.path.islink(p):
+                shutil.rmtree(p)
+            _move(s, p)
+    shutil.copystat(snapshot, path)
+    shutil.rmtree(snapshot)
+
+
 class BackupEditAndRestore(object):
     """Open a file for edition but creates a backup copy first.
 
@@ -47,6 +229,11 @@ class BackupEditAndRestore(object):
     :param str context: the context keywork lets you partition the set of
         files you back-up (see methods :py:meth:`clear` and
         :py:meth:`clear_context`)
+    :param bool backup: whether to back the file up (default is `True`).
+        Set it to `False` when the file is already safe-guarded by other
+        means (e.g. a :py:class:`SnapshotAndRestore` of its directory): the
+        file is still atomically edited, but it is not registered in
+        :param:`context` and cannot be restored.
 
     Additionnaly keyword arguments accepted by the :py:func:`open` function
     are accepted, with some restriction on mode (see. note
@@ -87,11 +274,14 @@ class BackupEditAndRestore(object):
     _contexts = {}
     """Stores contexts """
 
-    def __init__(self, context, path, mode='a', suffix=None, **kwargs):
+    def __init__(self, context, path, mode='a', suffix=None, backup=True,
+                 **kwargs):
         check_mode = (mode * 1).replace('U', 'r').replace('rr', 'r')
         if 'r' == check_mode[0] and '+' not in check_mode:
             raise ValueError('Wrong file opening mode: {}'.format(mode))
-        self.__class__._register(context, path, self)
+        self._backup = backup
+        if backup is True:
+            self.__class__._register(context, path, self)
 
         self._path = path
         self._suffix = suffix or self.__class__._SUFFIX
@@ -117,7 +307,8 @@ class BackupEditAndRestore(object):
         try:
             self._f = open(self._new_path, **kwargs)
         except IOError as e:
-            self.__class__._unregister(context, path, self)
+            if backup is True:
+                self.__class__._unregister(context, path, self)
             raise e
         # super(BackupEditAndRestore, self).__init__(self._new_path, **kwargs)
 
@@ -130,7 +321,7 @@ class BackupEditAndRestore(object):
         self._have_backup = False
         self._f.__enter__()
 
-        if os.path.isfile(self._path):
+        if self._backup is True and os.path.isfile(self._path):
             shutil.copy(self._path, self._backup_path)
             self._have_backup = True
         return self
@@ -157,6 +348,9 @@ class BackupEditAndRestore(object):
         if self._restored is True:
             # TODO raise an exception.
             return
+        if self._backup is False:
+            raise RuntimeError(_("File `{}' was edited without back-up, it"
+                                 " cannot be restored!").format(self._path))
 
         if self._have_backup is True:
             _move(self._backup_path, self._path)
@@ -219,4 +413,160 @@ class BackupEditAndRestore(object):
         """
         cls._contexts[context][path].restore()
 
+
+class SnapshotAndRestore(object):
+    """Snapshots a whole directory tree to restore it later on, at once.
+
+    :param str context: the context in which register the snapshot (see
+        :py:class:`BackupEditAndRestore`, the snapshot is restored by
+        :py:meth:`BackupEditAndRestore.clear_context` as any other backup
+        of the context).
+    :param str path: the path to the directory to snapshot (symbolic links
+        are resolved: the directory they point to is the one snapshot).
+    :param str method: how files are captured: 'reflink', 'link', 'copy' or
+        'auto' (the default: reflink where the file-system supports it,
+        copy otherwise).
+    :param str suffix: the suffix appended to :param:`path` to name the
+        snapshot (default is 'snapshot').
+
+    Rather than backing-up each file you modify in a directory, you capture
+    the whole directory once, when entering the context. The snapshot is a
+    sibling of :param:`path` (so both are on the same file-system), made of
+    reflinks, hard-links or copies of the original files.
+
+    Restoring swaps the snapshot and the directory (atomically on Linux, with
+    two renames elsewhere). Should the directory not be renamable, the
+    directory is rolled back by only replacing the entries that differ from
+    the snapshot.
+
+    A snapshot left behind by a process that did not get to restore it makes
+    entering the context fail; :py:meth:`recover` restores it beforehand.
+
+    :Example:
+
+        with SnapshotAndRestore('context', './my-dir', 'link'):
+            pass
+        with BackupEditAndRestore('context', './my-dir/my-precious', 'a',
+                                  backup=False) as f:
+            f.write(data)
+
+        # Do something ...
+
+        BackupEditAndRestore.clear_context('context')
+
+    .. warning::
+
+       The 'link' method is only safe if files in the directory are replaced
+       (e.g. with :py:class:`BackupEditAndRestore`) rather than modified in
+       place: an in-place modification would alter the snapshot too.
+    """
+
+    _SUFFIX = 'snapshot'
+
+    _METHODS = ('auto', 'reflink', 'link', 'copy', )
+
+    def __init__(self, context, path, method='auto', suffix=None):
+        if method not in self.__class__._METHODS:
+            raise ValueError('Wrong snapshot method: {}'.format(method))
+        # Swapping a symbolic link with the snapshot would leave the directory
+        # it points to untouched: work on the directory itself.
+        path = os.path.realpath(os.path.abspath(path))
+        BackupEditAndRestore._register(context, path, self)
+
+        self._path = path
+        self._method = method
+        self._suffix = suffix or self.__class__._SUFFIX
+        self._snapshot_path = '{}.{}'.format(self._path, self._suffix)
+        self._trash_path = '{}.old-{}'.format(self._path, self._suffix)
+
+        # Some flags used to know where we're at.
+        self._entered = False
+        self._have_snapshot = None
+        self._restored = False
+        self._context = context
+        self.method_used = None
+        """Name of the method actually used to take the snapshot."""
+
+    @property
+    def path(self):
+        """Path to the directory being snapshot."""
+        return self._path
+
+    def __enter__(self):
+        if self._entered is True:
+            raise RuntimeError(
+                "You cannot re-use a {} context manager (recursivelly or "
+                "otherwise)".format(self.__class__.__name__))
+        self._entered = True
+        self._have_snapshot = False
+
+        if os.path.isdir(self._path):
+            try:
+                self.method_used = _clone_tree(self._path,
+                                               self._snapshot_path,
+                                               self._method)
+            except (IOError, OSError):
+                # The snapshot path is only removed by _clone_tree if it
+                # created it: an existing one is not ours to delete.
+                BackupEditAndRestore._unregister(self._context, self._path,
+                                                 self)
+                raise
+            self._have_snapshot = True
+        return self
+
+    def __exit__(self, *args):
+        # Changes made to the directory stick until it is restored.
+        return False
+
+    def restore(self):
+        """Restores the directory to its state at the time of the snapshot.
+
+        If it did not exist then it is removed, otherwise it is replaced by
+        the snapshot."""
+        if self._restored is True:
+            return
+
+        if self._have_snapshot is None:
+            pass  # Context never entered: there is nothing to restore.
+        elif self._have_snapshot is True:
+            self._put_back()
+        elif os.path.isdir(self._path):
+            shutil.rmtree(self._path)
+        self._restored = True
+        BackupEditAndRestore._unregister(self._context, self._path, self)
+
+    def recover(self):
+        """Restores a snapshot left behind by a previous run, if any.
+
+        Must be called before entering the context. Returns True if a stale
+        snapshot was found (and the directory put back in its state), False
+        otherwise."""
+        if self._entered is True:
+            raise RuntimeError("Cannot recover a snapshot once the context "
+                               "has been entered")
+        if os.path.isdir(self._snapshot_path):
+            self._put_back()
+            return True
+        if os.path.isdir(self._trash_path):
+            # Interrupted after the snapshot was moved back in place.
+            shutil.rmtree(self._trash_path)
+            return True
+        return False
+
+    def _put_back(self):
+        """Replaces the directory with the snapshot."""
+        if not os.path.isdir(self._path):
+            os.rename(self._snapshot_path, self._path)
+        elif _exchange(self._snapshot_path, self._path):
+            shutil.rmtree(self._snapshot_path)
+        else:
+            try:
+                os.rename(self._path, self._trash_path)
+            except OSError:
+                # E.g. a mount point: fall back to fixing the differences.
+                _rollback_tree(self._snapshot_path, self._path)
+            else:
+                os.rename(self._snapshot_path, self._path)
+                shutil.rmtree(self._trash_path)
+
 # vim: syntax=python:sws=4:sw=4:et:
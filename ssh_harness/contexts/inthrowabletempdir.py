@@ -16,10 +16,60 @@
 #  You should have received a copy of the GNU General Public License
 #  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
 #
+import atexit
 import os
 import shutil
-from tempfile import mkdtemp
+from tempfile import gettempdir, mkdtemp
+import threading
 import warnings
+try:
+    from queue import Queue
+except ImportError:  # Python 2
+    from Queue import Queue
+
+from .backupeditandrestore import clone_entries
+
+
+def _ignore(f, p, e):
+    pass
+
+
+class _Worker(object):
+    """Runs chores (e.g. removing directory trees) on a background thread.
+
+    The thread is started on demand, and the chores still pending are
+    completed before the interpreter exits.
+    """
+
+    def __init__(self):
+        self._queue = Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        atexit.register(self.drain)
+
+    def put(self, func, *args):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        self._queue.put((func, args, ))
+
+    def _run(self):
+        while True:
+            func, args = self._queue.get()
+            try:
+                func(*args)
+            except Exception as e:
+                warnings.warn("Background chore failed: {}".format(e),
+                              RuntimeWarning)
+            finally:
+                self._queue.task_done()
+
+    def drain(self):
+        """Waits for all the pending chores to be done."""
+        if self._thread is not None:
+            self._queue.join()
 
 
 class InThrowableTempDir(object):
@@ -27,10 +77,58 @@ class InThrowableTempDir(object):
     Context manager that puts your program in a pristine temporary directory
     upon entry and puts you back where you were upon exit. It also cleans
     the temporary directory
+
+    :param bool background: when `True`, upon exit, the temporary directory
+        is renamed and then removed by a background thread, instead of being
+        removed before leaving the context. Use :py:meth:`drain` to wait for
+        the removals to be done (they are at the latest when the interpreter
+        exits).
+    :param str template: path to a directory the content of which is cloned
+        into the temporary directory upon its creation.
+    :param str template_method: how the files of :param:`template` are
+        cloned: ``'reflink'`` (copy-on-write clones), ``'link'`` (hard-links,
+        thus files must not be modified in place), ``'copy'`` or ``'auto'``
+        (reflinks when the file-system supports them, copies otherwise).
+
+    Temporary directories can be created beforehand with
+    :py:meth:`prefill`, for the ones with the same :param:`suffix`,
+    :param:`prefix` and :param:`dir` to be ready for use.
     """
 
-    def __init__(self, suffix='', prefix='throw-', dir=None):
-        if dir is not None and not os.path.isdir(dir):
+    _TRASH_SUFFIX = '.trash'
+
+    _worker = _Worker()
+
+    _pool = {}
+    """Directories created in advance, by (suffix, prefix, dir)."""
+
+    _pool_sizes = {}
+    """The number of directories to keep in each pool, when refilled."""
+
+    _pool_lock = threading.Lock()
+
+    def __init__(self, suffix='', prefix='throw-', dir=None,
+                 background=False, template=None, template_method='auto'):
+        dir = self.__class__._prepare_dir(dir)
+        self._background = background
+        self._dir = self.__class__._draw(suffix, prefix, dir)
+        if self._dir is None:
+            self._dir = mkdtemp(suffix=suffix, prefix=prefix, dir=dir)
+        self._oldpwd = None
+        self.method_used = None
+        if template is not None:
+            try:
+                self.method_used = clone_entries(template, self._dir,
+                                                 template_method)
+            except Exception:
+                shutil.rmtree(self._dir, ignore_errors=False, onerror=_ignore)
+                raise
+
+    @classmethod
+    def _prepare_dir(cls, dir):
+        if dir is None:
+            return gettempdir()
+        if not os.path.isdir(dir):
             # mkdtemp fails with OSError if :param:`dir` does not exists.
 
             # Py3 uses 0o700 for octal not plain 0700 (where the fuck did
@@ -41,9 +139,73 @@ class InThrowableTempDir(object):
         # if given a relative path as its :param:`dir` keyword-argument.
         # It is important to prevent removing a directory that is not the
         # one we intended to when exiting the context manager.
-        dir = os.path.abspath(dir)
-        self._dir = mkdtemp(suffix=suffix, prefix=prefix, dir=dir)
-        self._oldpwd = None
+        return os.path.abspath(dir)
+
+    @classmethod
+    def _draw(cls, suffix, prefix, dir):
+        """Returns a directory from the pool (`None` if it is empty)."""
+        key = (suffix, prefix, dir, )
+        with cls._pool_lock:
+            pool = cls._pool.get(key)
+            if not pool:
+                return None
+            path = pool.pop()
+        if key in cls._pool_sizes:
+            cls._worker.put(cls._refill, key)
+        return path
+
+    @classmethod
+    def _refill(cls, key):
+        suffix, prefix, dir = key
+        while True:
+            with cls._pool_lock:
+                pool = cls._pool.setdefault(key, [])
+                if len(pool) >= cls._pool_sizes.get(key, 0):
+                    return
+            path = mkdtemp(suffix=suffix, prefix=prefix, dir=dir)
+            with cls._pool_lock:
+                pool.append(path)
+
+    @classmethod
+    def prefill(cls, count, suffix='', prefix='throw-', dir=None,
+                refill=False):
+        """Creates :param:`count` temporary directories in advance.
+
+        :param bool refill: whether to keep the pool filled, as its
+            directories are being used (the pool is then refilled in the
+            background).
+
+        Directories still unused when the interpreter exits are removed.
+        """
+        dir = cls._prepare_dir(dir)
+        key = (suffix, prefix, dir, )
+        with cls._pool_lock:
+            if refill is True:
+                cls._pool_sizes[key] = count
+            else:
+                cls._pool_sizes.pop(key, None)
+            pool = cls._pool.setdefault(key, [])
+            missing = count - len(pool)
+        for i in range(0, missing):
+            path = mkdtemp(suffix=suffix, prefix=prefix, dir=dir)
+            with cls._pool_lock:
+                pool.append(path)
+
+    @classmethod
+    def clear_pool(cls):
+        """Removes the directories of the pool."""
+        with cls._pool_lock:
+            cls._pool_sizes.clear()
+            paths = [x for pool in cls._pool.values() for x in pool]
+            cls._pool.clear()
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=False, onerror=_ignore)
+
+    @classmethod
+    def drain(cls):
+        """Waits for the directories removed in the background to be gone.
+        """
+        cls._worker.drain()
 
     @property
     def path(self):
@@ -73,16 +235,31 @@ class InThrowableTempDir(object):
     def __exit__(self, exc_type, exc_val, exc_tb):
         os.chdir(self._oldpwd)
 
-        def ignore(f, p, e):
-            pass
+        path = self._dir
+        if self._background is True:
+            # Renaming is cheap and makes the directory disappear at once.
+            trash = mkdtemp(suffix=self.__class__._TRASH_SUFFIX,
+                            prefix='.', dir=os.path.dirname(path))
+            try:
+                os.rename(path, os.path.join(trash, 'tree'))
+            except OSError:
+                os.rmdir(trash)
+            else:
+                self.__class__._worker.put(shutil.rmtree, trash, False,
+                                           _ignore)
+                path = None
 
-        shutil.rmtree(self._dir,
-                      ignore_errors=False,
-                      onerror=ignore)
+        if path is not None:
+            shutil.rmtree(path,
+                          ignore_errors=False,
+                          onerror=_ignore)
 
         if exc_type is not None:
             return False
         return True
 
 
+atexit.register(InThrowableTempDir.clear_pool)
+
+
 # vim: syntax=python:sws=4:sw=4:et:
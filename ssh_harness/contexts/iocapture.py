@@ -27,11 +27,538 @@ Here is an example
 
    w
 """
-from io import StringIO as MemoryIO
+import codecs
+from collections import deque
+import io
 from gettext import lgettext as _
+from locale import getpreferredencoding
+import mmap
 import os
 import sys
 from tempfile import TemporaryFile
+import threading
+import time
+try:
+    from contextvars import ContextVar
+except ImportError:  # Python < 3.7
+    ContextVar = None
+try:
+    import fcntl
+except ImportError:  # Not a POSIX platform.
+    fcntl = None
+
+from .logcapture import LogCapture
+
+_ENCODING = getpreferredencoding(do_setlocale=False)
+
+_F_SETPIPE_SZ = 1031
+"""Linux :manpage:`fcntl(2)` command to resize a pipe."""
+
+
+def _anonymous_file():
+    """Returns a binary file with no name on the file-system.
+
+    Uses :manpage:`memfd_create(2)` when available (the file then lives in
+    memory but can be swapped out) or a regular temporary file otherwise.
+    """
+    if hasattr(os, 'memfd_create'):
+        fd = os.memfd_create('iocpt-', getattr(os, 'MFD_CLOEXEC', 0))
+        return io.open(fd, 'w+b')
+    return TemporaryFile(mode='w+b', prefix='iocpt-')
+
+
+class CaptureBuffer(object):
+    """File-like object in which captured output is accumulated.
+
+    :param int max_memory: the amount of bytes the buffer holds in memory.
+        Once exceeded, the content spills to an anonymous file (see
+        :py:func:`_anonymous_file`). `None` (the default) means no limit and
+        0 means the buffer is a file from the start.
+    :param int ring: if not `None`, only the last :param:`ring` bytes
+        written are kept (the buffer then never spills to a file).
+    :param bool binary: whether the content is read back as bytes rather
+        than text.
+    :param str encoding: the encoding used to store text written to, and
+        decode the content read from, the buffer (default is the locale
+        preferred encoding).
+
+    Whatever the mode, the buffer accepts both text and bytes (which can also
+    be written to its :py:attr:`buffer` attribute, as with
+    :py:data:`sys.stdout`). Positions in the buffer are byte offsets from the
+    start of the output.
+
+    The :py:attr:`statistics` attribute lets you know how much output the
+    buffer received and when it spilled.
+    """
+
+    _CHUNK_SIZE = 65536
+
+    def __init__(self, max_memory=None, ring=None, binary=False,
+                 encoding=None):
+        if ring is not None and ring < 0:
+            raise ValueError(_("Wrong ring buffer size: {}").format(ring))
+        self._max_memory = max_memory
+        self._ring = ring
+        self._binary = binary
+        self.encoding = encoding or _ENCODING
+        self.errors = 'replace'
+        self._chunks = deque()
+        self._retained = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._memory = None
+        self.size = 0
+        """Amount of bytes written to the buffer so far."""
+        self.spilled_at = None
+        """The value of :py:attr:`size` when the buffer spilled to a file
+        (`None` until it does)."""
+        self.dropped = 0
+        """Amount of bytes discarded by the ring buffer."""
+
+        if ring is None:
+            if max_memory is not None and max_memory <= 0:
+                self._file = _anonymous_file()
+                self.spilled_at = 0
+            else:
+                self._memory = io.BytesIO()
+
+    @property
+    def buffer(self):
+        """The binary interface of the buffer (that is the buffer itself)."""
+        return self
+
+    @property
+    def name(self):
+        """The name of the file the buffer spilled into, if any."""
+        return getattr(self._file, 'name', None)
+
+    @property
+    def statistics(self):
+        """A :py:class:`dict` describing the buffer usage."""
+        return {
+            'size': self.size,
+            'in_memory': self._file is None,
+            'spilled_at': self.spilled_at,
+            'dropped': self.dropped,
+            }
+
+    def _decode(self, data):
+        if self._binary is True:
+            return data
+        return data.decode(self.encoding, self.errors)
+
+    def _spill(self):
+        f = _anonymous_file()
+        f.write(self._memory.getvalue())
+        self._memory.close()
+        self._memory = None
+        self._file = f
+        self.spilled_at = self.size
+
+    def write(self, data):
+        length = len(data)
+        if not isinstance(data, bytes):
+            data = data.encode(self.encoding)
+        with self._lock:
+            self._append(data)
+        return length
+
+    def _append(self, data):
+        """Appends bytes to the buffer. Must be called with the lock held."""
+        self.size += len(data)
+        if self._ring is not None:
+            self._write_ring(data)
+        elif self._file is not None:
+            self._file.write(data)
+        else:
+            self._memory.write(data)
+            if (self._max_memory is not None
+                    and self.size > self._max_memory):
+                self._spill()
+
+    def _write_ring(self, data):
+        self._chunks.append(data)
+        self._retained += len(data)
+        excess = self._retained - self._ring
+        while excess > 0:
+            head = self._chunks[0]
+            if len(head) <= excess:
+                self._chunks.popleft()
+                dropped = len(head)
+            else:
+                self._chunks[0] = head[excess:]
+                dropped = excess
+            self._retained -= dropped
+            self.dropped += dropped
+            excess -= dropped
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def isatty(self):
+        return False
+
+    def _read(self, offset, size=-1):
+        """Reads :param:`size` bytes (all if negative) from byte
+        :param:`offset`. Must be called with the lock held.
+
+        :returns: the data read and the offset it actually starts at (which
+            is greater than :param:`offset` if the data at
+            :param:`offset` was dropped from the ring buffer).
+        """
+        offset = max(offset, self.dropped)
+        if self._ring is not None:
+            data = b''.join(self._chunks)[offset - self.dropped:]
+            return (data if size < 0 else data[:size]), offset
+        f = self._memory if self._file is None else self._file
+        f.seek(offset, os.SEEK_SET)
+        data = f.read(size)
+        f.seek(0, os.SEEK_END)
+        return data, offset
+
+    def getvalue(self):
+        """Returns all the content held by the buffer."""
+        with self._lock:
+            if self._ring is None and self._file is None:
+                return self._decode(self._memory.getvalue())
+            return self._decode(self._read(0)[0])
+
+    def getbuffer(self):
+        """Returns a :py:class:`memoryview` on the content of the buffer at
+        the time of the call.
+
+        Once spilled to a file, the view maps the file rather than copying
+        it. Either way, holding the view does not prevent more output from
+        being written to the buffer.
+        """
+        with self._lock:
+            if self._ring is not None:
+                return memoryview(b''.join(self._chunks))
+            if self._file is None:
+                # Not BytesIO.getbuffer(): it forbids writes while exported.
+                return memoryview(self._memory.getvalue())
+            self._file.flush()
+            if 0 == self.size:
+                return memoryview(b'')
+            return memoryview(mmap.mmap(self._file.fileno(), 0,
+                                        access=mmap.ACCESS_READ))
+
+    def read_since(self, offset):
+        """Returns the output written since :param:`offset`.
+
+        Unlike :py:meth:`IOCapture.get_stdout` and such, this method can be
+        used while the output is being captured, to poll for new output.
+
+        :param int offset: a byte offset, as returned by a previous call (0
+            to start from the beginning).
+        :returns: a tuple made of the output and the offset to pass to the
+            next call. A character which bytes are not all written yet is
+            left for the next call.
+        """
+        with self._lock:
+            data, start = self._read(offset)
+        if self._binary is True:
+            return data, start + len(data)
+        decoder = codecs.getincrementaldecoder(self.encoding)(self.errors)
+        text = decoder.decode(data)
+        incomplete = decoder.getstate()[0]
+        return text, start + len(data) - len(incomplete)
+
+    def iterlines(self, offset=0):
+        """Iterates over the lines of output, starting at byte
+        :param:`offset`, reading the buffer piece by piece.
+
+        The last line is yielded even if it is not terminated.
+        """
+        pending = b''
+        while True:
+            with self._lock:
+                data, offset = self._read(offset, self._CHUNK_SIZE)
+            if not data:
+                break
+            offset += len(data)
+            lines = (pending + data).splitlines(True)
+            pending = lines.pop() if not lines[-1].endswith(b'\n') else b''
+            for line in lines:
+                yield self._decode(line)
+        if pending:
+            yield self._decode(pending)
+
+    def close(self):
+        for f in (self._file, self._memory):
+            if f is not None:
+                f.close()
+
+
+class TaggedCaptureBuffer(CaptureBuffer):
+    """Capture buffer shared by several sources, that records which source
+    wrote what and when.
+
+    Takes the same parameters as :py:class:`CaptureBuffer`, plus:
+
+    :param int max_records: the number of writes recorded (default is
+        65536). Beyond it the oldest records are forgotten, their output
+        remains in the buffer though.
+
+    Sources write to it through :py:meth:`writer`.
+    """
+
+    _MAX_RECORDS = 65536
+
+    def __init__(self, *args, **kwargs):
+        max_records = kwargs.pop('max_records', self.__class__._MAX_RECORDS)
+        if max_records is not None and max_records < 0:
+            raise ValueError(_("Wrong number of records: {}")
+                             .format(max_records))
+        super(TaggedCaptureBuffer, self).__init__(*args, **kwargs)
+        self._records = deque(maxlen=max_records)
+        self.dropped_records = 0
+        """Number of records forgotten."""
+
+    @property
+    def statistics(self):
+        """A :py:class:`dict` describing the buffer usage."""
+        statistics = super(TaggedCaptureBuffer, self).statistics
+        statistics['dropped_records'] = self.dropped_records
+        return statistics
+
+    def writer(self, tag):
+        """Returns a stream that writes to the buffer on behalf of the
+        source named `tag`."""
+        return _TaggedWriter(self, tag)
+
+    def write_tagged(self, tag, data):
+        length = len(data)
+        if not isinstance(data, bytes):
+            data = data.encode(self.encoding)
+        with self._lock:
+            if len(self._records) == self._records.maxlen:
+                self.dropped_records += 1
+            self._records.append((time.time(), tag, self.size, len(data)))
+            self._append(data)
+            # Forget about the writes the ring buffer dropped.
+            while (self._records
+                   and sum(self._records[0][2:]) <= self.dropped):
+                self._records.popleft()
+                self.dropped_records += 1
+        return length
+
+    def records(self, tag=None):
+        """Returns the writes made to the buffer, in order.
+
+        :param str tag: only return the writes of that source.
+        :returns: a list of `(timestamp, tag, data)` tuples.
+        """
+        with self._lock:
+            records = [x for x in self._records
+                       if tag is None or x[1] == tag]
+            if not records:
+                return []
+            # Read what the records span at once.
+            start = records[0][2]
+            data, start = self._read(start,
+                                     sum(records[-1][2:]) - start)
+        return [(timestamp, source,
+                 self._decode(data[max(offset - start, 0):
+                                   offset + length - start]))
+                for timestamp, source, offset, length in records]
+
+
+class _TaggedWriter(object):
+    """Stream a source writes to, to reach a :py:class:`TaggedCaptureBuffer`.
+    """
+
+    def __init__(self, buffer, tag):
+        self._buffer = buffer
+        self.tag = tag
+
+    @property
+    def buffer(self):
+        return self
+
+    def write(self, data):
+        return self._buffer.write_tagged(self.tag, data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def __getattr__(self, name):
+        return getattr(self._buffer, name)
+
+
+class _FdRedirect(object):
+    """Redirects a file descriptor into a pipe which a thread drains into a
+    buffer.
+
+    :param int fd: the file descriptor to redirect (e.g. 1 for stdout).
+    :param buffer: the object (with a `write` method accepting bytes) in
+        which the output written to :param:`fd` is accumulated.
+    :param stream: the python file object that writes to :param:`fd`, if
+        any. It is flushed before redirecting and restoring :param:`fd`.
+
+    The reader thread reads as fast as the pipe fills, so that processes
+    writing to :param:`fd` never wait for us (on Linux the pipe capacity is
+    also enlarged to absorb bursts).
+    """
+
+    _CHUNK_SIZE = 65536
+    _PIPE_SIZE = 1048576
+    _JOIN_TIMEOUT = 5
+
+    def __init__(self, fd, buffer, stream=None):
+        self._fd = fd
+        self._buffer = buffer
+        self._stream = stream
+        self._saved = None
+        self._thread = None
+        self.errors = 0
+        """Number of reads the buffer failed to store."""
+
+    def _flush(self):
+        if self._stream is not None:
+            try:
+                self._stream.flush()
+            except (IOError, OSError, ValueError):
+                pass
+
+    def start(self):
+        self._flush()
+        self._saved = os.dup(self._fd)
+        r, w = os.pipe()
+        if fcntl is not None:
+            try:
+                fcntl.fcntl(w, _F_SETPIPE_SZ, self.__class__._PIPE_SIZE)
+            except (IOError, OSError):
+                pass  # Not Linux, or beyond /proc/sys/fs/pipe-max-size
+        os.dup2(w, self._fd)
+        os.close(w)
+        self._thread = threading.Thread(target=self._drain, args=(r, ))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _drain(self, r):
+        try:
+            while True:
+                data = os.read(r, self.__class__._CHUNK_SIZE)
+                if not data:
+                    break
+                try:
+                    self._buffer.write(data)
+                except Exception:
+                    # Keep reading (thus discarding) whatever the buffer
+                    # cannot take: a pipe left without reader would kill
+                    # the writers with SIGPIPE.
+                    self.errors += 1
+        finally:
+            os.close(r)
+
+    def stop(self):
+        """Restores the file descriptor and waits for the output written so
+        far to be collected.
+
+        The reader thread only stops once every writer closed the pipe. It is
+        not waited for more than a few seconds: child processes left running
+        in the background may keep writing to the pipe.
+        """
+        self._flush()
+        os.dup2(self._saved, self._fd)
+        os.close(self._saved)
+        self._thread.join(self.__class__._JOIN_TIMEOUT)
+
+
+class _DispatchingStream(object):
+    """Stream that routes what is written to it to the capture buffer of the
+    current thread (or :py:mod:`asyncio` task, from Python 3.7 on) or, if
+    there is none, to the original stream.
+
+    :param original: the stream it replaces.
+
+    One instance is installed in place of a given stream, however many
+    captures use it concurrently (see :py:meth:`acquire` and
+    :py:meth:`release`).
+    """
+
+    _installed = {}
+    """Instances currently installed, by (target object id, attribute)."""
+
+    _lock = threading.Lock()
+
+    def __init__(self, original):
+        self.original = original
+        self._users = 0
+        if ContextVar is not None:
+            self._var = ContextVar('iocapture_{}'.format(id(self)),
+                                   default=())
+        else:
+            self._local = threading.local()
+
+    @classmethod
+    def acquire(cls, target, attr):
+        """Returns the dispatching stream installed in place of `attr` of
+        `target`, installing it if need be."""
+        key = (id(target), attr)
+        with cls._lock:
+            stream = cls._installed.get(key)
+            if stream is None:
+                stream = cls(getattr(target, attr))
+                setattr(target, attr, stream)
+                cls._installed[key] = stream
+            stream._users += 1
+        return stream
+
+    def release(self, target, attr):
+        """Puts the original stream back in place once the dispatching
+        stream has no more users."""
+        with self.__class__._lock:
+            self._users -= 1
+            if 0 == self._users:
+                del self.__class__._installed[(id(target), attr)]
+                setattr(target, attr, self.original)
+
+    def push(self, buffer):
+        """Routes the output of the current thread or task to `buffer`.
+
+        :returns: a token to pass to :py:meth:`pop`."""
+        if ContextVar is not None:
+            return self._var.set(self._var.get() + (buffer, ))
+        stack = getattr(self._local, 'stack', ())
+        self._local.stack = stack + (buffer, )
+        return stack
+
+    def pop(self, token):
+        """Cancels the effect of the :py:meth:`push` call that returned
+        `token`."""
+        if ContextVar is not None:
+            self._var.reset(token)
+        else:
+            self._local.stack = token
+
+    @property
+    def current(self):
+        """The stream output of the current thread or task goes to."""
+        if ContextVar is not None:
+            stack = self._var.get()
+        else:
+            stack = getattr(self._local, 'stack', ())
+        return stack[-1] if stack else self.original
+
+    def write(self, data):
+        return self.current.write(data)
+
+    def writelines(self, lines):
+        return self.current.writelines(lines)
+
+    def flush(self):
+        return self.current.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.current, name)
 
 
 class IOCapture(object):
@@ -42,9 +569,77 @@ class IOCapture(object):
                  file=False,
                  module=None,
                  out_attr=None,
-                 err_attr=None):
+                 err_attr=None,
+                 max_memory=None,
+                 ring=None,
+                 fd=False,
+                 binary=False,
+                 encoding=None,
+                 per_thread=False,
+                 targets=None,
+                 logs=None):
         """Context Manager to capture either or both stdout and stderr.
+
+        :param bool file: capture output in an anonymous file rather than in
+            memory.
+        :param int max_memory: capture output in memory until it exceeds
+            that many bytes, then in an anonymous file.
+        :param int ring: only keep the last :param:`ring` bytes of the
+            output.
+        :param bool fd: also capture at the file descriptor level (i.e. file
+            descriptors 1 and 2). That way the output of child processes,
+            C extensions or :py:func:`os.write` calls is also captured. It
+            cannot be combined with :param:`module`.
+        :param bool binary: get the captured output as bytes rather than
+            text.
+        :param str encoding: the encoding of the captured text (default is
+            the locale preferred encoding).
+        :param bool per_thread: only capture the output of the current
+            thread (or :py:mod:`asyncio` task). The stream is replaced by a
+            dispatching stream, shared by all the captures in progress, that
+            routes output to the capture of the thread writing it. Other
+            threads output goes to the original stream. Hence tests running
+            concurrently each get their own output. It cannot be combined
+            with :param:`fd`.
+        :param list targets: additional streams to capture, all in a single
+            :py:class:`TaggedCaptureBuffer` (the :py:attr:`combined`
+            attribute). Each target is a `(module, attr)` or
+            `(module, attr, tag)` tuple, :param:`tag` defaulting to
+            ``'module.attr'``. The output of all targets is kept in order and
+            can be read either in one go (:py:meth:`get_combined`) or source
+            by source with timestamps (:py:meth:`get_records`).
+        :param str logs: the name of a logger ('' for the root logger) which
+            records are to be captured as well, as is (see
+            :py:class:`LogCapture`, available through the :py:attr:`logs`
+            attribute).
+
+        How much each stream captured, and whether it spilled to a file, is
+        reported by the :py:attr:`statistics` attribute.
+
+        The output can only be retrieved in full (with :py:meth:`get_stdout`
+        and :py:meth:`get_stderr`) once the context is exited. Yet the
+        buffers (the :py:attr:`stdout` and :py:attr:`stderr` attributes, see
+        :py:class:`CaptureBuffer`) can be polled for new output with their
+        `read_since()` method, or iterated line by line with `iterlines()`,
+        while in the context.
         """
+        if fd is True and module not in (None, 'sys'):
+            raise ValueError(
+                _("File descriptors cannot be captured per module!"))
+        if fd is True and per_thread is True:
+            raise ValueError(
+                _("File descriptors cannot be captured per thread!"))
+        self._fd = fd
+        self._per_thread = per_thread
+        self._tokens = {}
+        self._redirects = []
+        self._entered = False
+        if file is True:
+            max_memory = 0
+        self._max_memory = max_memory
+        self._ring = ring
+        self._binary = binary
+        self._encoding = encoding
         if module is None:
             module = 'sys'
         if module in sys.modules:
@@ -57,16 +652,51 @@ class IOCapture(object):
         self._do_stdout = stdout
 
         if stderr:
-            self._prepare_attrs(err_attr or 'stderr', 'err', file)
+            self._prepare_attrs(err_attr or 'stderr', 'err')
         else:
             self.stderr = sys.stderr
 
         if stdout:
-            self._prepare_attrs(out_attr or 'stdout', 'out', file)
+            self._prepare_attrs(out_attr or 'stdout', 'out')
         else:
             self.stdout = sys.stdout
 
+        self.logs = None
+        if logs is not None:
+            self.logs = LogCapture(logs or None)
+
+        self.combined = None
+        self._targets = []
+        if targets:
+            self.combined = TaggedCaptureBuffer(
+                max_memory=self._max_memory, ring=self._ring,
+                binary=self._binary, encoding=self._encoding)
+            for target in targets:
+                self._prepare_target(*target)
+
     def __enter__(self):
+        self._entered = True
+        if self.logs is not None:
+            self.logs.__enter__()
+        if self._fd is True:
+            # Both the file descriptors and the python attributes are
+            # redirected to the buffers: sys.stdout and sys.stderr may not
+            # be writing to the standard file descriptors.
+            for fd, what in ((2, 'err'), (1, 'out'), ):
+                if getattr(self, '_do_std{}'.format(what)):
+                    redirect = _FdRedirect(
+                        fd,
+                        getattr(self, 'std{}'.format(what)),
+                        getattr(self, '_old{}'.format(what)))
+                    redirect.start()
+                    self._redirects.append(redirect)
+        for parent, attr, old, writer in self._targets:
+            setattr(parent, attr, writer)
+        if self._per_thread is True:
+            for what in ('err', 'out', ):
+                if getattr(self, '_do_std{}'.format(what)):
+                    self._dispatch(what)
+            return self
         if self._do_stderr:
             # Redirect stderr
             setattr(self._err_target, self._err_attr, self.stderr)
@@ -76,24 +706,65 @@ class IOCapture(object):
         return self
 
     def __exit__(self, exc_type, exc, tb):
-        if self._do_stderr:  # Restore stderr if need be
-            setattr(self._err_target, self._err_attr, self._olderr)
-        if self._do_stdout:  # Restore stdout if need be
-            setattr(self._out_target, self._out_attr, self._oldout)
+        if self._per_thread is True:
+            for what in ('out', 'err', ):
+                if what in self._tokens:
+                    self._undispatch(what)
+        else:
+            if self._do_stderr:  # Restore stderr if need be
+                setattr(self._err_target, self._err_attr, self._olderr)
+            if self._do_stdout:  # Restore stdout if need be
+                setattr(self._out_target, self._out_attr, self._oldout)
+        for parent, attr, old, writer in reversed(self._targets):
+            setattr(parent, attr, old)
+        while self._redirects:
+            self._redirects.pop().stop()
+        if self.logs is not None:
+            self.logs.__exit__(exc_type, exc, tb)
+        self._entered = False
         # Whatever happens propagate exceptions.
         return False
 
-    def _prepare_attrs(self, module_attr, what, file):
+    def _dispatch(self, what):
+        target = getattr(self, '_{}_target'.format(what))
+        attr = getattr(self, '_{}_attr'.format(what))
+        stream = _DispatchingStream.acquire(target, attr)
+        token = stream.push(getattr(self, 'std{}'.format(what)))
+        self._tokens[what] = (stream, token)
+
+    def _undispatch(self, what):
+        stream, token = self._tokens.pop(what)
+        stream.pop(token)
+        stream.release(getattr(self, '_{}_target'.format(what)),
+                       getattr(self, '_{}_attr'.format(what)))
+
+    @classmethod
+    def _resolve(cls, module, module_attr):
+        """Returns the object that holds the (dotted) attribute
+        `module_attr` of `module`, the attribute name and its value."""
         parent_object = None
-        value = self._mod
+        value = module
         for bit in module_attr.split('.'):
             parent_object = value
             value = getattr(value, bit)
+        return parent_object, bit, value
 
-        if file is True:
-            f = TemporaryFile(mode='w+', prefix='iocpt-')
-        else:
-            f = MemoryIO()
+    def _prepare_target(self, module, module_attr, tag=None):
+        if module not in sys.modules:
+            raise RuntimeError(
+                _("Module `{}' is not yet loaded!").format(module))
+        parent_object, bit, value = self.__class__._resolve(
+            sys.modules[module], module_attr)
+        writer = self.combined.writer(
+            tag or '{}.{}'.format(module, module_attr))
+        self._targets.append((parent_object, bit, value, writer))
+
+    def _prepare_attrs(self, module_attr, what):
+        parent_object, bit, value = self.__class__._resolve(self._mod,
+                                                            module_attr)
+
+        f = CaptureBuffer(max_memory=self._max_memory, ring=self._ring,
+                          binary=self._binary, encoding=self._encoding)
 
         setattr(self, '_{}_target'.format(what), parent_object)
         setattr(self, '_{}_attr'.format(what), bit)
@@ -102,19 +773,39 @@ class IOCapture(object):
 
     def _get_output(self, name):
         if not getattr(self, '_do_{}'.format(name)):
-            return ''
+            return b'' if self._binary is True else ''
         what = name[-3:]
         attr = getattr(self, name)
-        if attr == getattr(getattr(self, '_{}_target'.format(what)),
-                           getattr(self, '_{}_attr'.format(what))):
+        if self._entered is True:
             raise RuntimeError(_("Calling `get_std{}()' while in the context"
                                  " is not allowed!").format(what))
 
-        if isinstance(attr, MemoryIO):
-            return attr.getvalue()
-        else:
-            attr.seek(0, os.SEEK_SET)
-            return attr.read()
+        return attr.getvalue()
+
+    @property
+    def statistics(self):
+        """Buffers statistics (see :py:attr:`CaptureBuffer.statistics`) of
+        each captured stream, by stream name."""
+        return dict((name, getattr(self, name).statistics)
+                    for name in ('stdout', 'stderr')
+                    if getattr(self, '_do_{}'.format(name)))
+
+    def get_combined(self):
+        """Returns the output of all the :param:`targets` at once."""
+        if self.combined is None:
+            return b'' if self._binary is True else ''
+        if self._entered is True:
+            raise RuntimeError(_("Calling `get_combined()' while in the"
+                                 " context is not allowed!"))
+        return self.combined.getvalue()
+
+    def get_records(self, tag=None):
+        """Returns the output of the :param:`targets` (or of the one named
+        :param:`tag`) as a list of `(timestamp, tag, data)` tuples, one per
+        write, in order."""
+        if self.combined is None:
+            return []
+        return self.combined.records(tag)
 
     def get_stderr(self):
         return self._get_output('stderr')
@@ -0,0 +1,153 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+The :py:mod:`logcapture` module provides the means to capture the log
+records emitted through the :py:mod:`logging` module, as records rather than
+as formatted text.
+"""
+from collections import deque
+from heapq import merge
+import itertools
+import logging
+import threading
+
+
+__all__ = [
+    'LogCapture',
+    ]
+
+
+class _RecordingHandler(logging.Handler):
+    """Handler that hands records, unformatted, to a :py:class:`LogCapture`.
+    """
+
+    def __init__(self, capture, level):
+        logging.Handler.__init__(self, level)
+        self._capture = capture
+
+    def emit(self, record):
+        self._capture._add(record)
+
+
+class LogCapture(object):
+    """Context manager that stores the log records emitted while in the
+    context.
+
+    :param str logger: the name of the logger to capture records from
+        (default is the root logger, hence all records).
+    :param int level: the minimum level of the records to capture. The
+        logger level is lowered while in the context if need be.
+    :param int maxlen: the maximum number of records kept, the oldest ones
+        being discarded first (default is 10000, `None` means no limit).
+
+    Records are indexed by level and by logger name, so that looking them up
+    with :py:meth:`records` costs in proportion to the number of matching
+    records, not to the number of captured ones.
+
+    :Example:
+
+        with LogCapture('ssh-harness', logging.DEBUG) as logs:
+            do_something()
+
+        self.assertEqual(logs.messages(level=logging.ERROR), [])
+    """
+
+    def __init__(self, logger=None, level=logging.NOTSET, maxlen=10000):
+        self._logger = logging.getLogger(logger)
+        self._level = level
+        self._maxlen = maxlen
+        self._old_level = None
+        self._handler = _RecordingHandler(self, level)
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._records = deque()
+        self._by_level = {}
+        self._by_name = {}
+        self.dropped = 0
+        """The number of records discarded because :param:`maxlen` was
+        reached."""
+
+    def __enter__(self):
+        if self._level < self._logger.getEffectiveLevel():
+            self._old_level = self._logger.level
+            self._logger.setLevel(self._level or 1)
+        self._logger.addHandler(self._handler)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._logger.removeHandler(self._handler)
+        if self._old_level is not None:
+            self._logger.setLevel(self._old_level)
+            self._old_level = None
+        # Whatever happens propagate exceptions.
+        return False
+
+    def __len__(self):
+        return len(self._records)
+
+    def _add(self, record):
+        entry = (next(self._seq), record)
+        with self._lock:
+            self._records.append(entry)
+            self._by_level.setdefault(record.levelno, deque()).append(entry)
+            self._by_name.setdefault(record.name, deque()).append(entry)
+            if self._maxlen is not None and len(self._records) > self._maxlen:
+                # The oldest record is also the oldest in its indexes.
+                old = self._records.popleft()[1]
+                self._by_level[old.levelno].popleft()
+                self._by_name[old.name].popleft()
+                self.dropped += 1
+
+    def records(self, level=None, logger=None, min_level=None):
+        """Returns the captured records, in the order they were emitted.
+
+        :param int level: only return records of exactly that level.
+        :param str logger: only return records emitted by that logger
+            (not including its children).
+        :param int min_level: only return records of that level or above.
+        :returns: a list of :py:class:`logging.LogRecord` instances.
+        """
+        with self._lock:
+            if level is not None:
+                candidates = self._by_level.get(level, ())
+            elif min_level is not None and logger is None:
+                candidates = merge(*[v for k, v in self._by_level.items()
+                                     if k >= min_level])
+            elif logger is not None:
+                candidates = self._by_name.get(logger, ())
+            else:
+                candidates = self._records
+            return [record for _, record in candidates
+                    if (logger is None or logger == record.name)
+                    and (level is None or level == record.levelno)
+                    and (min_level is None or min_level <= record.levelno)]
+
+    def messages(self, **kwargs):
+        """Same as :py:meth:`records` but returns the records messages."""
+        return [record.getMessage() for record in self.records(**kwargs)]
+
+    def clear(self):
+        """Forgets about all the records captured so far."""
+        with self._lock:
+            self._records.clear()
+            self._by_level.clear()
+            self._by_name.clear()
+
+
+# vim: syntax=python:sws=4:sw=4:et:
@@ -0,0 +1,206 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""In-memory authorized keys, served to :program:`sshd` through its
+``AuthorizedKeysCommand`` option.
+
+The daemon runs the :file:`authorized_keys_command.py` helper script for
+each key a client offers, passing it the user name and the fingerprint of
+the key. The helper forwards them to the :py:class:`KeyIndexServer` over a
+Unix socket, and prints the ``authorized_keys`` lines it gets back.
+"""
+from __future__ import unicode_literals
+import base64
+from gettext import lgettext as _
+import hashlib
+import os
+import socket
+import threading
+
+
+__all__ = [
+    'KeyIndex',
+    'KeyIndexServer',
+    'fingerprint',
+    ]
+
+
+HELPER_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)),
+                           'authorized_keys_command.py')
+"""Path to the script run by :program:`sshd` to query the index."""
+
+
+_KEY_TYPE_PREFIXES = ('ssh-', 'ecdsa-', 'sk-', )
+
+
+def _parse_key(line):
+    """Splits an ``authorized_keys`` line into its options and the key
+    itself (type, base64 blob and comment).
+
+    :returns: a ``(options, key)`` tuple, `options` is `None` if there are
+        none.
+    """
+    line = line.strip()
+    if line.startswith(_KEY_TYPE_PREFIXES):
+        return None, line
+    # Options come first, they may contain quoted spaces.
+    quoted = False
+    for index, c in enumerate(line):
+        if '"' == c:
+            quoted = not quoted
+        elif c.isspace() and not quoted:
+            return line[:index], line[index:].strip()
+    raise ValueError(_('Not a public key: {}').format(line))
+
+
+def fingerprint(key):
+    """Returns the SHA256 fingerprint of the public `key` (a line of an
+    ``authorized_keys`` or ``.pub`` file), as printed by :man:`ssh-keygen`
+    and passed by :program:`sshd` to ``AuthorizedKeysCommand`` (``%f``).
+    """
+    options, key = _parse_key(key)
+    blob = base64.b64decode(key.split()[1].encode('ascii'))
+    digest = base64.b64encode(hashlib.sha256(blob).digest()).decode('ascii')
+    return 'SHA256:{}'.format(digest.rstrip('='))
+
+
+class KeyIndex(object):
+    """Authorized keys, indexed by user and fingerprint.
+
+    All the methods are thread-safe.
+    """
+
+    def __init__(self):
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def add(self, user, key, options=None):
+        """Authorizes the public `key` for `user`, with the given `options`
+        (a string, as found in ``authorized_keys`` files), replacing
+        any previous entry for that key.
+
+        :returns: the fingerprint of the key.
+        """
+        key_options, key = _parse_key(key)
+        options = options or key_options
+        line = key if options is None else '{} {}'.format(options, key)
+        fp = fingerprint(key)
+        with self._lock:
+            self._keys.setdefault(user, {})[fp] = line
+        return fp
+
+    def remove(self, user, key):
+        """Revokes the key `key` (a public key or its fingerprint) of
+        `user`.
+
+        :returns: whether the key was authorized.
+        """
+        fp = key if key.startswith('SHA256:') else fingerprint(key)
+        with self._lock:
+            return self._keys.get(user, {}).pop(fp, None) is not None
+
+    def lookup(self, user, fp=None):
+        """Returns the ``authorized_keys`` lines of `user`; only the one of
+        the key which fingerprint is `fp` if given."""
+        with self._lock:
+            keys = self._keys.get(user, {})
+            if fp is not None:
+                return [keys[fp]] if fp in keys else []
+            return list(keys.values())
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(x) for x in self._keys.values())
+
+
+class KeyIndexServer(object):
+    """Serves a :py:class:`KeyIndex` on the Unix socket `path`.
+
+    A request is a single line holding a user name, optionally followed by a
+    key fingerprint (separated by a space). The response is the matching
+    ``authorized_keys`` lines, after which the connection is closed.
+
+    :param float timeout: how long a client is given to send its request,
+        in seconds. Each connection is handled from its own thread, thus a
+        stalled client does not hold the others up.
+    """
+
+    def __init__(self, index, path, timeout=5):
+        self.index = index
+        self.path = path
+        self.timeout = timeout
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Left-over from a previous run.
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        self._sock.listen(128)
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, addr = self._sock.accept()
+            except (OSError, socket.error):
+                return  # The socket was closed.
+            thread = threading.Thread(target=self._handle_connection,
+                                      args=(conn, ))
+            thread.daemon = True
+            thread.start()
+
+    def _handle_connection(self, conn):
+        try:
+            conn.settimeout(self.timeout)
+            self._handle(conn)
+        except (OSError, socket.error):
+            pass  # Including timeouts.
+        finally:
+            conn.close()
+
+    def _handle(self, conn):
+        request = b''
+        while not request.endswith(b'\n'):
+            data = conn.recv(4096)
+            if not data:
+                break
+            request += data
+        fields = request.decode('utf-8').split()
+        if not fields:
+            return
+        lines = self.index.lookup(fields[0],
+                                  fields[1] if 1 < len(fields) else None)
+        conn.sendall(''.join('{}\n'.format(x) for x in lines).encode('utf-8'))
+
+    def stop(self):
+        if self._sock is None:
+            return
+        # Closing a listening socket does not wake accept() up everywhere.
+        self._sock.shutdown(socket.SHUT_RDWR)
+        self._sock.close()
+        self._thread.join(5)
+        self._sock = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+# vim: syntax=python:sws=4:sw=4:et:
@@ -0,0 +1,162 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Key pairs generated ahead of time, so tests can get fresh ones without
+waiting for :man:`ssh-keygen`."""
+from __future__ import unicode_literals
+import collections
+from gettext import lgettext as _
+import itertools
+import os
+import shutil
+import threading
+import time
+
+
+__all__ = [
+    'KeyPairPool',
+    ]
+
+
+class KeyPairPool(object):
+    """Keeps a stock of key pairs of each type in `low_water`, generated by
+    a background thread.
+
+    :param str directory: where to store the keys (created if needed, and
+        deleted by :py:meth:`close`).
+    :param generate: the callable that generates a key pair, given its type
+        and the path of the private key to create.
+    :param dict low_water: the number of key pairs to keep ready, by key
+        type.
+
+    Each time a key pair is drawn the producer thread generates another one,
+    so that the stock goes back to its low-water mark.
+    """
+
+    def __init__(self, directory, generate, low_water):
+        self.directory = directory
+        self._generate = generate
+        self._low_water = dict(low_water)
+        self._ready = dict((x, collections.deque()) for x in low_water)
+        self._serial = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._error = None
+        self._thread = None
+
+    def start(self):
+        """Creates the key directory and starts the producer thread."""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self._thread = threading.Thread(target=self._produce)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _path(self, key_type):
+        return os.path.join(self.directory, 'id_{}_{}'.format(
+            key_type, next(self._serial)))
+
+    def _missing(self):
+        """Returns the type of key that is the most missing from the stock,
+        or `None` if there is nothing to generate."""
+        best = None
+        for key_type in sorted(self._low_water):
+            missing = self._low_water[key_type] - len(self._ready[key_type])
+            if 0 < missing and (best is None or best[1] < missing):
+                best = (key_type, missing, )
+        return None if best is None else best[0]
+
+    def _produce(self):
+        while True:
+            with self._cond:
+                while not self._closed and self._error is None \
+                        and self._missing() is None:
+                    self._cond.wait()
+                if self._closed or self._error is not None:
+                    return
+                key_type = self._missing()
+                path = self._path(key_type)
+            try:
+                self._generate(key_type, path)
+            except Exception as e:
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._ready[key_type].append(path)
+                self._cond.notify_all()
+
+    def draw(self, key_type, timeout=None):
+        """Returns the path to the private key of a fresh key pair of type
+        `key_type` (the public key is next to it, with a ``.pub`` suffix).
+
+        The key pair is generated on the spot if the pool was not started.
+
+        :raises ValueError: if `key_type` is not kept by the pool.
+        :raises RuntimeError: if the producer failed to generate a key, or
+            if no key was made available within `timeout` seconds.
+        """
+        if key_type not in self._ready:
+            raise ValueError(_('No {} keys in the pool').format(key_type))
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(_('The key pool is closed'))
+            if self._thread is None:
+                path = self._path(key_type)
+            else:
+                while not self._ready[key_type]:
+                    if self._error is not None:
+                        raise RuntimeError(
+                            _('Key pair generation failed: {}')
+                            .format(self._error))
+                    remaining = None
+                    if deadline is not None:
+                        remaining = deadline - time.time()
+                        if 0 >= remaining:
+                            raise RuntimeError(
+                                _('No {} key available after {}s')
+                                .format(key_type, timeout))
+                    self._cond.wait(remaining)
+                self._cond.notify_all()  # Wake the producer up.
+                return self._ready[key_type].popleft()
+        self._generate(key_type, path)
+        return path
+
+    def available(self, key_type):
+        """Returns the number of key pairs of `key_type` ready to be
+        drawn."""
+        with self._cond:
+            return len(self._ready[key_type])
+
+    def close(self):
+        """Stops the producer, and deletes all the keys (drawn or not)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+        for stock in self._ready.values():
+            stock.clear()
+
+
+# vim: syntax=python:sws=4:sw=4:et:
@@ -0,0 +1,298 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Load generation: runs a probe (typically, a connection to the test
+server) many times, at a given rate or concurrency, and records its
+latencies.
+"""
+from __future__ import division, unicode_literals
+from gettext import lgettext as _
+import json
+import math
+import threading
+import time
+
+
+__all__ = [
+    'Histogram',
+    'LoadReport',
+    'run_load',
+    ]
+
+
+TOTAL = 'total'
+"""Name of the phase that covers the whole run of the probe."""
+
+
+class Histogram(object):
+    """Records latencies (in seconds) with a bounded relative error, in
+    logarithmically sized buckets (after HdrHistogram).
+
+    :param int significant_figures: the number of significant decimal
+        figures kept for each value.
+    :param float unit: the smallest value told apart, in seconds.
+
+    Memory use only depends on the range of the values recorded, not on
+    their number.
+    """
+
+    def __init__(self, significant_figures=3, unit=1e-6):
+        self.significant_figures = significant_figures
+        self.unit = unit
+        self._bits = int(math.ceil(math.log(2 * 10 ** significant_figures,
+                                            2)))
+        self._counts = {}
+        self.count = 0
+        self._total = 0
+        self._min = None
+        self._max = None
+
+    def _shift(self, ticks):
+        return max(0, ticks.bit_length() - self._bits)
+
+    def record(self, value, count=1):
+        """Records `count` occurrences of the latency `value`."""
+        ticks = max(0, int(round(value / self.unit)))
+        shift = self._shift(ticks)
+        lower = (ticks >> shift) << shift
+        self._counts[lower] = self._counts.get(lower, 0) + count
+        self.count += count
+        self._total += ticks * count
+        self._min = ticks if self._min is None else min(self._min, ticks)
+        self._max = ticks if self._max is None else max(self._max, ticks)
+
+    def merge(self, other):
+        """Adds the values recorded by the histogram `other` to this one
+        (both must have the same precision)."""
+        if (self.significant_figures, self.unit, ) \
+                != (other.significant_figures, other.unit, ):
+            raise ValueError(_('Cannot merge histograms of different '
+                               'precisions'))
+        for lower, count in other._counts.items():
+            self._counts[lower] = self._counts.get(lower, 0) + count
+        self.count += other.count
+        self._total += other._total
+        for ticks in (other._min, other._max, ):
+            if ticks is not None:
+                self._min = ticks if self._min is None \
+                    else min(self._min, ticks)
+                self._max = ticks if self._max is None \
+                    else max(self._max, ticks)
+
+    @property
+    def min(self):
+        return None if self._min is None else self._min * self.unit
+
+    @property
+    def max(self):
+        return None if self._max is None else self._max * self.unit
+
+    @property
+    def mean(self):
+        if not self.count:
+            return None
+        return self._total / self.count * self.unit
+
+    def percentile(self, percent):
+        """Returns the latency under which `percent` % of the recorded values
+        are (`None` if there are none)."""
+        if not self.count:
+            return None
+        # Rounded first, so that e.g. 99.9% of 1000 is 999 and not 1000.
+        rank = max(1, int(math.ceil(round(percent * self.count / 100, 9))))
+        seen = 0
+        for lower in sorted(self._counts):
+            seen += self._counts[lower]
+            if rank <= seen:
+                # The highest value of the bucket, but not above the maximum.
+                upper = lower + (1 << self._shift(lower)) - 1
+                return min(upper, self._max) * self.unit
+        return self.max
+
+    def to_dict(self):
+        """Returns the statistics of the histogram and its buckets, as a
+        JSON-serializable dictionary (see :py:meth:`from_dict`)."""
+        return {
+            'significant_figures': self.significant_figures,
+            'unit': self.unit,
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+            'buckets': [[x, self._counts[x]] for x in sorted(self._counts)],
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Re-creates a histogram saved with :py:meth:`to_dict`."""
+        histogram = cls(data['significant_figures'], data['unit'])
+        for lower, count in data['buckets']:
+            histogram._counts[lower] = count
+        histogram.count = data['count']
+        if histogram.count:
+            histogram._min = int(round(data['min'] / histogram.unit))
+            histogram._max = int(round(data['max'] / histogram.unit))
+            histogram._total = int(round(data['mean'] * histogram.count
+                                         / histogram.unit))
+        return histogram
+
+
+class LoadReport(object):
+    """The outcome of :py:func:`run_load`.
+
+    :ivar dict histograms: the latencies of each phase of the probe, by
+        phase name. The ``'total'`` phase is always present.
+    :ivar int errors: how many times the probe failed (failures are not
+        counted in the histograms).
+    :ivar elapsed: how long the whole run took, in seconds.
+    """
+
+    def __init__(self, rate=None, concurrency=1):
+        self.rate = rate
+        self.concurrency = concurrency
+        self.histograms = {TOTAL: Histogram()}
+        self.errors = 0
+        self.last_error = None
+        self.elapsed = None
+
+    def record(self, phases):
+        for name, value in phases.items():
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].record(value)
+
+    def record_error(self, error):
+        self.errors += 1
+        self.last_error = error
+
+    @property
+    def requests(self):
+        return self.histograms[TOTAL].count + self.errors
+
+    @property
+    def throughput(self):
+        """Successful runs of the probe per second."""
+        if not self.elapsed:
+            return None
+        return self.histograms[TOTAL].count / self.elapsed
+
+    def to_dict(self):
+        return {
+            'rate': self.rate,
+            'concurrency': self.concurrency,
+            'elapsed': self.elapsed,
+            'requests': self.requests,
+            'errors': self.errors,
+            'last_error': None if self.last_error is None
+            else '{}'.format(self.last_error),
+            'throughput': self.throughput,
+            'phases': dict((x, y.to_dict())
+                           for x, y in self.histograms.items()),
+            }
+
+    def to_json(self, path=None):
+        """Returns the report as a JSON document, and writes it to the file
+        `path` if given."""
+        data = json.dumps(self.to_dict(), indent=2, sort_keys=True)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(data)
+        return data
+
+    def summary(self):
+        """Returns a human-readable summary of the report."""
+        lines = ['{} requests, {} errors in {:.3f}s ({:.1f}/s)'.format(
+            self.requests, self.errors, self.elapsed or 0,
+            self.throughput or 0)]
+        for name in sorted(self.histograms):
+            histogram = self.histograms[name]
+            if not histogram.count:
+                continue
+            lines.append(
+                '{:<10} p50={:.6f}s p99={:.6f}s p999={:.6f}s max={:.6f}s'
+                .format(name, histogram.percentile(50),
+                        histogram.percentile(99),
+                        histogram.percentile(99.9), histogram.max))
+        return '\n'.join(lines)
+
+
+def run_load(probe, rate=None, concurrency=1, duration=None, count=None):
+    """Runs `probe` repeatedly from `concurrency` threads, for `duration`
+    seconds or `count` times (whichever comes first).
+
+    :param probe: a callable that performs one request, and returns a
+        dictionary of the latencies of its phases (possibly empty), by
+        phase name. It raises an exception when the request fails.
+    :param float rate: the number of requests to start per second. When
+        `None`, each thread starts a new request as soon as its previous one
+        is done.
+
+    :returns: a :py:class:`LoadReport`.
+
+    At a given `rate`, the ``'total'`` latency of each request is counted
+    from the time it was scheduled to start, not from the time it did. That
+    way, when the requests cannot keep up with the rate, the latencies
+    account for the time requests had to wait (instead of hiding that
+    the server is saturated).
+    """
+    if duration is None and count is None:
+        raise ValueError(_('Either a duration or a count is required'))
+    report = LoadReport(rate, concurrency)
+    lock = threading.Lock()
+    state = {'next': 0}
+    start = time.time()
+    deadline = None if duration is None else start + duration
+
+    def worker():
+        while True:
+            with lock:
+                index = state['next']
+                if count is not None and count <= index:
+                    return
+                state['next'] += 1
+            now = time.time()
+            begin = now if rate is None else start + index / rate
+            if deadline is not None and deadline <= begin:
+                return
+            if now < begin:
+                time.sleep(begin - now)
+            try:
+                phases = dict(probe())
+            except Exception as e:
+                with lock:
+                    report.record_error(e)
+                continue
+            phases[TOTAL] = time.time() - begin
+            with lock:
+                report.record(phases)
+
+    threads = [threading.Thread(target=worker) for _x in range(concurrency)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report.elapsed = time.time() - start
+    return report
+
+
+# vim: syntax=python:sws=4:sw=4:et:
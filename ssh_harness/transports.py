@@ -0,0 +1,308 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""In-process ssh client, based on :py:mod:`paramiko` (when installed)."""
+from __future__ import unicode_literals
+import codecs
+from gettext import lgettext as _
+import select
+import socket
+import sys
+import threading
+import time
+try:
+    import paramiko
+except ImportError:  # Optional dependency.
+    paramiko = None
+
+from .commands import (
+    CommandResult, CommandTimeoutError, _CHUNK_SIZE, _ENCODING, )
+
+
+__all__ = [
+    'HAVE_PARAMIKO',
+    'SessionProbe',
+    'TransportPool',
+    ]
+
+
+HAVE_PARAMIKO = paramiko is not None
+
+_SEND_POLL_INTERVAL = 0.01
+"""How often to check whether more input can be sent over a channel, in
+seconds."""
+
+
+def _load_public_keys(paths):
+    """Reads the OpenSSH public key files `paths`.
+
+    :returns: a set of ``(key_type, base64_key)`` tuples.
+    """
+    keys = set()
+    for path in paths:
+        with open(path, 'r') as f:
+            for line in f:
+                fields = line.split()
+                if 2 <= len(fields) and not fields[0].startswith('#'):
+                    keys.add((fields[0], fields[1], ))
+    return keys
+
+
+def _connect(host, port, username, key, host_keys, timeout=None,
+             phases=None):
+    """Opens an authenticated transport to the server at `host`:`port`.
+
+    :param key: the private key of the user.
+    :param set host_keys: the host keys accepted (see
+        :py:func:`_load_public_keys`).
+    :param float timeout: the number of seconds each step (connection, key
+        exchange and authentication) is given to complete.
+    :param dict phases: if given, the durations of the ``'connect'`` (up to
+        the end of the key exchange) and ``'auth'`` phases are recorded in
+        it.
+    """
+    start = time.time()
+    sock = socket.create_connection((host, port, ), timeout)
+    transport = paramiko.Transport(sock)
+    try:
+        if timeout is not None:
+            transport.banner_timeout = timeout
+            transport.auth_timeout = timeout
+        transport.start_client(timeout=timeout)
+        server_key = transport.get_remote_server_key()
+        if (server_key.get_name(), server_key.get_base64(), ) \
+                not in host_keys:
+            raise paramiko.SSHException(
+                _('Unknown host key {} for {}:{}')
+                .format(server_key.get_name(), host, port))
+        connected = time.time()
+        transport.auth_publickey(username, key)
+        if phases is not None:
+            phases['connect'] = connected - start
+            phases['auth'] = time.time() - connected
+    except Exception:
+        transport.close()
+        raise
+    return transport
+
+
+def _run(channel, cmd, input, timeout, start, encoding):
+    """Runs the command `cmd` over `channel`, feeding it `input`.
+
+    :param float start: the time the command was requested, from which
+        `timeout` is counted.
+    :returns: a :py:class:`~ssh_harness.commands.CommandResult`.
+    """
+    deadline = None if timeout is None else start + timeout
+    channel.exec_command(cmd)
+    if isinstance(input, type('')):
+        input = input.encode(encoding)
+    input = input or b''
+    sent = 0
+    if not input:
+        channel.shutdown_write()
+
+    readers = (
+        (channel.recv_ready, channel.recv, []),
+        (channel.recv_stderr_ready, channel.recv_stderr, []),
+        )
+    first_byte_time = None
+    while True:
+        # Input is sent as the channel window allows, in between reads: the
+        # command may not read its input until its output is read.
+        progress = False
+        if sent < len(input) and channel.send_ready():
+            try:
+                sent += channel.send(input[sent:sent + _CHUNK_SIZE])
+            except socket.error:
+                sent = len(input)  # The command does not want more.
+            if len(input) <= sent:
+                channel.shutdown_write()
+            progress = True
+        for ready, recv, parts in readers:
+            while ready():
+                data = recv(_CHUNK_SIZE)
+                if data:
+                    progress = True
+                    parts.append(data)
+                    if first_byte_time is None:
+                        first_byte_time = time.time() - start
+        if channel.exit_status_ready() and not progress \
+                and not channel.recv_ready() \
+                and not channel.recv_stderr_ready():
+            break
+        remaining = None
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if 0 >= remaining:
+                out, err = [_decode(x[2], encoding) for x in readers]
+                raise CommandTimeoutError([cmd], timeout, None,
+                                          out=out, err=err)
+        if progress:
+            continue
+        if sent < len(input):
+            # The channel does not signal when its window opens again.
+            remaining = _SEND_POLL_INTERVAL if remaining is None \
+                else min(remaining, _SEND_POLL_INTERVAL)
+        select.select([channel], [], [], remaining)
+
+    out, err = [_decode(x[2], encoding) for x in readers]
+    return CommandResult(channel.recv_exit_status(), out, err,
+                         wall_time=time.time() - start,
+                         first_byte_time=first_byte_time)
+
+
+def _decode(parts, encoding):
+    data = b''.join(parts)
+    if (3, 0, 0, ) <= sys.version_info:
+        return codecs.decode(data, encoding)
+    return data
+
+
+class TransportPool(object):
+    """A pool of authenticated transports to an ssh server, on which
+    commands are run over channels of their own.
+
+    :param str host: the address of the server.
+    :param int port: the port the server listens to.
+    :param str username: the name of the user to log in as.
+    :param str key_path: the path to the private key of the user.
+    :param list host_key_paths: the paths to the public host keys of the
+        server. The connection is refused if the server presents another key.
+    :param int size: the maximum number of transports in the pool.
+    :param str encoding: the encoding of the commands output.
+
+    Transports are opened on demand (up to `size`) and re-used in turn;
+    any number of channels can be open on each of them at once. Dead
+    transports are replaced.
+    """
+
+    def __init__(self, host, port, username, key_path, host_key_paths,
+                 size=4, encoding=None):
+        if paramiko is None:
+            raise RuntimeError(_('The paramiko module is not installed'))
+        self._host = host
+        self._port = port
+        self._username = username
+        self._key = paramiko.RSAKey.from_private_key_file(key_path)
+        self._host_keys = _load_public_keys(host_key_paths)
+        self._size = size
+        self._encoding = encoding or _ENCODING
+        self._transports = []
+        self._next = 0
+        self._connecting = 0
+        self._lock = threading.Condition()
+
+    def transport(self, timeout=None):
+        """Returns a live transport of the pool, opening it if necessary
+        (within `timeout` seconds for each step of the connection, see
+        :py:func:`_connect`)."""
+        with self._lock:
+            while True:
+                self._transports = [x for x in self._transports
+                                    if x.is_active()]
+                if len(self._transports) + self._connecting < self._size:
+                    self._connecting += 1
+                    break
+                if self._transports:
+                    self._next = (self._next + 1) % len(self._transports)
+                    return self._transports[self._next]
+                self._lock.wait()  # For a connection in progress.
+        # Connects without holding the lock: other callers need not wait
+        # for the handshake to use the transports already open.
+        transport = None
+        try:
+            transport = _connect(self._host, self._port, self._username,
+                                 self._key, self._host_keys, timeout)
+        finally:
+            with self._lock:
+                self._connecting -= 1
+                if transport is not None:
+                    self._transports.append(transport)
+                self._lock.notify_all()
+        return transport
+
+    def run(self, cmd, input=None, timeout=None):
+        """Runs the command `cmd` (a string) on the server.
+
+        :returns: a :py:class:`~ssh_harness.commands.CommandResult` (without
+            resource usage figures).
+        :raises CommandTimeoutError: when `timeout` expires, the channel is
+            then closed. Opening a transport is given `timeout` too.
+        """
+        start = time.time()
+        channel = self.transport(timeout).open_session()
+        try:
+            return _run(channel, cmd, input, timeout, start, self._encoding)
+        finally:
+            channel.close()
+
+    def close(self):
+        """Closes all the transports of the pool."""
+        with self._lock:
+            for transport in self._transports:
+                transport.close()
+            self._transports = []
+
+
+class SessionProbe(object):
+    """A probe for :py:func:`~ssh_harness.load.run_load`, that opens a new
+    connection for each request, and runs the command `cmd` over it.
+
+    The arguments are the same as :py:class:`TransportPool`'s, plus the
+    command to run and its `timeout` (which also bounds each step of the
+    connection, so that a saturated server cannot hang the probe).
+
+    :returns: the durations of the ``'connect'``, ``'auth'`` and
+        ``'command'`` phases.
+    :raises RuntimeError: if the command fails.
+    """
+
+    def __init__(self, host, port, username, key_path, host_key_paths, cmd,
+                 timeout=None, encoding=None):
+        if paramiko is None:
+            raise RuntimeError(_('The paramiko module is not installed'))
+        self._host = host
+        self._port = port
+        self._username = username
+        self._key = paramiko.RSAKey.from_private_key_file(key_path)
+        self._host_keys = _load_public_keys(host_key_paths)
+        self._cmd = cmd
+        self._timeout = timeout
+        self._encoding = encoding or _ENCODING
+
+    def __call__(self):
+        phases = {}
+        transport = _connect(self._host, self._port, self._username,
+                             self._key, self._host_keys, self._timeout,
+                             phases)
+        try:
+            start = time.time()
+            channel = transport.open_session()
+            result = _run(channel, self._cmd, None, self._timeout, start,
+                          self._encoding)
+            phases['command'] = time.time() - start
+        finally:
+            transport.close()
+        if 0 != result.returncode:
+            raise RuntimeError(_('`{}\' exited with status {}')
+                               .format(self._cmd, result.returncode))
+        return phases
+
+
+# vim: syntax=python:sws=4:sw=4:et:
@@ -10,10 +10,11 @@ except ImportError:
     from mock import patch
 import stat
 import os
+import shutil
 from sys import version_info as VERSION_INFO, platform
 
-from ssh_harness import BackupEditAndRestore
-from ssh_harness.contexts.backupeditandrestore import _move
+from ssh_harness import BackupEditAndRestore, SnapshotAndRestore
+from ssh_harness.contexts.backupeditandrestore import _move, _rollback_tree
 
 _Py3 = (3, ) <= VERSION_INFO
 _Py34 = (3, 4) <= VERSION_INFO
@@ -643,4 +644,182 @@ class BackupEditAndRestoreTestCase(TestCase):
                                              self._existing_path,
                                              None)
 
+    def test_edit_without_backup(self):
+        with BackupEditAndRestore(self._context_name,
+                                  self._existing_path,
+                                  'a',
+                                  suffix=self._suffix,
+                                  backup=False) as f:
+            f.write('.')
+
+        self.assertFalse(os.path.isfile(self._existing_backup_path))
+        self.assertFalse(os.path.isfile(self._existing_new_path))
+        self.assertNotIn(self._existing_path,
+                         BackupEditAndRestore._contexts[self._context_name])
+        with open(self._existing_path, 'r') as chk:
+            self.assertEqual(chk.read(), '{}.'.format(self._file_content))
+
+        with self.assertRaisesRegexp(RuntimeError,
+                                     '.* edited without back-up.*'):
+            f.restore()
+
+
+class SnapshotAndRestoreTestCase(TestCase):
+
+    MODULE_PATH = os.path.abspath(os.path.dirname(__file__))
+    TEMP_PATH = os.path.sep.join([MODULE_PATH, 'tmp', 'snapshotandrestore'])
+
+    _context_name = 'test_snapshotandrestore'
+
+    def setUp(self):
+        self._dir = os.path.join(self.TEMP_PATH, 'dir')
+        self._snapshot = '{}.snapshot'.format(self._dir)
+        os.makedirs(os.path.join(self._dir, 'sub'))
+        for name, content in [('kept', 'kept'),
+                              ('edited', 'original'),
+                              (os.path.join('sub', 'removed'), 'removed'), ]:
+            with open(os.path.join(self._dir, name), 'w') as f:
+                f.write(content)
+
+    def tearDown(self):
+        BackupEditAndRestore.clear_context(self._context_name)
+        shutil.rmtree(self.TEMP_PATH)
+
+    def _edit(self):
+        with BackupEditAndRestore(self._context_name,
+                                  os.path.join(self._dir, 'edited'),
+                                  'w',
+                                  backup=False) as f:
+            f.write('edited')
+        os.unlink(os.path.join(self._dir, 'sub', 'removed'))
+        with open(os.path.join(self._dir, 'added'), 'w') as f:
+            f.write('added')
+
+    def _check_restored(self):
+        self.assertEqual(sorted(os.listdir(self._dir)),
+                         ['edited', 'kept', 'sub'])
+        with open(os.path.join(self._dir, 'edited'), 'r') as f:
+            self.assertEqual(f.read(), 'original')
+        with open(os.path.join(self._dir, 'sub', 'removed'), 'r') as f:
+            self.assertEqual(f.read(), 'removed')
+        self.assertFalse(os.path.exists(self._snapshot))
+
+    def test_snapshot_and_restore(self):
+        for method in ('auto', 'link', 'copy', ):
+            with SnapshotAndRestore(self._context_name, self._dir,
+                                    method) as snapshot:
+                self.assertTrue(os.path.isdir(self._snapshot))
+            if 'auto' != method:
+                self.assertEqual(snapshot.method_used, method)
+            self._edit()
+
+            snapshot.restore()
+
+            self._check_restored()
+
+    def test_snapshot_link_shares_files(self):
+        with SnapshotAndRestore(self._context_name, self._dir, 'link'):
+            pass
+
+        self.assertTrue(os.path.samefile(
+            os.path.join(self._dir, 'kept'),
+            os.path.join(self._snapshot, 'kept')))
+
+    def test_restored_by_clear_context(self):
+        with SnapshotAndRestore(self._context_name, self._dir):
+            pass
+        self._edit()
+
+        BackupEditAndRestore.clear_context(self._context_name)
+
+        self._check_restored()
+
+    def test_restore_inexistant_directory_removes_it(self):
+        path = os.path.join(self.TEMP_PATH, 'inexistant')
+        with SnapshotAndRestore(self._context_name, path) as snapshot:
+            os.mkdir(path)
+
+        snapshot.restore()
+
+        self.assertFalse(os.path.exists(path))
+
+    def test_rollback_tree(self):
+        with SnapshotAndRestore(self._context_name, self._dir, 'link'):
+            pass
+        self._edit()
+
+        _rollback_tree(self._snapshot, self._dir)
+
+        self._check_restored()
+        BackupEditAndRestore._contexts[self._context_name].clear()
+
+    def test_wrong_method(self):
+        with self.assertRaises(ValueError):
+            SnapshotAndRestore(self._context_name, self._dir, 'teleport')
+
+    def test_reuse_is_forbidden(self):
+        with SnapshotAndRestore(self._context_name, self._dir) as snapshot:
+            pass
+
+        with self.assertRaises(RuntimeError):
+            with snapshot:
+                pass
+
+    def test_existing_snapshot_path_is_left_alone(self):
+        os.mkdir(self._snapshot)
+        with open(os.path.join(self._snapshot, 'precious'), 'w') as f:
+            f.write('precious')
+
+        with self.assertRaises(OSError):
+            with SnapshotAndRestore(self._context_name, self._dir):
+                pass
+
+        self.assertEqual(os.listdir(self._snapshot), ['precious'])
+        self.assertEqual(BackupEditAndRestore._contexts.get(
+            self._context_name, {}), {})
+
+    @patch('ssh_harness.contexts.backupeditandrestore._clone_file',
+           side_effect=OSError('No space left on device'))
+    def test_failed_snapshot_is_removed(self, clone_file):
+        with self.assertRaises(OSError):
+            with SnapshotAndRestore(self._context_name, self._dir, 'copy'):
+                pass
+
+        self.assertFalse(os.path.exists(self._snapshot))
+
+    def test_recover_stale_snapshot(self):
+        # A previous run snapshot the directory, edited it and died.
+        with SnapshotAndRestore('stale', self._dir, 'copy'):
+            pass
+        self._edit()
+        BackupEditAndRestore._contexts.pop('stale')
+
+        snapshot = SnapshotAndRestore(self._context_name, self._dir)
+        self.assertTrue(snapshot.recover())
+        self._check_restored()
+        with snapshot:
+            self.assertTrue(os.path.isdir(self._snapshot))
+
+    def test_recover_without_stale_snapshot(self):
+        snapshot = SnapshotAndRestore(self._context_name, self._dir)
+
+        self.assertFalse(snapshot.recover())
+        with snapshot:
+            pass
+        with self.assertRaises(RuntimeError):
+            snapshot.recover()
+
+    @skipIf(platform.startswith('win'), 'no symbolic links')
+    def test_snapshot_symlinked_directory(self):
+        link = os.path.join(self.TEMP_PATH, 'link')
+        os.symlink(self._dir, link)
+        with SnapshotAndRestore(self._context_name, link) as snapshot:
+            self.assertTrue(os.path.isdir(self._snapshot))
+        self._edit()
+
+        snapshot.restore()
+
+        self.assertTrue(os.path.islink(link))
+        self._check_restored()
+
 # vim: syntax=python:sws=4:sw=4:et:
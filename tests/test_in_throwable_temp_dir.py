@@ -18,6 +18,7 @@
 #
 from __future__ import print_function
 import os
+import shutil
 from stat import S_IRUSR, S_IXUSR
 from unittest import TestCase
 import warnings
@@ -118,3 +119,69 @@ class InThrowableTempDirTestCase(TestCase):
         self.assertEqual(len(w), 1)
         self.assertEqual(w[-1].category, UserWarning)
         self.assertFalse(os.path.exists(ittd.path))
+
+    def test_in_throwable_temp_dir_background_removal(self):
+        with InThrowableTempDir(dir=TEMP_PATH, background=True) as ittd:
+            with open('some-file', 'w') as f:
+                f.write('content')
+
+        self.assertEqual(ittd.old_path, self.CASE_CWD)
+        self.assertFalse(os.path.exists(ittd.path))
+        InThrowableTempDir.drain()
+        self.assertEqual(os.listdir(TEMP_PATH), [])
+
+    def test_in_throwable_temp_dir_prefill(self):
+        prefix = 'pooled-'
+        InThrowableTempDir.prefill(2, prefix=prefix, dir=TEMP_PATH)
+        pooled = sorted(os.listdir(TEMP_PATH))
+        self.assertEqual(len(pooled), 2)
+
+        with InThrowableTempDir(dir=TEMP_PATH, prefix=prefix) as ittd:
+            self.assertIn(os.path.basename(ittd.path), pooled)
+        self.assertFalse(os.path.exists(ittd.path))
+        self.assertEqual(len(os.listdir(TEMP_PATH)), 1)
+
+        InThrowableTempDir.clear_pool()
+        self.assertEqual(os.listdir(TEMP_PATH), [])
+
+    def test_in_throwable_temp_dir_prefill_refill(self):
+        prefix = 'refilled-'
+        InThrowableTempDir.prefill(1, prefix=prefix, dir=TEMP_PATH,
+                                   refill=True)
+        with InThrowableTempDir(dir=TEMP_PATH, prefix=prefix) as ittd:
+            pass
+        InThrowableTempDir.drain()
+
+        remaining = os.listdir(TEMP_PATH)
+        self.assertEqual(len(remaining), 1)
+        self.assertNotEqual(remaining[0], os.path.basename(ittd.path))
+
+        InThrowableTempDir.clear_pool()
+        self.assertEqual(os.listdir(TEMP_PATH), [])
+
+    def _make_template(self):
+        template = os.path.join(os.path.dirname(TEMP_PATH), 'template')
+        os.makedirs(os.path.join(template, 'sub'))
+        with open(os.path.join(template, 'sub', 'file'), 'w') as f:
+            f.write('content')
+        os.symlink('sub/file', os.path.join(template, 'link'))
+        self.addCleanup(shutil.rmtree, template)
+        return template
+
+    def test_in_throwable_temp_dir_template(self):
+        template = self._make_template()
+        for method in ('auto', 'link', 'copy', ):
+            with InThrowableTempDir(dir=TEMP_PATH, template=template,
+                                    template_method=method) as ittd:
+                with open(os.path.join('sub', 'file')) as f:
+                    self.assertEqual(f.read(), 'content')
+                self.assertEqual(os.readlink('link'), 'sub/file')
+            if 'auto' != method:
+                self.assertEqual(ittd.method_used, method)
+            self.assertFalse(os.path.exists(ittd.path))
+
+    def test_in_throwable_temp_dir_template_failure(self):
+        with self.assertRaises(OSError):
+            InThrowableTempDir(dir=TEMP_PATH,
+                               template=os.path.join(TEMP_PATH, 'missing'))
+        self.assertEqual(os.listdir(TEMP_PATH), [])
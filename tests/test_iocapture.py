@@ -23,12 +23,16 @@ try:
     from unittest.mock import patch
 except ImportError:
     from mock import patch
+import subprocess
 import sys
+import threading
 
 from .mod4tests import (write_to_stderr, write_to_stdout,
                         write_to_sys_stderr, write_to_sys_stdout, )
 
 from ssh_harness.contexts import IOCapture
+from ssh_harness.contexts.iocapture import (
+    CaptureBuffer, TaggedCaptureBuffer, _FdRedirect, )
 
 
 class IOCaptureTestCase(TestCase):
@@ -166,5 +170,293 @@ class IOCaptureTestCase(TestCase):
                            module=self.MODULE_NAME) as io:
                 io.get_stderr()
 
+    def test_capture_spills_to_file_past_max_memory(self):
+        with IOCapture(module=self.MODULE_NAME, stdout=True,
+                       max_memory=len(self.msg1)) as io:
+            write_to_stdout(self.msg1)
+            self.assertTrue(io.statistics['stdout']['in_memory'])
+            write_to_stdout(self.msg2)
+
+        self.assertEqual(io.get_stdout(), self.msg1 + self.msg2)
+        self.assertEqual(io.statistics, {
+            'stdout': {'size': len(self.msg1 + self.msg2),
+                       'in_memory': False,
+                       'spilled_at': len(self.msg1 + self.msg2),
+                       'dropped': 0, }, })
+
+    def test_capture_in_ring_buffer_keeps_last_output(self):
+        with IOCapture(module=self.MODULE_NAME, stdout=True,
+                       ring=len(self.msg1) + 3) as io:
+            write_to_stdout(self.msg1)
+            write_to_stdout(self.msg2)
+            write_to_stdout(self.msg3)
+
+        self.assertEqual(io.get_stdout(), self.msg2[-3:] + self.msg3)
+        self.assertEqual(io.statistics['stdout']['dropped'],
+                         len(self.msg1) * 2 - 3)
+
+    def test_capture_file_descriptors(self):
+        with IOCapture(stdout=True, stderr=True, fd=True) as io:
+            sys.stdout.write(self.msg1)
+            os.write(1, self.msg2.encode('utf-8'))
+            subprocess.call(['echo', self.msg3.strip()])
+            subprocess.call(['sh', '-c', 'echo {} >&2'.format(
+                self.msg4.strip())])
+
+        self.assertEqual(io.get_stdout(), self.msg1 + self.msg2 + self.msg3)
+        self.assertEqual(io.get_stderr(), self.msg4)
+
+    def test_capture_file_descriptors_high_volume(self):
+        with IOCapture(stdout=True, fd=True, ring=10) as io:
+            subprocess.call(['head', '-c', '4000000', '/dev/zero'])
+
+        self.assertEqual(io.statistics['stdout']['size'], 4000000)
+
+    def test_capture_binary_output(self):
+        with IOCapture(stdout=True, binary=True) as io:
+            sys.stdout.write(self.msg1)
+            sys.stdout.buffer.write(self.msg2.encode('utf-8'))
+
+        self.assertEqual(io.get_stdout(), (self.msg1 + self.msg2).encode())
+        self.assertEqual(io.get_stderr(), b'')
+
+    def test_read_since_within_the_context(self):
+        with IOCapture(stdout=True, module=self.MODULE_NAME) as io:
+            write_to_stdout(self.msg1)
+            data, offset = io.stdout.read_since(0)
+            self.assertEqual(data, self.msg1)
+            write_to_stdout(self.msg2)
+            data, offset = io.stdout.read_since(offset)
+            self.assertEqual(data, self.msg2)
+
+    def test_capture_per_thread(self):
+        results = {}
+        go = threading.Event()
+
+        def worker(n):
+            with IOCapture(stdout=True, per_thread=True) as io:
+                go.wait()
+                for i in range(100):
+                    sys.stdout.write('{}\n'.format(n))
+            results[n] = io.get_stdout()
+
+        threads = [threading.Thread(target=worker, args=(n, ))
+                   for n in range(4)]
+        with IOCapture(stdout=True) as main:
+            for thread in threads:
+                thread.start()
+            go.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertIs(sys.stdout, main._oldout)
+        self.assertEqual(main.get_stdout(), '')
+        for n in range(4):
+            self.assertEqual(results[n], '{}\n'.format(n) * 100)
+
+    def test_capture_per_thread_nested(self):
+        with IOCapture(stdout=True, per_thread=True) as outer:
+            sys.stdout.write(self.msg1)
+            with IOCapture(stdout=True, per_thread=True) as inner:
+                sys.stdout.write(self.msg2)
+            sys.stdout.write(self.msg3)
+
+        self.assertEqual(outer.get_stdout(), self.msg1 + self.msg3)
+        self.assertEqual(inner.get_stdout(), self.msg2)
+        self.assertIs(sys.stdout, outer._oldout)
+
+    def test_capture_multiple_targets(self):
+        with IOCapture(stdout=False,
+                       targets=[(self.MODULE_NAME, 'stdout', 'out'),
+                                (self.MODULE_NAME, 'stderr'), ]) as io:
+            write_to_stdout(self.msg1)
+            write_to_stderr(self.msg2)
+            write_to_stdout(self.msg3)
+
+        self.assertEqual(io.get_combined(), self.msg1 + self.msg2 + self.msg3)
+        records = io.get_records()
+        self.assertEqual([x[1:] for x in records],
+                         [('out', self.msg1),
+                          ('{}.stderr'.format(self.MODULE_NAME), self.msg2),
+                          ('out', self.msg3), ])
+        self.assertEqual(sorted(x[0] for x in records),
+                         [x[0] for x in records])
+        self.assertEqual([x[2] for x in io.get_records('out')],
+                         [self.msg1, self.msg3])
+
+    def test_get_combined_without_targets(self):
+        with IOCapture(stdout=False) as io:
+            pass
+
+        self.assertEqual(io.get_combined(), '')
+        self.assertEqual(io.get_records(), [])
+
+    def test_capture_file_descriptors_per_thread_fails(self):
+        with self.assertRaises(ValueError):
+            IOCapture(fd=True, per_thread=True)
+
+    def test_capture_file_descriptors_per_module_fails(self):
+        with self.assertRaises(ValueError):
+            IOCapture(module=self.MODULE_NAME, fd=True)
+
+
+class CaptureBufferTestCase(TestCase):
+
+    def test_buffer_in_memory(self):
+        buf = CaptureBuffer()
+        buf.writelines(['a' * 10, 'b' * 10])
+
+        self.assertEqual(buf.getvalue(), 'a' * 10 + 'b' * 10)
+        self.assertIsNone(buf.spilled_at)
+
+    def test_buffer_file_from_the_start(self):
+        buf = CaptureBuffer(max_memory=0)
+        buf.write('abc')
+
+        self.assertEqual(buf.spilled_at, 0)
+        self.assertFalse(buf.statistics['in_memory'])
+        self.assertEqual(buf.getvalue(), 'abc')
+        buf.write('def')
+        self.assertEqual(buf.getvalue(), 'abcdef')
+        buf.close()
+
+    def test_ring_buffer_splits_chunks(self):
+        buf = CaptureBuffer(ring=4)
+        buf.write('abc')
+        buf.write('defgh')
+
+        self.assertEqual(buf.getvalue(), 'efgh')
+        self.assertEqual(buf.dropped, 4)
+        self.assertEqual(buf.size, 8)
+
+    def test_binary_buffer(self):
+        buf = CaptureBuffer(binary=True, encoding='utf-8')
+        buf.write('\u00e9t\u00e9\n')
+        buf.buffer.write(b'bytes\n')
+
+        self.assertEqual(buf.getvalue(), b'\xc3\xa9t\xc3\xa9\nbytes\n')
+        self.assertEqual(buf.size, 12)
+
+    def test_text_buffer_decodes(self):
+        buf = CaptureBuffer(encoding='utf-8')
+        buf.write(b'\xc3\xa9t\xc3\xa9')
+
+        self.assertEqual(buf.getvalue(), '\u00e9t\u00e9')
+
+    def test_getbuffer(self):
+        for kwargs in ({}, {'max_memory': 0}, {'ring': 4}):
+            buf = CaptureBuffer(binary=True, **kwargs)
+            buf.write(b'abcd')
+
+            view = buf.getbuffer()
+            self.assertEqual(view.tobytes(), b'abcd')
+            view.release()
+            buf.write(b'efgh')
+            self.assertEqual(buf.getbuffer().tobytes(), buf.getvalue())
+            buf.close()
+
+    def test_getbuffer_while_writing(self):
+        for kwargs in ({}, {'max_memory': 0}, {'ring': 16}):
+            buf = CaptureBuffer(binary=True, **kwargs)
+            buf.write(b'abcd')
+
+            view = buf.getbuffer()
+            buf.write(b'efgh')
+
+            self.assertEqual(view.tobytes(), b'abcd')
+            self.assertEqual(buf.getvalue(), b'abcdefgh')
+            buf.close()
+
+    def test_fd_redirect_survives_buffer_errors(self):
+        class Failing(object):
+            def write(self, data):
+                raise BufferError('Existing exports of data')
+
+        r, w = os.pipe()
+        self.addCleanup(os.close, w)
+        redirect = _FdRedirect(w, Failing())
+        redirect.start()
+        returncode = subprocess.call(
+            ['head', '-c', '4000000', '/dev/zero'], stdout=w)
+        redirect.stop()
+
+        self.assertEqual(returncode, 0)
+        self.assertGreater(redirect.errors, 0)
+        os.close(r)
+
+    def test_read_since(self):
+        for kwargs in ({}, {'max_memory': 0}, {'ring': 6}):
+            buf = CaptureBuffer(**kwargs)
+            buf.write('abc')
+            data, offset = buf.read_since(0)
+            self.assertEqual((data, offset), ('abc', 3))
+            self.assertEqual(buf.read_since(offset), ('', 3))
+
+            buf.write('defgh')
+            data, offset = buf.read_since(offset)
+            self.assertEqual((data, offset), ('defgh', 8))
+            buf.close()
+
+    def test_read_since_split_character(self):
+        buf = CaptureBuffer(encoding='utf-8')
+        buf.write(b'caf\xc3')
+
+        data, offset = buf.read_since(0)
+        self.assertEqual((data, offset), ('caf', 3))
+
+        buf.write(b'\xa9!')
+        self.assertEqual(buf.read_since(offset), ('\u00e9!', 6))
+
+    def test_read_since_skips_dropped_output(self):
+        buf = CaptureBuffer(ring=2)
+        buf.write('abcd')
+
+        self.assertEqual(buf.read_since(0), ('cd', 4))
+
+    def test_iterlines(self):
+        buf = CaptureBuffer(max_memory=0)
+        buf._CHUNK_SIZE = 4
+        buf.write('first\nsecond\n\nlast')
+        reads = []
+        read = buf._read
+
+        def spy(offset, size=-1):
+            reads.append(size)
+            return read(offset, size)
+        buf._read = spy
+
+        self.assertEqual(list(buf.iterlines()),
+                         ['first\n', 'second\n', '\n', 'last'])
+        self.assertEqual(list(buf.iterlines(6)), ['second\n', '\n', 'last'])
+        self.assertEqual(set(reads), set([4]))
+
+    def test_tagged_buffer_in_ring_mode_forgets_dropped_records(self):
+        buf = TaggedCaptureBuffer(ring=4)
+        buf.writer('a').write('abc')
+        buf.writer('b').write('def')
+        buf.writer('a').write('gh')
+
+        self.assertEqual([x[1:] for x in buf.records()],
+                         [('b', 'ef'), ('a', 'gh')])
+        self.assertEqual(buf.dropped_records, 1)
+
+    def test_tagged_buffer_records_are_bounded(self):
+        buf = TaggedCaptureBuffer(max_records=2)
+        for tag, data in [('a', 'abc'), ('b', 'def'), ('a', 'gh'), ]:
+            buf.writer(tag).write(data)
+
+        self.assertEqual([x[1:] for x in buf.records()],
+                         [('b', 'def'), ('a', 'gh')])
+        self.assertEqual(buf.getvalue(), 'abcdefgh')
+        self.assertEqual(buf.statistics['dropped_records'], 1)
+
+    def test_tagged_buffer_wrong_max_records(self):
+        with self.assertRaises(ValueError):
+            TaggedCaptureBuffer(max_records=-1)
+
+    def test_ring_buffer_wrong_size(self):
+        with self.assertRaises(ValueError):
+            CaptureBuffer(ring=-1)
+
 
 # vim: syntax=python:sws=4:sw=4:et:
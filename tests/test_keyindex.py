@@ -0,0 +1,254 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014-2015, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+from __future__ import unicode_literals
+import os
+import pwd
+import shutil
+import socket
+import sys
+from unittest import TestCase
+
+from ssh_harness import BaseSshClientTestCase
+from ssh_harness.contexts import BackupEditAndRestore
+from ssh_harness.keyindex import (
+    HELPER_PATH, KeyIndex, KeyIndexServer, _parse_key, fingerprint, )
+
+MODULE_PATH = os.path.abspath(os.path.dirname(__file__))
+TEMP_PATH = os.path.join(MODULE_PATH, 'tmp', 'keyindex')
+
+KEY = ('ssh-ed25519 '
+       'AAAAC3NzaC1lZDI1NTE5AAAAIBIlU8XAq0kDzU7d7QhrQ/5yjn3/5JWvQkGuz1oQ1wwU '
+       'alice@example')
+OTHER_KEY = ('ssh-ed25519 '
+             'AAAAC3NzaC1lZDI1NTE5AAAAIKUjNB1qQmtNfLiA6jpChYlnbPtQMB3OuI64lsBY'
+             '40YS bob@example')
+
+
+class KeyIndexHarness(BaseSshClientTestCase):
+
+    _BITS = dict(BaseSshClientTestCase._BITS, rsa='2048')
+    _FILES = {
+        'HOST_ECDSA_KEY': 'host_ssh_ecdsa_key',
+        'USER_RSA_KEY': 'id_rsa',
+        }
+    SSH_BASEDIR = TEMP_PATH
+    USE_AUTH_METHOD = BaseSshClientTestCase.AUTH_METHOD_PUBKEY
+    USE_KEY_INDEX = True
+
+
+class ParseKeyTestCase(TestCase):
+
+    def test_without_options(self):
+        self.assertEqual(_parse_key(KEY + '\n'), (None, KEY, ))
+
+    def test_with_options(self):
+        options = 'environment="A=b c",no-pty'
+        self.assertEqual(_parse_key('{} {}'.format(options, KEY)),
+                         (options, KEY, ))
+
+    def test_not_a_key(self):
+        with self.assertRaises(ValueError):
+            _parse_key('garbage')
+
+
+class FingerprintTestCase(TestCase):
+
+    def setUp(self):
+        os.makedirs(TEMP_PATH)
+        self.addCleanup(shutil.rmtree, TEMP_PATH)
+
+    def test_same_as_ssh_keygen(self):
+        path = os.path.join(TEMP_PATH, 'key.pub')
+        with open(path, 'w') as f:
+            f.write(KEY + '\n')
+        retval, out, err = BaseSshClientTestCase.runCommand(
+            [BaseSshClientTestCase.SSH_KEYGEN_BIN, '-E', 'sha256', '-lf',
+             path])
+
+        self.assertEqual(retval, 0)
+        self.assertEqual(fingerprint(KEY), out.split()[1])
+
+    def test_ignores_options(self):
+        self.assertEqual(fingerprint('no-pty ' + KEY), fingerprint(KEY))
+
+
+class KeyIndexTestCase(TestCase):
+
+    def setUp(self):
+        self.index = KeyIndex()
+
+    def test_add_and_lookup(self):
+        fp = self.index.add('alice', KEY)
+
+        self.assertEqual(fp, fingerprint(KEY))
+        self.assertEqual(self.index.lookup('alice', fp), [KEY])
+        self.assertEqual(self.index.lookup('alice'), [KEY])
+        self.assertEqual(self.index.lookup('bob', fp), [])
+        self.assertEqual(len(self.index), 1)
+
+    def test_add_with_options(self):
+        fp = self.index.add('alice', KEY, options='no-pty')
+
+        self.assertEqual(self.index.lookup('alice', fp),
+                         ['no-pty {}'.format(KEY)])
+
+    def test_add_keeps_key_options(self):
+        fp = self.index.add('alice', 'no-pty ' + KEY)
+
+        self.assertEqual(self.index.lookup('alice', fp),
+                         ['no-pty {}'.format(KEY)])
+
+    def test_add_replaces(self):
+        self.index.add('alice', KEY, options='no-pty')
+        self.index.add('alice', KEY)
+
+        self.assertEqual(self.index.lookup('alice'), [KEY])
+
+    def test_lookup_unknown_fingerprint(self):
+        self.index.add('alice', KEY)
+
+        self.assertEqual(self.index.lookup('alice', fingerprint(OTHER_KEY)),
+                         [])
+
+    def test_remove(self):
+        self.index.add('alice', KEY)
+        fp = self.index.add('alice', OTHER_KEY)
+
+        self.assertTrue(self.index.remove('alice', KEY))
+        self.assertFalse(self.index.remove('alice', KEY))
+        self.assertTrue(self.index.remove('alice', fp))
+        self.assertEqual(len(self.index), 0)
+
+
+class KeyIndexServerTestCase(TestCase):
+
+    def setUp(self):
+        os.makedirs(TEMP_PATH)
+        self.addCleanup(shutil.rmtree, TEMP_PATH)
+        self.index = KeyIndex()
+        self.path = os.path.join(TEMP_PATH, 'keyindex.sock')
+        self.server = KeyIndexServer(self.index, self.path)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def _query(self, *args):
+        return BaseSshClientTestCase.runCommand(
+            [sys.executable, '-E', '-S', HELPER_PATH, self.path] + list(args))
+
+    def test_helper_prints_matching_key(self):
+        fp = self.index.add('alice', KEY, options='no-pty')
+        self.index.add('alice', OTHER_KEY)
+
+        retval, out, err = self._query('alice', fp)
+
+        self.assertEqual(retval, 0)
+        self.assertEqual(out, 'no-pty {}\n'.format(KEY))
+
+    def test_helper_prints_all_keys(self):
+        self.index.add('alice', KEY)
+        self.index.add('alice', OTHER_KEY)
+
+        retval, out, err = self._query('alice')
+
+        self.assertEqual(retval, 0)
+        self.assertEqual(sorted(out.splitlines()), sorted([KEY, OTHER_KEY]))
+
+    def test_helper_unknown_key(self):
+        self.index.add('alice', KEY)
+
+        retval, out, err = self._query('alice', fingerprint(OTHER_KEY))
+
+        self.assertEqual(retval, 0)
+        self.assertEqual(out, '')
+
+    def test_stalled_client_does_not_block_others(self):
+        self.index.add('alice', KEY)
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(stalled.close)
+        stalled.connect(self.path)
+        stalled.sendall(b'alice')  # No end of line.
+
+        retval, out, err = BaseSshClientTestCase.runCommand(
+            [sys.executable, '-E', '-S', HELPER_PATH, self.path, 'alice'],
+            timeout=self.server.timeout / 2.0)
+
+        self.assertEqual(out, '{}\n'.format(KEY))
+
+    def test_stalled_client_times_out(self):
+        self.server.timeout = 0.1
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(stalled.close)
+        stalled.connect(self.path)
+        stalled.settimeout(5)
+
+        self.assertEqual(stalled.recv(4096), b'')
+
+    def test_stop_removes_socket(self):
+        self.server.stop()
+
+        self.assertFalse(os.path.exists(self.path))
+
+
+class KeyIndexHarnessTestCase(TestCase):
+
+    def setUp(self):
+        os.makedirs(TEMP_PATH)
+        self.addCleanup(self._cleanup)
+        self.args = KeyIndexHarness._gather_config()
+        KeyIndexHarness._generate_keys()
+        KeyIndexHarness._start_key_index()
+        self.user = pwd.getpwuid(os.getuid()).pw_name
+
+    def _cleanup(self):
+        KeyIndexHarness._stop_key_index()
+        BackupEditAndRestore.clear_context(KeyIndexHarness._context_name)
+        shutil.rmtree(TEMP_PATH)
+
+    def test_config(self):
+        config = self.args['authorized_keys_command_config']
+
+        self.assertIn('AuthorizedKeysCommand {} -E -S {} {} %u %f\n'.format(
+            KeyIndexHarness.AUTHORIZED_KEYS_COMMAND_PYTHON, HELPER_PATH,
+            os.path.join(TEMP_PATH, 'keyindex.sock')), config)
+        self.assertIn('AuthorizedKeysCommandUser {}\n'.format(self.user),
+                      config)
+
+    def test_user_key_is_authorized(self):
+        with open('{}.pub'.format(KeyIndexHarness.USER_RSA_KEY_PATH)) as f:
+            fp = fingerprint(f.read())
+
+        self.assertEqual(len(KeyIndexHarness._key_index.lookup(self.user,
+                                                               fp)), 1)
+
+    def test_authorize_and_revoke(self):
+        fp = KeyIndexHarness.authorizeKey(KEY, options='no-pty')
+
+        self.assertEqual(KeyIndexHarness._key_index.lookup(self.user, fp),
+                         ['no-pty {}'.format(KEY)])
+        self.assertTrue(KeyIndexHarness.revokeKey(fp))
+        self.assertEqual(KeyIndexHarness._key_index.lookup(self.user, fp), [])
+
+    def test_disabled(self):
+        KeyIndexHarness._stop_key_index()
+
+        with self.assertRaises(RuntimeError):
+            KeyIndexHarness.authorizeKey(KEY)
+
+
+# vim: syntax=python:sws=4:sw=4:et:
@@ -0,0 +1,166 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014-2015, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+from __future__ import unicode_literals
+import os
+import threading
+import time
+from unittest import TestCase
+
+from ssh_harness import BaseSshClientTestCase
+from ssh_harness.keypool import KeyPairPool
+
+MODULE_PATH = os.path.abspath(os.path.dirname(__file__))
+TEMP_PATH = os.path.join(MODULE_PATH, 'tmp', 'keypool')
+
+
+class FakeGenerator(object):
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.generated = []
+        self.lock = threading.Lock()
+
+    def __call__(self, key_type, path):
+        if self.fail:
+            raise RuntimeError('ssh-keygen failed')
+        for name in (path, '{}.pub'.format(path), ):
+            with open(name, 'w') as f:
+                f.write(key_type)
+        with self.lock:
+            self.generated.append((key_type, path, ))
+
+
+class KeyPoolHarness(BaseSshClientTestCase):
+
+    _BITS = dict(BaseSshClientTestCase._BITS, rsa='2048')
+    SSH_BASEDIR = TEMP_PATH
+    USE_AUTH_METHOD = BaseSshClientTestCase.AUTH_METHOD_PUBKEY
+    KEY_PAIR_POOL = {'ecdsa': 2}
+
+
+class KeyPairPoolTestCase(TestCase):
+
+    def _pool(self, generate, low_water):
+        pool = KeyPairPool(TEMP_PATH, generate, low_water)
+        self.addCleanup(pool.close)
+        return pool
+
+    def _wait_for(self, pool, key_type, count):
+        deadline = time.time() + 5
+        while pool.available(key_type) < count and time.time() < deadline:
+            time.sleep(0.01)
+        return pool.available(key_type)
+
+    def test_fills_to_low_water(self):
+        generate = FakeGenerator()
+        pool = self._pool(generate, {'rsa': 3, 'ecdsa': 2})
+        pool.start()
+
+        self.assertEqual(self._wait_for(pool, 'rsa', 3), 3)
+        self.assertEqual(self._wait_for(pool, 'ecdsa', 2), 2)
+        time.sleep(0.05)
+        self.assertEqual(len(generate.generated), 5)
+
+    def test_draw_refills(self):
+        generate = FakeGenerator()
+        pool = self._pool(generate, {'ecdsa': 2})
+        pool.start()
+
+        path = pool.draw('ecdsa', timeout=5)
+
+        self.assertTrue(os.path.isfile(path))
+        self.assertTrue(os.path.isfile('{}.pub'.format(path)))
+        self.assertEqual(self._wait_for(pool, 'ecdsa', 2), 2)
+        self.assertEqual(len(generate.generated), 3)
+        self.assertNotIn(path, [pool.draw('ecdsa', timeout=5),
+                                pool.draw('ecdsa', timeout=5)])
+
+    def test_draw_without_producer(self):
+        generate = FakeGenerator()
+        pool = self._pool(generate, {'ecdsa': 2})
+        os.makedirs(TEMP_PATH)
+
+        path = pool.draw('ecdsa')
+
+        self.assertEqual(generate.generated, [('ecdsa', path, )])
+
+    def test_draw_unknown_type(self):
+        pool = self._pool(FakeGenerator(), {'ecdsa': 1})
+
+        with self.assertRaises(ValueError):
+            pool.draw('rsa')
+
+    def test_generation_failure(self):
+        pool = self._pool(FakeGenerator(fail=True), {'ecdsa': 1})
+        pool.start()
+
+        with self.assertRaises(RuntimeError):
+            pool.draw('ecdsa', timeout=5)
+
+    def test_draw_timeout(self):
+        release = threading.Event()
+        pool = self._pool(lambda key_type, path: release.wait(),
+                          {'ecdsa': 1})
+        self.addCleanup(release.set)  # Before the pool is closed.
+        pool.start()
+
+        with self.assertRaises(RuntimeError):
+            pool.draw('ecdsa', timeout=0.1)
+
+    def test_draw_after_close(self):
+        pool = self._pool(FakeGenerator(), {'ecdsa': 1})
+        pool.start()
+        pool.close()
+
+        with self.assertRaises(RuntimeError):
+            pool.draw('ecdsa')
+
+    def test_close_deletes_keys(self):
+        pool = self._pool(FakeGenerator(), {'ecdsa': 1})
+        pool.start()
+        pool.draw('ecdsa', timeout=5)
+
+        pool.close()
+
+        self.assertFalse(os.path.exists(TEMP_PATH))
+
+
+class KeyPoolHarnessTestCase(TestCase):
+
+    def setUp(self):
+        KeyPoolHarness._gather_config()
+        KeyPoolHarness._start_key_pair_pool()
+        self.addCleanup(KeyPoolHarness._stop_key_pair_pool)
+
+    def test_draw_key_pair(self):
+        path = KeyPoolHarness.drawKeyPair('ecdsa', timeout=30)
+
+        self.assertTrue(path.startswith(TEMP_PATH))
+        with open('{}.pub'.format(path)) as f:
+            self.assertTrue(f.read().startswith('ecdsa-'))
+        self.assertNotEqual(path, KeyPoolHarness.drawKeyPair(timeout=30))
+
+    def test_not_enabled(self):
+        KeyPoolHarness._stop_key_pair_pool()
+
+        with self.assertRaises(RuntimeError):
+            KeyPoolHarness.drawKeyPair()
+
+
+# vim: syntax=python:sws=4:sw=4:et:
@@ -0,0 +1,225 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014-2015, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+from __future__ import unicode_literals
+import json
+import threading
+import time
+from unittest import TestCase
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from ssh_harness import PubKeyAuthSshClientTestCase
+from ssh_harness.benchmarks import handshake
+from ssh_harness.load import Histogram, LoadReport, run_load
+
+
+class HistogramTestCase(TestCase):
+
+    def test_empty(self):
+        histogram = Histogram()
+
+        self.assertEqual(histogram.count, 0)
+        self.assertIsNone(histogram.percentile(50))
+        self.assertIsNone(histogram.mean)
+
+    def test_percentiles(self):
+        histogram = Histogram(significant_figures=3)
+        for i in range(1, 1001):
+            histogram.record(i / 1000.0)
+
+        self.assertEqual(histogram.count, 1000)
+        self.assertAlmostEqual(histogram.min, 0.001)
+        self.assertAlmostEqual(histogram.max, 1.0)
+        self.assertAlmostEqual(histogram.mean, 0.5005)
+        for percent, expected in ((50, 0.5), (99, 0.99), (99.9, 0.999), ):
+            value = histogram.percentile(percent)
+            self.assertGreaterEqual(value, expected)
+            self.assertLessEqual(value, expected * 1.001)
+        self.assertAlmostEqual(histogram.percentile(100), 1.0)
+
+    def test_bounded_buckets(self):
+        histogram = Histogram(significant_figures=2)
+        for i in range(0, 100000):
+            histogram.record(i * 1e-5)
+
+        self.assertLess(len(histogram.to_dict()['buckets']), 2000)
+
+    def test_merge(self):
+        one, other = Histogram(), Histogram()
+        one.record(0.1)
+        other.record(0.3, count=3)
+
+        one.merge(other)
+
+        self.assertEqual(one.count, 4)
+        self.assertAlmostEqual(one.max, 0.3)
+        self.assertAlmostEqual(one.percentile(25), 0.1, places=3)
+
+    def test_merge_different_precisions(self):
+        with self.assertRaises(ValueError):
+            Histogram(2).merge(Histogram(3))
+
+    def test_to_and_from_dict(self):
+        histogram = Histogram()
+        for value in (0.01, 0.02, 0.5, ):
+            histogram.record(value)
+
+        data = json.loads(json.dumps(histogram.to_dict()))
+        copy = Histogram.from_dict(data)
+
+        self.assertEqual(copy.to_dict(), histogram.to_dict())
+
+
+class RunLoadTestCase(TestCase):
+
+    def test_count(self):
+        report = run_load(lambda: {'auth': 0.001}, concurrency=4, count=50)
+
+        self.assertEqual(report.requests, 50)
+        self.assertEqual(report.errors, 0)
+        self.assertEqual(report.histograms['total'].count, 50)
+        self.assertEqual(report.histograms['auth'].count, 50)
+        self.assertGreater(report.throughput, 0)
+
+    def test_rate(self):
+        report = run_load(lambda: {}, rate=100, concurrency=2, count=20)
+
+        # The last request is scheduled 190ms after the first.
+        self.assertGreaterEqual(report.elapsed, 0.19)
+        self.assertEqual(report.requests, 20)
+
+    def test_duration(self):
+        report = run_load(lambda: {}, rate=50, duration=0.2)
+
+        self.assertLessEqual(report.requests, 10)
+        self.assertGreaterEqual(report.requests, 9)
+
+    def test_late_requests_include_waiting_time(self):
+        # A single thread cannot keep up with the rate: the last requests
+        # start late, which must show in their latency.
+        report = run_load(lambda: time.sleep(0.02) or {}, rate=1000,
+                          count=10)
+
+        self.assertGreaterEqual(report.histograms['total'].max, 0.15)
+
+    def test_errors(self):
+        lock = threading.Lock()
+        calls = []
+
+        def probe():
+            with lock:
+                calls.append(None)
+                if len(calls) % 2:
+                    raise RuntimeError('connection refused')
+            return {}
+
+        report = run_load(probe, concurrency=2, count=10)
+
+        self.assertEqual(report.errors, 5)
+        self.assertEqual(report.histograms['total'].count, 5)
+        self.assertEqual('{}'.format(report.last_error),
+                         'connection refused')
+
+    def test_requires_an_end(self):
+        with self.assertRaises(ValueError):
+            run_load(lambda: {})
+
+    def test_to_json(self):
+        report = run_load(lambda: {'connect': 0.002}, count=3)
+
+        data = json.loads(report.to_json())
+
+        self.assertEqual(data['requests'], 3)
+        self.assertEqual(sorted(data['phases']), ['connect', 'total'])
+        self.assertEqual(data['phases']['connect']['count'], 3)
+        self.assertIn('p999', data['phases']['total'])
+        self.assertIn('connect', report.summary())
+
+
+class RunLoadHarnessTestCase(TestCase):
+
+    def test_ssh_backend(self):
+        class Harness(PubKeyAuthSshClientTestCase):
+
+            @classmethod
+            def _ssh_client_command(cls, remote=None, options=None):
+                return ['sh', '-c', remote]
+
+        report = Harness.runLoad(['exit', '0'], concurrency=2, count=4)
+
+        self.assertIsInstance(report, LoadReport)
+        self.assertEqual(report.histograms['total'].count, 4)
+        self.assertEqual(sorted(report.histograms), ['total'])
+
+        report = Harness.runLoad('echo oops >&2; exit 255', count=2)
+
+        self.assertEqual(report.errors, 2)
+        self.assertIn('oops', '{}'.format(report.last_error))
+
+
+class HandshakeBenchmarkTestCase(TestCase):
+
+    def test_run(self):
+        calls = []
+
+        class Harness(object):
+            REMOTE_BACKEND = None
+
+            @classmethod
+            def setUpClass(cls):
+                calls.append(('setUp', cls.REMOTE_BACKEND, ))
+
+            @classmethod
+            def runLoad(cls, cmd, count):
+                return run_load(lambda: {}, count=count)
+
+            @classmethod
+            def tearDownClass(cls):
+                calls.append(('tearDown', cls.REMOTE_BACKEND, ))
+
+        with patch.object(handshake, 'PROFILES', (('default', Harness, ), )):
+            reports = handshake.run(count=3, backend='paramiko')
+
+        self.assertEqual([x for x, y in reports], ['default'])
+        self.assertEqual(reports[0][1].histograms['total'].count, 3)
+        self.assertEqual(calls, [('setUp', 'paramiko'),
+                                 ('tearDown', 'paramiko')])
+
+    def test_profiles(self):
+        self.assertEqual([x[1].SSHD_PROFILE for x in handshake.PROFILES],
+                         [None, 'fast'])
+
+
+class LoadProfileTestCase(PubKeyAuthSshClientTestCase):
+    """Checks the daemon handles concurrent connections (skipped when
+    :program:`sshd` is not available)."""
+
+    _context_name = 'test_load_profile'
+    LOAD_PROFILE = 40
+
+    def test_concurrent_connections(self):
+        report = self.runLoad('true', concurrency=40, count=200, timeout=60)
+
+        self.assertEqual(report.errors, 0, report.last_error)
+        self.assertEqual(report.histograms['total'].count, 200)
+
+
+# vim: syntax=python:sws=4:sw=4:et:
@@ -0,0 +1,99 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014-2015, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+from __future__ import unicode_literals
+import logging
+from unittest import TestCase
+
+from ssh_harness.contexts import IOCapture, LogCapture
+
+
+class LogCaptureTestCase(TestCase):
+
+    def setUp(self):
+        self.parent = logging.getLogger('tests.logcapture')
+        self.child = logging.getLogger('tests.logcapture.child')
+        self.parent.setLevel(logging.WARNING)
+        self.addCleanup(self.parent.setLevel, logging.NOTSET)
+
+    def _log(self):
+        self.parent.debug('debug %s', 1)
+        self.child.info('info %s', 2)
+        self.parent.warning('warning %s', 3)
+        self.child.error('error %s', 4)
+
+    def test_capture_records(self):
+        with LogCapture('tests.logcapture', logging.DEBUG) as logs:
+            self._log()
+        self.parent.error('not captured')
+
+        self.assertEqual(len(logs), 4)
+        self.assertEqual(logs.messages(),
+                         ['debug 1', 'info 2', 'warning 3', 'error 4'])
+        self.assertTrue(
+            all(isinstance(x, logging.LogRecord) for x in logs.records()))
+        self.assertEqual(self.parent.level, logging.WARNING)
+
+    def test_query_records(self):
+        with LogCapture('tests.logcapture', logging.DEBUG) as logs:
+            self._log()
+
+        self.assertEqual(logs.messages(level=logging.INFO), ['info 2'])
+        self.assertEqual(logs.messages(min_level=logging.INFO),
+                         ['info 2', 'warning 3', 'error 4'])
+        self.assertEqual(logs.messages(logger='tests.logcapture.child'),
+                         ['info 2', 'error 4'])
+        self.assertEqual(logs.messages(logger='tests.logcapture',
+                                       min_level=logging.INFO),
+                         ['warning 3'])
+        self.assertEqual(logs.messages(logger='tests.logcapture',
+                                       level=logging.INFO), [])
+
+    def test_level_is_honoured(self):
+        with LogCapture('tests.logcapture', logging.WARNING) as logs:
+            self._log()
+
+        self.assertEqual(logs.messages(), ['warning 3', 'error 4'])
+
+    def test_bounded(self):
+        with LogCapture('tests.logcapture', logging.DEBUG,
+                        maxlen=2) as logs:
+            self._log()
+
+        self.assertEqual(logs.messages(), ['warning 3', 'error 4'])
+        self.assertEqual(logs.messages(level=logging.INFO), [])
+        self.assertEqual(logs.messages(logger='tests.logcapture.child'),
+                         ['error 4'])
+        self.assertEqual(logs.dropped, 2)
+
+    def test_clear(self):
+        with LogCapture('tests.logcapture') as logs:
+            self._log()
+            logs.clear()
+
+        self.assertEqual(logs.records(), [])
+
+    def test_along_with_iocapture(self):
+        with IOCapture(stdout=False, logs='tests.logcapture') as io:
+            self.parent.warning('warning')
+
+        self.assertEqual(io.logs.messages(), ['warning'])
+        self.assertNotIn(io.logs._handler, self.parent.handlers)
+
+
+# vim: syntax=python:sws=4:sw=4:et:
@@ -17,10 +17,22 @@
 #  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
 #
 from __future__ import unicode_literals
-from unittest import TestCase
+import os
+import signal
+import sys
+import time
+from unittest import TestCase, skipIf
 import warnings
+try:
+    import resource
+except ImportError:  # Not a POSIX platform.
+    resource = None
 
 from ssh_harness import PubKeyAuthSshClientTestCase
+from ssh_harness.benchmarks import spawn
+from ssh_harness.commands import (
+    CommandStream, CommandTimeoutError, DEVNULL, PIPE, )
+import ssh_harness.commands
 
 
 class RunCommandsTestCase(TestCase):
@@ -60,4 +72,425 @@ class RunCommandsTestCase(TestCase):
         self.assertEqual(w[-1].category, UserWarning)
 
 
+class CommandResultTestCase(TestCase):
+
+    def test_run_command_result_unpacks(self):
+        result = PubKeyAuthSshClientTestCase.runCommand(['echo', 'hello'])
+        retval, out, err = result
+
+        self.assertEqual(result, (0, 'hello\n', ''))
+        self.assertEqual(result.returncode, retval)
+        self.assertEqual(result.out, out)
+        self.assertEqual(result.err, err)
+
+    def test_run_command_result_timings(self):
+        result = PubKeyAuthSshClientTestCase.runCommand(
+            ['sh', '-c', 'sleep 0.2; echo late; sleep 0.2'])
+
+        self.assertGreaterEqual(result.wall_time, 0.4)
+        self.assertGreaterEqual(result.first_byte_time, 0.2)
+        self.assertLess(result.first_byte_time, result.wall_time)
+
+    def test_run_command_result_silent(self):
+        result = PubKeyAuthSshClientTestCase.runCommand(['true'])
+
+        self.assertIsNone(result.first_byte_time)
+
+    def test_run_command_result_rusage(self):
+        result = PubKeyAuthSshClientTestCase.runCommand(
+            [sys.executable, '-c',
+             'import time\n'
+             'end = time.time() + 0.3\n'
+             'while time.time() < end:\n'
+             '    pass\n'
+             'data = bytearray(64 << 20)\n'])
+
+        self.assertGreater(result.user_time + result.system_time, 0.2)
+        self.assertGreater(result.max_rss, 64 << 10)
+
+    def test_run_command_result_signal(self):
+        result = PubKeyAuthSshClientTestCase.runCommand(
+            ['sh', '-c', 'kill -9 $$'])
+
+        self.assertEqual(result.returncode, -9)
+
+
+class EnvironmentHarness(PubKeyAuthSshClientTestCase):
+
+    CHILD_ENVIRONMENT = {'SSH_HARNESS_TEST_VAR': 'value', 'HOME': None}
+
+
+class SpawnTestCase(TestCase):
+
+    def tearDown(self):
+        EnvironmentHarness._child_environment = None
+
+    def test_run_command_discard_output(self):
+        result = PubKeyAuthSshClientTestCase.runCommand(
+            ['sh', '-c', 'echo out; echo err >&2'], stdout=DEVNULL)
+
+        self.assertEqual(result, (0, '', 'err\n'))
+
+    def test_run_command_stdin_is_not_inherited(self):
+        result = PubKeyAuthSshClientTestCase.runCommand(['cat'], timeout=5)
+
+        self.assertEqual(result, (0, '', ''))
+
+    def test_command_stream_popen_fallback(self):
+        have_spawn = ssh_harness.commands._HAVE_POSIX_SPAWN
+        self.addCleanup(setattr, ssh_harness.commands, '_HAVE_POSIX_SPAWN',
+                        have_spawn)
+        ssh_harness.commands._HAVE_POSIX_SPAWN = False
+        stream = CommandStream(['sh', '-c', 'cat; echo err >&2'],
+                               input='in', stdout=PIPE, stderr=DEVNULL)
+
+        self.assertEqual(stream.communicate(), ('in', ''))
+        self.assertEqual(stream.returncode, 0)
+
+    def test_child_environment(self):
+        retval, out, err = EnvironmentHarness.runCommand(
+            ['sh', '-c', 'echo "$SSH_HARNESS_TEST_VAR:${HOME-unset}"'])
+
+        self.assertEqual(out, 'value:unset\n')
+        self.assertIs(EnvironmentHarness._child_env(),
+                      EnvironmentHarness._child_env())
+        self.assertIsNone(PubKeyAuthSshClientTestCase._child_env())
+
+    def test_spawn_benchmark(self):
+        rates = spawn.run(count=3)
+
+        self.assertEqual([name for name, rate in rates],
+                         ['popen', 'stream', 'devnull'])
+        for name, rate in rates:
+            self.assertGreater(rate, 0)
+
+
+class LocalShellHarness(PubKeyAuthSshClientTestCase):
+    """Runs the "remote" commands with a local shell."""
+
+    REMOTE = ['sh']
+
+    @classmethod
+    def _ssh_client_command(cls, remote=None, options=None):
+        return cls.REMOTE
+
+
+class RunRemoteCommandsTestCase(TestCase):
+
+    def tearDown(self):
+        LocalShellHarness.REMOTE = ['sh']
+
+    def test_ssh_client_command(self):
+        class Harness(PubKeyAuthSshClientTestCase):
+            USER_RSA_KEY_PATH = '/path/to/id_rsa'
+
+        cmd = Harness._ssh_client_command('uptime', options=['-v'])
+
+        self.assertEqual(cmd[0], Harness.SSH_BIN)
+        self.assertEqual(cmd[cmd.index('-i') + 1], '/path/to/id_rsa')
+        self.assertIn('BatchMode=yes', cmd)
+        self.assertEqual(cmd[-3:], ['-v', Harness.BIND_ADDRESS, 'uptime'])
+
+    def test_run_remote_commands(self):
+        results = LocalShellHarness.runRemoteCommands([
+            'echo out; echo err >&2; exit 3',
+            ['printf', '%s', 'no newline'],
+            'cat; cd /; pwd',
+            'pwd',
+            ])
+
+        self.assertEqual(results, [(3, 'out\n', 'err\n'),
+                                   (0, 'no newline', ''),
+                                   (0, '/\n', ''),
+                                   (0, '{}\n'.format(os.getcwd()), '')])
+
+    def test_run_remote_commands_interrupted(self):
+        results = LocalShellHarness.runRemoteCommands(
+            ['true', 'kill -9 $$', 'true'])
+
+        self.assertEqual(results, [(0, '', ''), None, None])
+
+    def test_run_remote_commands_connection_failure(self):
+        LocalShellHarness.REMOTE = ['sh', '-c', 'echo refused >&2; exit 255']
+        with self.assertRaises(RuntimeError):
+            LocalShellHarness.runRemoteCommands(['true'])
+
+    def test_run_remote_commands_empty(self):
+        self.assertEqual(LocalShellHarness.runRemoteCommands([]), [])
+
+
+class SlowCommandHarness(PubKeyAuthSshClientTestCase):
+
+    COMMAND_TIMEOUT = 0.3
+
+
+class RunCommandTimeoutTestCase(TestCase):
+
+    def test_run_command_timeout(self):
+        start = time.time()
+        with self.assertRaises(CommandTimeoutError) as cm:
+            PubKeyAuthSshClientTestCase.runCommand(
+                ['sh', '-c', 'echo partial; echo oops >&2; sleep 10'],
+                timeout=0.3)
+
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(cm.exception.out, 'partial\n')
+        self.assertEqual(cm.exception.err, 'oops\n')
+        self.assertEqual(cm.exception.timeout, 0.3)
+        self.assertNotEqual(cm.exception.returncode, 0)
+
+    def test_run_command_class_timeout(self):
+        with self.assertRaises(CommandTimeoutError):
+            SlowCommandHarness.runCommand(['sleep', '10'])
+
+        retval, out, err = SlowCommandHarness.runCommand(['true'])
+        self.assertEqual(retval, 0)
+
+    def test_run_command_timeout_kills_process_group(self):
+        # The grand-child inherits the pipes, unless killed too the command
+        # would never seem to terminate.
+        start = time.time()
+        with self.assertRaises(CommandTimeoutError):
+            PubKeyAuthSshClientTestCase.runCommand(
+                ['sh', '-c', 'sh -c "trap \'\' TERM; sleep 10"; sleep 10'],
+                timeout=0.3)
+
+        self.assertLess(time.time() - start, 5)
+
+    def test_run_commands_timeout(self):
+        with self.assertRaises(CommandTimeoutError):
+            PubKeyAuthSshClientTestCase.runCommands(
+                [['true'], ['sleep', '10']], timeout=0.3)
+
+
+class RunCommandsBatchTestCase(TestCase):
+
+    def test_run_commands_order(self):
+        results = PubKeyAuthSshClientTestCase.runCommands(
+            [['sh', '-c', 'sleep 0.{}; echo {}'.format(3 - i, i)]
+             for i in range(0, 3)],
+            max_workers=3)
+
+        self.assertEqual([r for r, t in results],
+                         [(0, '{}\n'.format(i), '') for i in range(0, 3)])
+        for result, elapsed in results:
+            self.assertGreater(elapsed, 0)
+
+    def test_run_commands_concurrently(self):
+        start = time.time()
+        PubKeyAuthSshClientTestCase.runCommands(
+            [['sleep', '0.3']] * 4, max_workers=4)
+
+        self.assertLess(time.time() - start, 1.0)
+
+    def test_run_commands_fail_fast(self):
+        results = PubKeyAuthSshClientTestCase.runCommands(
+            [['true'], ['false'], ['true'], ['true']],
+            max_workers=1, fail_fast=True)
+
+        self.assertEqual(results[0][0][0], 0)
+        self.assertEqual(results[1][0][0], 1)
+        self.assertEqual(results[2:], [None, None])
+
+    def test_run_commands_without_fail_fast(self):
+        results = PubKeyAuthSshClientTestCase.runCommands(
+            [['false'], ['true']], max_workers=1)
+
+        self.assertEqual([r[0][0] for r in results], [1, 0])
+
+    def test_run_commands_error(self):
+        with self.assertRaises(OSError):
+            PubKeyAuthSshClientTestCase.runCommands(
+                [['true'], ['/nonexistent/command']])
+
+
+class RunCommandStreamTestCase(TestCase):
+
+    def test_run_command_stream_chunks(self):
+        stream = PubKeyAuthSshClientTestCase.runCommandStream(
+            ['sh', '-c', 'printf "abc"; printf "err" >&2'])
+        chunks = list(stream)
+
+        self.assertEqual(
+            ''.join(x for n, x in chunks if 'stdout' == n), 'abc')
+        self.assertEqual(
+            ''.join(x for n, x in chunks if 'stderr' == n), 'err')
+        self.assertEqual(stream.returncode, 0)
+
+    def test_run_command_stream_lines(self):
+        stream = PubKeyAuthSshClientTestCase.runCommandStream(
+            ['sh', '-c', 'printf "a\\nbb\\n"; sleep 0.1; printf "c"; exit 3'],
+            lines=True)
+        lines = [x for n, x in stream]
+
+        self.assertEqual(lines, ['a\n', 'bb\n', 'c'])
+        self.assertEqual(stream.returncode, 3)
+
+    def test_run_command_stream_binary_input(self):
+        data = b'\x00\xff' * 100000
+        stream = PubKeyAuthSshClientTestCase.runCommandStream(
+            ['cat'], input=data, binary=True)
+
+        self.assertEqual(b''.join(x for n, x in stream), data)
+        self.assertEqual(stream.returncode, 0)
+
+    def test_run_command_large_input(self):
+        start = time.time()
+        result = PubKeyAuthSshClientTestCase.runCommand(
+            ['wc', '-c'], input=b'x' * (16 * 1024 * 1024))
+
+        self.assertEqual(result.out.strip(), '{}'.format(16 * 1024 * 1024))
+        # Writing the input used to take quadratic time.
+        self.assertLess(time.time() - start, 10)
+
+    @skipIf((3, 0, 0, ) > sys.version_info, 'Output is not decoded')
+    def test_run_command_stream_incremental_decoding(self):
+        stream = CommandStream(
+            [sys.executable, '-c',
+             'import os, time\n'
+             'os.write(1, b"\\xc3")\n'
+             'time.sleep(0.1)\n'
+             'os.write(1, b"\\xa9")\n'],
+            encoding='utf-8')
+
+        self.assertEqual(''.join(x for n, x in stream), '\u00e9')
+
+    def test_run_command_interrupted_kills_command(self):
+        stream = CommandStream(['sh', '-c', 'echo started; sleep 30'])
+
+        def interrupt(name, data, final=False):
+            raise KeyboardInterrupt()
+        stream._feed = interrupt
+        start = time.time()
+        with self.assertRaises(KeyboardInterrupt):
+            stream.communicate()
+
+        self.assertIsNotNone(stream.returncode)
+        self.assertNotEqual(stream.returncode, 0)
+        self.assertLess(time.time() - start, 10)
+
+    @skipIf(resource is None, 'Requires the resource module')
+    def test_run_command_stream_high_descriptors(self):
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if resource.RLIM_INFINITY != hard and 2048 > hard:
+            self.skipTest('Cannot open more than 1024 files')
+        if resource.RLIM_INFINITY != soft and 2048 > soft:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (2048, hard, ))
+            self.addCleanup(resource.setrlimit, resource.RLIMIT_NOFILE,
+                            (soft, hard, ))
+        # Push the command's pipes beyond select()'s FD_SETSIZE.
+        fds = [os.open(os.devnull, os.O_RDONLY)]
+        while 1100 > fds[-1]:
+            fds.append(os.dup(fds[0]))
+        for fd in fds:
+            self.addCleanup(os.close, fd)
+
+        stream = CommandStream(['cat'], input='in')
+
+        self.assertEqual(stream.communicate(), ('in', ''))
+        self.assertEqual(stream.returncode, 0)
+
+    @skipIf(not hasattr(signal, 'SIGCHLD'), 'Requires SIGCHLD')
+    def test_run_command_reaped_elsewhere(self):
+        # With SIGCHLD ignored, children are reaped by the kernel and their
+        # exit status cannot be collected.
+        handler = signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+        self.addCleanup(signal.signal, signal.SIGCHLD, handler)
+        stream = CommandStream(['sh', '-c', 'echo out'])
+
+        self.assertEqual(stream.communicate(), ('out\n', ''))
+        self.assertEqual(stream.returncode,
+                         ssh_harness.commands._UNKNOWN_RETURNCODE)
+
+    def test_run_command_stream_close(self):
+        with PubKeyAuthSshClientTestCase.runCommandStream(
+                ['sh', '-c', 'echo started; sleep 10']) as stream:
+            for name, data in stream:
+                break
+
+        self.assertNotEqual(stream.returncode, 0)
+
+
+@skipIf((3, 5, 0, ) > sys.version_info, 'Requires Python 3.5 or later')
+class RunCommandAsyncTestCase(TestCase):
+
+    def test_run_command_async_concurrently(self):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.addCleanup(loop.close)
+        self.addCleanup(asyncio.set_event_loop, None)
+        seen = []
+        coros = [
+            PubKeyAuthSshClientTestCase.runCommandAsync(
+                ['sh', '-c', 'cat; echo {} >&2; exit {}'.format(i, i)],
+                input='in{}'.format(i),
+                on_output=lambda n, d: seen.append(n))
+            for i in range(0, 3)]
+        results = loop.run_until_complete(asyncio.gather(*coros))
+
+        self.assertEqual(results, [(i, 'in{}'.format(i), '{}\n'.format(i))
+                                   for i in range(0, 3)])
+        self.assertIn('stdout', seen)
+        self.assertIn('stderr', seen)
+
+    def test_run_command_async_timeout(self):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        start = time.time()
+
+        with self.assertRaises(CommandTimeoutError) as cm:
+            loop.run_until_complete(
+                PubKeyAuthSshClientTestCase.runCommandAsync(
+                    ['sh', '-c', 'echo partial; '
+                     'sh -c "trap \'\' TERM; sleep 10"; sleep 10'],
+                    timeout=0.3))
+
+        self.assertEqual(cm.exception.out, 'partial\n')
+        self.assertLess(time.time() - start, 5)
+
+    def test_run_command_async_cancelled_kills_command(self):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        pids = []
+
+        async def cancelled():
+            task = loop.create_task(
+                PubKeyAuthSshClientTestCase.runCommandAsync(
+                    ['sh', '-c', 'echo $$; sleep 10'],
+                    on_output=lambda n, d: pids.append(int(d))))
+            while not pids:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        loop.run_until_complete(asyncio.wait_for(cancelled(), 5))
+
+        with self.assertRaises(OSError):
+            os.kill(pids[0], 0)
+
+    def test_run_command_async_stdin_is_not_inherited(self):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        # A standard input that never ends: cat would wait forever on it.
+        r, w = os.pipe()
+        saved = os.dup(0)
+        os.dup2(r, 0)
+        try:
+            result = loop.run_until_complete(asyncio.wait_for(
+                PubKeyAuthSshClientTestCase.runCommandAsync(['cat']), 5))
+        finally:
+            os.dup2(saved, 0)
+            for fd in (saved, r, w, ):
+                os.close(fd)
+
+        self.assertEqual(result, (0, '', ''))
+
+
 # vim: syntax=python:sws=4:sw=4:et:
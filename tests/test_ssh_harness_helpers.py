@@ -18,6 +18,8 @@
 #
 from __future__ import print_function, unicode_literals
 import os
+import pwd
+import shutil
 import stat
 import sys
 import tempfile
@@ -38,6 +40,7 @@ sys.path.append(os.path.join(FIXTURE_PATH, 'bin'))
 import fake_ssh_keyscan
 
 from ssh_harness.contexts import BackupEditAndRestore
+from ssh_harness.keyindex import KeyIndex, fingerprint
 from ssh_harness import BaseSshClientTestCase, _PermissionError
 
 
@@ -268,6 +271,49 @@ class SshHarnessSetUpClassTestCase(TestCase):
         mock_logger.setLevel.assert_called_once_with(logging.DEBUG, )
 
 
+class SshHarnessSetUpFailureTestCase(TestCase):
+
+    def setUp(self):
+        self._lang = os.environ.get('LANG', None)
+
+    def tearDown(self):
+        # tearDownClass() is mocked, it does not restore LANG.
+        if self._lang is None:
+            os.environ.pop('LANG', None)
+        else:
+            os.environ['LANG'] = self._lang
+        for k in list(SshHarnessSkip._errors.keys()):
+            del SshHarnessSkip._errors[k]
+
+    def test_setupclass_failure_cleans_up(self):
+        with patch.object(SshHarnessSkip, '_start_sshd',
+                          side_effect=RuntimeError('sshd crashed')), \
+                patch.object(SshHarnessSkip, 'tearDownClass') as teardown:
+            with self.assertRaisesRegexp(RuntimeError, 'sshd crashed'):
+                SshHarnessSkip.setUpClass()
+
+        teardown.assert_called_once_with()
+
+    def test_setupclass_failure_reports_original_error(self):
+        with patch.object(SshHarnessSkip, '_start_sshd',
+                          side_effect=RuntimeError('sshd crashed')), \
+                patch.object(SshHarnessSkip, 'tearDownClass',
+                             side_effect=OSError('cleanup failed')), \
+                patch('ssh_harness.logger') as mock_logger:
+            with self.assertRaisesRegexp(RuntimeError, 'sshd crashed'):
+                SshHarnessSkip.setUpClass()
+
+        mock_logger.exception.assert_called_once()
+
+    def test_setupclass_skip_cleans_up_once(self):
+        SshHarnessSkip._errors['fictional_func1()'] = 'Some message'
+        with patch.object(SshHarnessSkip, 'tearDownClass') as teardown:
+            with self.assertRaises(SkipTest):
+                SshHarnessSkip.setUpClass()
+
+        teardown.assert_called_once_with()
+
+
 # -----------------------------------------------------------------------------
 
 
@@ -796,4 +842,357 @@ class DebugTestCase(TestCase):
 
         self.assertEqual(logger_mock.debug.call_count, 1)
 
+
+# -----------------------------------------------------------------------------
+
+
+class SshHarnessAgent(SshHarness):
+
+    _FILES = {'USER_RSA_KEY': 'id_rsa', }
+    SSH_BASEDIR = os.path.join(TEMP_PATH, 'ssh-agent')
+    USE_SSH_AGENT = True
+    _BITS = dict(SshHarness._BITS, rsa='2048')
+
+
+class SshHarnessAgentTestCase(TestCase):
+
+    def setUp(self):
+        if not os.path.isfile(SshHarnessAgent.SSH_AGENT_BIN):
+            self.skipTest('ssh-agent is not installed')
+        os.makedirs(SshHarnessAgent.SSH_BASEDIR)
+        self.addCleanup(self._cleanup)
+        SshHarnessAgent._gather_config()
+        SshHarnessAgent._generate_keys()
+
+    def _cleanup(self):
+        SshHarnessAgent._kill_ssh_agent()
+        for name in os.listdir(SshHarnessAgent.SSH_BASEDIR):
+            os.unlink(os.path.join(SshHarnessAgent.SSH_BASEDIR, name))
+        os.rmdir(SshHarnessAgent.SSH_BASEDIR)
+
+    def test_ssh_agent_holds_user_key(self):
+        SshHarnessAgent._start_ssh_agent()
+        sock = SshHarnessAgent._SSH_AGENT_SOCKET
+
+        self.assertEqual(SshHarnessAgent._child_env()['SSH_AUTH_SOCK'], sock)
+        retval, out, err = SshHarnessAgent.runCommand(
+            [SshHarnessAgent.SSH_ADD_BIN, '-l'])
+        self.assertEqual(retval, 0)
+        self.assertIn('DO NOT DISSEMINATE', out)
+
+        SshHarnessAgent._kill_ssh_agent()
+        self.assertFalse(os.path.exists(sock))
+        self.assertIsNone(SshHarnessAgent._SSH_AGENT)
+        self.assertIsNone(SshHarnessAgent._child_env())
+
+    def test_ssh_agent_disabled(self):
+        with patch.object(SshHarnessAgent, 'USE_SSH_AGENT', False):
+            SshHarnessAgent._start_ssh_agent()
+
+        self.assertIsNone(SshHarnessAgent._SSH_AGENT)
+
+    def test_ssh_add_failure(self):
+        with patch.object(SshHarnessAgent, 'SSH_ADD_BIN', '/bin/false'):
+            with self.assertRaises(RuntimeError):
+                SshHarnessAgent._start_ssh_agent()
+
+        self.assertIsNone(SshHarnessAgent._SSH_AGENT)
+        self.assertFalse(os.path.exists(
+            os.path.join(SshHarnessAgent.SSH_BASEDIR, 'agent.sock')))
+
+
+# -----------------------------------------------------------------------------
+
+
+class SshHarnessCertificates(SshHarness):
+
+    _FILES = {
+        'HOST_ECDSA_KEY': 'host_ssh_ecdsa_key',
+        'USER_RSA_KEY': 'id_rsa',
+        'CA_ECDSA_KEY': 'ca_ecdsa_key',
+        }
+    SSH_BASEDIR = os.path.join(TEMP_PATH, 'certificates')
+    USE_CERTIFICATES = True
+    _BITS = dict(SshHarness._BITS, rsa='2048')
+    _KNOWN_HOSTS_PATH = os.path.join(SSH_BASEDIR, 'known_hosts')
+    _context_name = 'ssh_harness_certificates'
+
+
+class SshHarnessCertificatesTestCase(TestCase):
+
+    def setUp(self):
+        os.makedirs(SshHarnessCertificates.SSH_BASEDIR)
+        self.addCleanup(self._cleanup)
+        self.args = SshHarnessCertificates._gather_config()
+        SshHarnessCertificates._generate_keys()
+
+    def _cleanup(self):
+        BackupEditAndRestore.clear_context(
+            SshHarnessCertificates._context_name)
+        for name in os.listdir(SshHarnessCertificates.SSH_BASEDIR):
+            os.unlink(os.path.join(SshHarnessCertificates.SSH_BASEDIR, name))
+        os.rmdir(SshHarnessCertificates.SSH_BASEDIR)
+
+    def _certificate(self, path):
+        retval, out, err = SshHarnessCertificates.runCommand(
+            [SshHarnessCertificates.SSH_KEYGEN_BIN, '-L', '-f', path])
+        self.assertEqual(retval, 0)
+        return out
+
+    def test_certificates_config(self):
+        config = self.args['certificates_config']
+
+        self.assertIn('HostCertificate {}-cert.pub\n'.format(
+            SshHarnessCertificates.HOST_ECDSA_KEY_PATH), config)
+        self.assertIn('TrustedUserCAKeys {}.pub\n'.format(
+            SshHarnessCertificates.CA_ECDSA_KEY_PATH), config)
+
+    def test_generate_certificates(self):
+        SshHarnessCertificates._generate_certificates()
+
+        host = self._certificate('{}-cert.pub'.format(
+            SshHarnessCertificates.HOST_ECDSA_KEY_PATH))
+        self.assertIn('host certificate', host)
+        self.assertIn(SshHarnessCertificates.BIND_ADDRESS, host)
+        user = self._certificate('{}-cert.pub'.format(
+            SshHarnessCertificates.USER_RSA_KEY_PATH))
+        self.assertIn('user certificate', user)
+
+    def test_sign_user_key(self):
+        key = os.path.join(SshHarnessCertificates.SSH_BASEDIR, 'other')
+        SshHarnessCertificates.runCommand([
+            SshHarnessCertificates.SSH_KEYGEN_BIN, '-t', 'ecdsa', '-N', '',
+            '-f', key])
+
+        cert = SshHarnessCertificates.signUserKey(
+            '{}.pub'.format(key), principals=['alice'], options=['no-pty'])
+
+        self.assertEqual(cert, '{}-cert.pub'.format(key))
+        content = self._certificate(cert)
+        self.assertIn('alice', content)
+        self.assertNotIn('permit-pty', content)
+
+    def test_sign_user_key_requires_certificates(self):
+        with self.assertRaises(RuntimeError):
+            SshHarness.signUserKey('/path/to/key.pub')
+
+    def test_known_hosts_trusts_ca(self):
+        SshHarnessCertificates._update_user_known_hosts()
+
+        with open(SshHarnessCertificates._KNOWN_HOSTS_PATH, 'r') as f:
+            content = f.read()
+        with open('{}.pub'.format(
+                SshHarnessCertificates.CA_ECDSA_KEY_PATH), 'r') as f:
+            ca_key = f.read().strip()
+        self.assertEqual(content, '@cert-authority [{}]:{} {}\n'.format(
+            SshHarnessCertificates.BIND_ADDRESS, SshHarnessCertificates.PORT,
+            ca_key))
+
+
+class SshHarnessLoadConfigTestCase(TestCase):
+
+    def test_defaults(self):
+        config = SshHarness._load_config()
+
+        self.assertEqual(config, {'login_grace_time': 120,
+                                  'load_config': ''})
+
+    def test_load_profile(self):
+        class Harness(SshHarness):
+            LOAD_PROFILE = 50
+            MAX_SESSIONS = 3
+            LOGIN_GRACE_TIME = 30
+
+        config = Harness._load_config()
+
+        self.assertEqual(config['login_grace_time'], 30)
+        self.assertEqual(config['load_config'],
+                         'ClientAliveCountMax 4\n'
+                         'ClientAliveInterval 15\n'
+                         'MaxSessions 3\n'
+                         'MaxStartups 100:30:200\n')
+
+    def test_load_profile_leaves_max_sessions(self):
+        class Harness(SshHarness):
+            LOAD_PROFILE = 50
+
+        self.assertNotIn('MaxSessions', Harness._load_config()['load_config'])
+
+    def test_single_setting(self):
+        class Harness(SshHarness):
+            MAX_STARTUPS = '50:30:100'
+
+        self.assertEqual(Harness._load_config()['load_config'],
+                         'MaxStartups 50:30:100\n')
+
+    def test_sshd_config_template(self):
+        class Harness(SshHarness):
+            LOAD_PROFILE = 10
+
+        args = dict(Harness._gather_config())
+        config = Harness._SSHD_CONFIG.format(**args)
+
+        self.assertIn('LoginGraceTime 120\n', config)
+        self.assertIn('MaxStartups 20:30:40\nPermitRootLogin', config)
+
+
+class SshHarnessFast(SshHarness):
+
+    _BITS = dict(SshHarness._BITS, rsa='2048')
+    SSH_BASEDIR = os.path.join(TEMP_PATH, 'fast')
+    SSHD_PROFILE = 'fast'
+
+
+class SshHarnessProfileTestCase(TestCase):
+
+    def test_no_profile(self):
+        args = SshHarness._profile_config()
+
+        self.assertEqual(args, {'log_level': 'VERBOSE',
+                                'x11_forwarding': 'yes',
+                                'tcp_keep_alive': 'yes',
+                                'profile_config': '', })
+        self.assertEqual(SshHarness._profile_client_options(), [])
+        self.assertEqual(SshHarness._keyscan_types(), 'dsa,rsa,ecdsa')
+
+    def test_unknown_profile(self):
+        class Harness(SshHarness):
+            SSHD_PROFILE = 'turbo'
+
+        with self.assertRaises(ValueError):
+            Harness._profile_config()
+
+    def test_fast_profile(self):
+        args = SshHarnessFast._gather_config()
+        config = SshHarnessFast._SSHD_CONFIG.format(**args)
+        key_path = os.path.join(SshHarnessFast.SSH_BASEDIR,
+                                'host_ssh_ed25519_key')
+
+        self.assertEqual(SshHarnessFast.HOST_ED25519_KEY_PATH, key_path)
+        self.assertIn('HostKey {}\nKexAlgorithms curve25519-sha256,'
+                      .format(key_path), config)
+        self.assertIn('HostKeyAlgorithms ssh-ed25519\n', config)
+        self.assertIn('Ciphers chacha20-poly1305@openssh.com,', config)
+        self.assertIn('LogLevel ERROR\n', config)
+        self.assertIn('X11Forwarding no\n', config)
+        self.assertIn('TCPKeepAlive no\n', config)
+        self.assertEqual(SshHarnessFast._keyscan_types(),
+                         'dsa,rsa,ecdsa,ed25519')
+        self.assertNotIn('HOST_ED25519_KEY', SshHarnessFast._FILES)
+        self.assertIn('HOST_ED25519_KEY', SshHarnessFast._files())
+        self.assertNotIn('HOST_ED25519_KEY', SshHarness._files())
+
+    def test_fast_profile_certificates(self):
+        class Harness(SshHarnessFast):
+            USE_CERTIFICATES = True
+
+        config = Harness._SSHD_CONFIG.format(**Harness._gather_config())
+
+        self.assertIn('HostCertificate {}-cert.pub\n'.format(
+            Harness.HOST_ED25519_KEY_PATH), config)
+        self.assertIn('HostKeyAlgorithms ssh-ed25519-cert-v01@openssh.com,'
+                      'ssh-ed25519\n', config)
+        self.assertIn('HostKeyAlgorithms=ssh-ed25519-cert-v01@openssh.com,'
+                      'ssh-ed25519', Harness._profile_client_options())
+
+    def test_sftp_subsystem(self):
+        class Harness(SshHarness):
+            SFTP_SUBSYSTEM = 'internal-sftp'
+
+        config = Harness._SSHD_CONFIG.format(**Harness._gather_config())
+        default = SshHarness._SSHD_CONFIG.format(
+            **SshHarness._gather_config())
+
+        self.assertIn('\nSubsystem sftp internal-sftp\n', config)
+        self.assertNotIn('Subsystem', default)
+
+    def test_fast_profile_client(self):
+        SshHarnessFast._gather_config()
+
+        cmd = SshHarnessFast._ssh_client_command('true')
+
+        self.assertIn('HostKeyAlgorithms=ssh-ed25519', cmd)
+        self.assertEqual(cmd[-2:], [SshHarnessFast.BIND_ADDRESS, 'true'])
+
+    def test_fast_profile_keys(self):
+        os.makedirs(SshHarnessFast.SSH_BASEDIR)
+        self.addCleanup(shutil.rmtree, SshHarnessFast.SSH_BASEDIR)
+        SshHarnessFast._gather_config()
+
+        SshHarnessFast._generate_keys()
+
+        with open('{}.pub'.format(SshHarnessFast.HOST_ED25519_KEY_PATH)) as f:
+            self.assertTrue(f.read().startswith('ssh-ed25519 '))
+
+
+class SshHarnessIdentities(SshHarness):
+
+    _BITS = dict(SshHarness._BITS, rsa='2048')
+    SSH_BASEDIR = os.path.join(TEMP_PATH, 'identities')
+
+
+class SshHarnessIdentitiesTestCase(TestCase):
+
+    def setUp(self):
+        os.makedirs(SshHarnessIdentities.SSH_BASEDIR)
+        self.addCleanup(self._cleanup)
+        SshHarnessIdentities._gather_config()
+        with open(SshHarnessIdentities.AUTHORIZED_KEYS_PATH, 'w') as f:
+            f.write('ssh-rsa AAAA user-key\n')
+
+    def _cleanup(self):
+        SshHarnessIdentities._delete_identities()
+        SshHarnessIdentities._key_index = None
+        BackupEditAndRestore.clear_context(
+            SshHarnessIdentities._context_name)
+        for name in os.listdir(SshHarnessIdentities.SSH_BASEDIR):
+            os.unlink(os.path.join(SshHarnessIdentities.SSH_BASEDIR, name))
+        os.rmdir(SshHarnessIdentities.SSH_BASEDIR)
+
+    def _public_key(self, path):
+        with open('{}.pub'.format(path), 'r') as f:
+            return f.read().strip()
+
+    def test_provision_identities(self):
+        paths = SshHarnessIdentities.provisionIdentities(
+            3, options=lambda n: 'no-pty' if n % 2 else None)
+
+        self.assertEqual([os.path.basename(x) for x in paths],
+                         ['id_0', 'id_1', 'id_2'])
+        with open(SshHarnessIdentities.AUTHORIZED_KEYS_PATH, 'r') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines, [
+            'ssh-rsa AAAA user-key',
+            self._public_key(paths[0]),
+            'no-pty {}'.format(self._public_key(paths[1])),
+            self._public_key(paths[2]),
+            ])
+
+    def test_numbering_goes_on(self):
+        SshHarnessIdentities.provisionIdentities(2)
+        paths = SshHarnessIdentities.provisionIdentities(1, options='no-pty')
+
+        self.assertEqual(os.path.basename(paths[0]), 'id_2')
+
+    def test_key_index(self):
+        SshHarnessIdentities._key_index = KeyIndex()
+
+        paths = SshHarnessIdentities.provisionIdentities(2, options='no-pty')
+
+        self.assertEqual(len(SshHarnessIdentities._key_index), 2)
+        self.assertEqual(
+            SshHarnessIdentities._key_index.lookup(
+                pwd.getpwuid(os.getuid()).pw_name,
+                fingerprint(self._public_key(paths[1]))),
+            ['no-pty {}'.format(self._public_key(paths[1]))])
+        with open(SshHarnessIdentities.AUTHORIZED_KEYS_PATH, 'r') as f:
+            self.assertEqual(f.read(), 'ssh-rsa AAAA user-key\n')
+
+    def test_identities_are_deleted(self):
+        paths = SshHarnessIdentities.provisionIdentities(1)
+
+        SshHarnessIdentities._delete_identities()
+
+        self.assertFalse(os.path.exists(paths[0]))
+
 # vim: syntax=python:sws=4:sw=4:et:
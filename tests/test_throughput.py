@@ -0,0 +1,127 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014-2015, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+from __future__ import unicode_literals
+import os
+import shutil
+import zlib
+from unittest import TestCase
+
+from ssh_harness import PubKeyAuthSshClientTestCase
+from ssh_harness.benchmarks import throughput
+
+MODULE_PATH = os.path.abspath(os.path.dirname(__file__))
+TEMP_PATH = os.path.join(MODULE_PATH, 'tmp', 'throughput')
+
+
+class LocalHarness(PubKeyAuthSshClientTestCase):
+    """Runs the "remote" commands with a local shell."""
+
+    USER_RSA_KEY_PATH = '/path/to/id_rsa'
+
+    @classmethod
+    def _ssh_client_command(cls, remote=None, options=None):
+        return ['sh', '-c', remote]
+
+
+def _row(mb_per_s=100.0, cpu=2.0, **kwargs):
+    row = {'method': 'cat', 'cipher': 'aes128-ctr', 'compression': 'no',
+           'size': 1000, 'mb_per_s': mb_per_s, 'cpu_ns_per_byte': cpu, }
+    row.update(kwargs)
+    return row
+
+
+class ThroughputBenchmarkTestCase(TestCase):
+
+    def setUp(self):
+        os.makedirs(TEMP_PATH)
+        self.addCleanup(shutil.rmtree, TEMP_PATH)
+        self.payload = os.path.join(TEMP_PATH, 'payload')
+
+    def test_write_payload(self):
+        throughput._write_payload(self.payload, 2500000)
+        with open(self.payload, 'rb') as f:
+            random = f.read()
+        throughput._write_payload(self.payload, 2500000, compressible=True)
+        with open(self.payload, 'rb') as f:
+            text = f.read()
+
+        self.assertEqual(len(random), 2500000)
+        self.assertEqual(len(text), 2500000)
+        self.assertLess(len(zlib.compress(text)), len(text) // 100)
+        self.assertGreater(len(zlib.compress(random)), len(random) // 2)
+
+    def test_commands(self):
+        cmd, input = throughput._command(LocalHarness, 'scp', self.payload,
+                                         ['-o', 'Compression=yes'])
+
+        self.assertEqual(cmd[:3], [LocalHarness.SCP_BIN, '-P',
+                                   str(LocalHarness.PORT)])
+        self.assertIn('Compression=yes', cmd)
+        self.assertEqual(cmd[-2:], [
+            self.payload, '{}:/dev/null'.format(LocalHarness.BIND_ADDRESS)])
+        self.assertIsNone(input)
+
+        cmd, input = throughput._command(LocalHarness, 'sftp', self.payload,
+                                         [])
+
+        self.assertEqual(cmd[0], LocalHarness.SFTP_BIN)
+        self.assertEqual(cmd[-3:], ['-b', '-', LocalHarness.BIND_ADDRESS])
+        self.assertEqual(input, 'put {} /dev/null\n'.format(self.payload))
+
+        with self.assertRaises(ValueError):
+            throughput._command(LocalHarness, 'rsync', self.payload, [])
+
+    def test_measure(self):
+        throughput._write_payload(self.payload, 1000000)
+
+        row = throughput.measure(LocalHarness, self.payload, 1000000, 'cat',
+                                 'aes128-ctr', 'no', repeat=2)
+
+        self.assertNotIn('error', row)
+        self.assertGreater(row['mb_per_s'], 0)
+        self.assertIsNotNone(row['cpu_ns_per_byte'])
+
+    def test_measure_failure(self):
+        row = throughput.measure(LocalHarness, '/does/not/exist', 1000,
+                                 'cat', 'aes128-ctr', 'no')
+
+        self.assertIn('error', row)
+        self.assertNotIn('mb_per_s', row)
+
+    def test_compare(self):
+        baseline = throughput.to_baseline([
+            _row(),
+            _row(cipher='aes128-gcm@openssh.com'),
+            _row(compression='yes', error='Bad cipher'),
+            ])
+
+        self.assertEqual(len(baseline), 2)
+        self.assertEqual(throughput.compare([_row(95.0, 2.1)], baseline), [])
+        regressions = throughput.compare([
+            _row(80.0, 2.5),
+            _row(cipher='aes128-gcm@openssh.com', error='Bad cipher'),
+            _row(10.0, cipher='3des-cbc'),
+            ], baseline)
+        self.assertEqual(len(regressions), 3)
+        self.assertIn('80.0 MB/s, down from 100.0 MB/s', regressions[0])
+        self.assertIn('2.50 ns of CPU per byte', regressions[1])
+        self.assertIn('failed (Bad cipher)', regressions[2])
+
+
+# vim: syntax=python:sws=4:sw=4:et:
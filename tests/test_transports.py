@@ -0,0 +1,296 @@
+# -*- coding: utf-8-unix; -*-
+#
+#  Copyright © 2014-2015, Nicolas CANIART <nicolas@caniart.net>
+#
+#  This file is part of ssh-harness.
+#
+#  ssh-harness is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  ssh-harness is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with ssh-harness.  If not, see <http://www.gnu.org/licenses/>.
+#
+from __future__ import unicode_literals
+import os
+import shutil
+import threading
+from unittest import TestCase, skipIf
+try:
+    from unittest.mock import patch, Mock
+except ImportError:
+    from mock import patch, Mock
+
+from ssh_harness import PubKeyAuthSshClientTestCase
+from ssh_harness.commands import CommandTimeoutError
+from ssh_harness.transports import (
+    HAVE_PARAMIKO, SessionProbe, TransportPool, _load_public_keys, )
+
+MODULE_PATH = os.path.abspath(os.path.dirname(__file__))
+TEMP_PATH = os.path.join(MODULE_PATH, 'tmp', 'transports')
+
+
+class FakeKey(object):
+
+    def __init__(self, name, b64):
+        self._name = name
+        self._b64 = b64
+
+    def get_name(self):
+        return self._name
+
+    def get_base64(self):
+        return self._b64
+
+
+class FakeChannel(object):
+    """Replays the output it is given, then exits with `status` (unless
+    `status` is `None`, then it never exits)."""
+
+    def __init__(self, out=(), err=(), status=0):
+        self.out = list(out)
+        self.err = list(err)
+        self.status = status
+        self.sent = b''
+        self.command = None
+        self.closed = False
+
+    def exec_command(self, cmd):
+        self.command = cmd
+
+    def send_ready(self):
+        return True
+
+    def send(self, data):
+        self.sent += data
+        return len(data)
+
+    def shutdown_write(self):
+        pass
+
+    def recv_ready(self):
+        return bool(self.out)
+
+    def recv(self, size):
+        return self.out.pop(0)
+
+    def recv_stderr_ready(self):
+        return bool(self.err)
+
+    def recv_stderr(self, size):
+        return self.err.pop(0)
+
+    def exit_status_ready(self):
+        return self.status is not None
+
+    def recv_exit_status(self):
+        return self.status
+
+    def close(self):
+        self.closed = True
+
+
+class WindowedChannel(FakeChannel):
+    """Only accepts input once its output was read, 4 bytes at a time."""
+
+    def send_ready(self):
+        return not self.out
+
+    def send(self, data):
+        return super(WindowedChannel, self).send(data[:4])
+
+
+class TransportPoolTestCase(TestCase):
+
+    def setUp(self):
+        if not os.path.isdir(TEMP_PATH):
+            os.makedirs(TEMP_PATH)
+        self.addCleanup(shutil.rmtree, TEMP_PATH)
+        self.pub = os.path.join(TEMP_PATH, 'host_key.pub')
+        with open(self.pub, 'w') as f:
+            f.write('# comment\nssh-rsa AAAAkey host@example\n\n')
+
+        patcher = patch('ssh_harness.transports.paramiko')
+        self.paramiko = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('ssh_harness.transports.socket')
+        self.socket = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('ssh_harness.transports.select')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.paramiko.SSHException = RuntimeError
+        self.transport = self.paramiko.Transport.return_value
+        self.transport.get_remote_server_key.return_value = \
+            FakeKey('ssh-rsa', 'AAAAkey')
+
+    def _pool(self, size=2):
+        return TransportPool('localhost', 2200, 'user', '/path/to/id_rsa',
+                             [self.pub], size=size, encoding='utf-8')
+
+    def test_load_public_keys(self):
+        self.assertEqual(_load_public_keys([self.pub]),
+                         set([('ssh-rsa', 'AAAAkey')]))
+
+    def test_run(self):
+        channel = FakeChannel(out=[b'hel', b'lo\n'], err=[b'oops'], status=3)
+        self.transport.open_session.return_value = channel
+
+        result = self._pool().run('echo hello', input='data')
+
+        self.assertEqual(result, (3, 'hello\n', 'oops'))
+        self.assertIsNotNone(result.first_byte_time)
+        self.assertEqual(channel.command, 'echo hello')
+        self.assertEqual(channel.sent, b'data')
+        self.assertTrue(channel.closed)
+        self.transport.auth_publickey.assert_called_once_with(
+            'user', self.paramiko.RSAKey.from_private_key_file.return_value)
+
+    def test_run_output_before_input(self):
+        channel = WindowedChannel(out=[b'x' * 10] * 3, status=0)
+        self.transport.open_session.return_value = channel
+
+        result = self._pool().run('cat', input='0123456789', timeout=5)
+
+        self.assertEqual(result, (0, 'x' * 30, ''))
+        self.assertEqual(channel.sent, b'0123456789')
+
+    def test_run_timeout(self):
+        channel = FakeChannel(out=[b'partial'], status=None)
+        self.transport.open_session.return_value = channel
+
+        with self.assertRaises(CommandTimeoutError) as cm:
+            self._pool().run('sleep 10', timeout=0.1)
+
+        self.assertEqual(cm.exception.out, 'partial')
+        self.assertTrue(channel.closed)
+
+    def test_unknown_host_key(self):
+        self.transport.get_remote_server_key.return_value = \
+            FakeKey('ssh-rsa', 'AAAAother')
+
+        with self.assertRaises(RuntimeError):
+            self._pool().transport()
+        self.transport.close.assert_called_once_with()
+        self.assertFalse(self.transport.auth_publickey.called)
+
+    def test_transports_are_reused(self):
+        transports = [Mock(), Mock()]
+        self.paramiko.Transport.side_effect = transports
+        for t in transports:
+            t.get_remote_server_key.return_value = FakeKey('ssh-rsa',
+                                                           'AAAAkey')
+        pool = self._pool(size=2)
+
+        used = [pool.transport() for i in range(0, 4)]
+
+        self.assertEqual(self.paramiko.Transport.call_count, 2)
+        self.assertEqual(set(used), set(transports))
+
+        transports[0].is_active.return_value = False
+        self.paramiko.Transport.side_effect = None
+        pool.transport()
+        self.assertEqual(self.paramiko.Transport.call_count, 3)
+
+        pool.close()
+        transports[1].close.assert_called_once_with()
+
+    def test_connect_outside_the_lock(self):
+        connecting = threading.Event()
+        resume = threading.Event()
+        slow, fast = Mock(), Mock()
+        for t in (slow, fast, ):
+            t.get_remote_server_key.return_value = FakeKey('ssh-rsa',
+                                                           'AAAAkey')
+        slow.start_client.side_effect = \
+            lambda *args, **kwargs: connecting.set() or resume.wait(5)
+        self.paramiko.Transport.side_effect = [slow, fast]
+        pool = self._pool(size=2)
+        used = []
+        thread = threading.Thread(target=lambda: used.append(pool.transport()))
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(resume.set)
+        connecting.wait(5)
+
+        self.assertIs(pool.transport(), fast)
+
+        resume.set()
+        thread.join()
+        self.assertEqual(used, [slow])
+
+    def test_session_probe(self):
+        self.transport.open_session.return_value = FakeChannel(status=0)
+        probe = SessionProbe('localhost', 2200, 'user', '/path/to/id_rsa',
+                             [self.pub], 'true')
+
+        phases = probe()
+
+        self.assertEqual(sorted(phases), ['auth', 'command', 'connect'])
+        self.transport.close.assert_called_once_with()
+
+    def test_session_probe_timeout(self):
+        self.transport.open_session.return_value = FakeChannel(status=0)
+        probe = SessionProbe('localhost', 2200, 'user', '/path/to/id_rsa',
+                             [self.pub], 'true', timeout=3)
+
+        probe()
+
+        self.socket.create_connection.assert_called_once_with(
+            ('localhost', 2200, ), 3)
+        self.transport.start_client.assert_called_once_with(timeout=3)
+        self.assertEqual(self.transport.auth_timeout, 3)
+        self.assertNotIsInstance(probe, TransportPool)
+
+    def test_session_probe_failure(self):
+        self.transport.open_session.return_value = FakeChannel(status=1)
+        probe = SessionProbe('localhost', 2200, 'user', '/path/to/id_rsa',
+                             [self.pub], 'false')
+
+        with self.assertRaises(RuntimeError):
+            probe()
+        self.transport.close.assert_called_once_with()
+
+
+@skipIf(HAVE_PARAMIKO, 'paramiko is installed')
+class TransportPoolWithoutParamikoTestCase(TestCase):
+
+    def test_requires_paramiko(self):
+        with self.assertRaises(RuntimeError):
+            TransportPool('localhost', 2200, 'user', 'key', [])
+
+
+class RemoteBackendTestCase(TestCase):
+
+    def test_ssh_backend(self):
+        class Harness(PubKeyAuthSshClientTestCase):
+
+            @classmethod
+            def _ssh_client_command(cls, remote=None, options=None):
+                return ['sh', '-c', remote]
+
+        result = Harness.runRemoteCommand(['printf', '%s', 'a b'])
+
+        self.assertEqual(result, (0, 'a b', ''))
+
+    def test_paramiko_backend(self):
+        class Harness(PubKeyAuthSshClientTestCase):
+            REMOTE_BACKEND = 'paramiko'
+
+        pool = Mock()
+        pool.run.return_value = (0, 'out', '')
+        with patch.object(Harness, '_remote_pool', return_value=pool):
+            results = Harness.runRemoteCommands(['true', ['echo', 'a b']])
+
+        self.assertEqual(results, [(0, 'out', '')] * 2)
+        self.assertEqual([c[0][0] for c in pool.run.call_args_list],
+                         ['true', "echo 'a b'"])
+
+
+# vim: syntax=python:sws=4:sw=4:et: